@@ -0,0 +1,36 @@
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+
+from app.api.serialization import FORWARDED_HEADERS
+from app.services.response_cache import response_cache
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+async def cached_json(request: Request, namespace: str, build: Callable[[], Awaitable[Response]]) -> Response:
+    """
+    Serve a JSON response from the response cache, calling ``build`` on a
+    miss. A matching ``If-None-Match`` gets a 304; on a hit that costs no
+    query and no serialization. Errors raised by ``build`` are not cached.
+    """
+    key = request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+    versioned, entry = response_cache.lookup(namespace, key)
+    if entry is None:
+        response = await build()
+        headers = {name: value for name, value in response.headers.items() if name in FORWARDED_HEADERS}
+        entry = response_cache.store(versioned, response.body, headers)
+
+    # Browsers revalidate every time, which is a cheap 304 while nothing changed
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        response_cache.count(namespace, "not_modified")
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
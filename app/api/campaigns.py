@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from app.api.pagination import paginate_async
+from app.database.database import get_async_db
+from app.models.models import Campaign as CampaignModel, CampaignTask as CampaignTaskModel
+from app.schemas.schemas import CampaignCreate, CampaignProgress, CampaignTask
+from app.services.campaigns import campaign_progress, create_campaign, set_campaign_status
+
+router = APIRouter()
+
+async def _get_campaign(db: AsyncSession, campaign_id: int) -> CampaignModel:
+    campaign = await db.get(CampaignModel, campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return campaign
+
+@router.post("/campaigns/", response_model=CampaignProgress, status_code=201)
+async def create_campaign_endpoint(request: CampaignCreate, db: AsyncSession = Depends(get_async_db)):
+    """Queue generation for a campaign; run ``python -m app.services.campaigns`` to process it"""
+    if request.prospect_ids is None and request.company_id is None and request.status is None:
+        raise HTTPException(status_code=400, detail="Give prospect_ids or at least one prospect filter")
+    try:
+        campaign = await db.run_sync(
+            create_campaign,
+            name=request.name,
+            template_id=request.template_id,
+            prospect_ids=request.prospect_ids,
+            company_id=request.company_id,
+            status=request.status,
+            max_concurrency=request.max_concurrency,
+            max_attempts=request.max_attempts,
+            additional_context=request.additional_context
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return (await db.run_sync(campaign_progress, [campaign]))[0]
+
+@router.get("/campaigns/", response_model=List[CampaignProgress])
+async def get_campaigns(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    campaigns = await paginate_async(db, select(CampaignModel), CampaignModel, response, cursor, limit)
+    return await db.run_sync(campaign_progress, campaigns)
+
+@router.get("/campaigns/{campaign_id}", response_model=CampaignProgress)
+async def get_campaign(campaign_id: int, db: AsyncSession = Depends(get_async_db)):
+    return (await db.run_sync(campaign_progress, [await _get_campaign(db, campaign_id)]))[0]
+
+async def _set_status(db: AsyncSession, campaign: CampaignModel, status: str, **kwargs) -> dict:
+    campaign = await db.run_sync(set_campaign_status, campaign, status, **kwargs)
+    return (await db.run_sync(campaign_progress, [campaign]))[0]
+
+@router.post("/campaigns/{campaign_id}/pause", response_model=CampaignProgress)
+async def pause_campaign(campaign_id: int, db: AsyncSession = Depends(get_async_db)):
+    campaign = await _get_campaign(db, campaign_id)
+    if campaign.status != "running":
+        raise HTTPException(status_code=409, detail=f"Campaign is {campaign.status}")
+    return await _set_status(db, campaign, "paused")
+
+@router.post("/campaigns/{campaign_id}/resume", response_model=CampaignProgress)
+async def resume_campaign(campaign_id: int, retry_failed: bool = False, db: AsyncSession = Depends(get_async_db)):
+    """Resume a paused or finished campaign, optionally requeueing its failed tasks"""
+    campaign = await _get_campaign(db, campaign_id)
+    if campaign.status == "cancelled":
+        raise HTTPException(status_code=409, detail="Campaign is cancelled")
+    return await _set_status(db, campaign, "running", retry_failed=retry_failed)
+
+@router.post("/campaigns/{campaign_id}/cancel", response_model=CampaignProgress)
+async def cancel_campaign(campaign_id: int, db: AsyncSession = Depends(get_async_db)):
+    campaign = await _get_campaign(db, campaign_id)
+    return await _set_status(db, campaign, "cancelled")
+
+@router.get("/campaigns/{campaign_id}/tasks", response_model=List[CampaignTask])
+async def get_campaign_tasks(
+    campaign_id: int,
+    response: Response,
+    status: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    await _get_campaign(db, campaign_id)
+    statement = select(CampaignTaskModel).where(CampaignTaskModel.campaign_id == campaign_id)
+    if status:
+        statement = statement.where(CampaignTaskModel.status == status)
+    return await paginate_async(db, statement, CampaignTaskModel, response, cursor, limit)
@@ -1,235 +1,420 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
-import pandas as pd
-import io
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Literal, Optional
+import csv
+import json
+import shutil
+import tempfile
 from datetime import datetime, timedelta
 
-from app.database.database import get_db
-from app.models.models import Company, Prospect, EmailTemplate, EmailEngagement
+from app.api.caching import cached_json
+from app.api.pagination import NEXT_CURSOR_HEADER, decode_offset_cursor, encode_offset_cursor, paginate_async
+from app.api.serialization import FastJSONResponse, csv_chunks, ndjson_chunks, rows_response, select_columns
+from app.database.database import SessionLocal, get_async_db
+from app.models.models import (
+    Company as CompanyModel,
+    Prospect as ProspectModel,
+    EmailTemplate as EmailTemplateModel,
+    EmailEngagement as EmailEngagementModel
+)
 from app.schemas.schemas import (
     Company, CompanyCreate,
     Prospect, ProspectCreate,
     EmailTemplate, EmailTemplateCreate,
     EmailEngagement, EmailEngagementCreate,
-    EngagementMetrics, ProspectEngagement
+    EngagementMetrics, ProspectEngagement, ProspectEngagementSummary,
+    ImportJobStatus, RankedProspect, TemplateVariants
+)
+from app.services.analytics import engagement_metrics, prospect_engagement_summaries
+from app.services.csv_import import (
+    CSVStream, ImportBatchError, ProspectImportService, REQUIRED_COLUMNS, READ_CHUNK_SIZE,
+    create_import_job, get_import_job, run_import_job
 )
+from app.services.email_service import EmailPersonalizationService, get_email_service
+from app.services.llm_cache import llm_cache
+from app.services.response_cache import response_cache
+from app.services.rollups import RollupDeltas
+from app.services.scoring import top_prospects
 
 router = APIRouter()
 
 # Company endpoints
 @router.post("/companies/", response_model=Company)
-def create_company(company: CompanyCreate, db: Session = Depends(get_db)):
-    db_company = Company(**company.dict())
+async def create_company(company: CompanyCreate, db: AsyncSession = Depends(get_async_db)):
+    db_company = CompanyModel(**company.dict())
     db.add(db_company)
-    db.commit()
-    db.refresh(db_company)
+    await db.commit()
+    await db.refresh(db_company)
     return db_company
 
 @router.get("/companies/", response_model=List[Company])
-def get_companies(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    companies = db.query(Company).offset(skip).limit(limit).all()
-    return companies
+async def get_companies(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    async def build():
+        statement = select(*select_columns(CompanyModel, Company, fields))
+        return rows_response(await paginate_async(db, statement, CompanyModel, response, cursor, limit, skip), response)
+
+    return await cached_json(request, "companies", build)
 
 @router.get("/companies/{company_id}", response_model=Company)
-def get_company(company_id: int, db: Session = Depends(get_db)):
-    company = db.query(Company).filter(Company.id == company_id).first()
-    if company is None:
-        raise HTTPException(status_code=404, detail="Company not found")
-    return company
+async def get_company(company_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    async def build():
+        company = await db.get(CompanyModel, company_id)
+        if company is None:
+            raise HTTPException(status_code=404, detail="Company not found")
+        return FastJSONResponse(Company.model_validate(company).model_dump(mode="json"))
+
+    return await cached_json(request, "companies", build)
 
 @router.put("/companies/{company_id}", response_model=Company)
-def update_company(company_id: int, company_update: CompanyCreate, db: Session = Depends(get_db)):
-    company = db.query(Company).filter(Company.id == company_id).first()
+async def update_company(company_id: int, company_update: CompanyCreate, db: AsyncSession = Depends(get_async_db)):
+    company = await db.get(CompanyModel, company_id)
     if company is None:
         raise HTTPException(status_code=404, detail="Company not found")
     
     for key, value in company_update.dict(exclude_unset=True).items():
         setattr(company, key, value)
     
-    db.commit()
-    db.refresh(company)
+    await db.commit()
+    await db.refresh(company)
     return company
 
-# CSV Upload endpoint
+# CSV Upload endpoints
 @router.post("/companies/upload-csv")
 async def upload_companies_csv(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    update_existing: bool = False
 ):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
+    # Parsing and bulk writes are CPU-bound and blocking, so the import keeps a
+    # sync session on a worker thread rather than tying up the event loop
+    def ingest():
+        with SessionLocal() as db:
+            stream = CSVStream(file.file)
+            missing = [col for col in REQUIRED_COLUMNS if col not in stream.fieldnames]
+            if missing:
+                raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+            importer = ProspectImportService(db, update_existing=update_existing)
+            return importer.ingest(stream)
+
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
-        
-        # Process each row
-        for _, row in df.iterrows():
-            # Create or get company
-            company = db.query(Company).filter(Company.name == row['company']).first()
-            if not company:
-                company = Company(
-                    name=row['company'],
-                    industry=row.get('industry'),
-                    website=row.get('website'),
-                    description=row.get('company_description')
-                )
-                db.add(company)
-                db.commit()
-                db.refresh(company)
-            
-            # Create prospect
-            prospect = Prospect(
-                name=row['name'],
-                email=row['email'],
-                position=row['title'],
-                company_id=company.id,
-                linkedin_url=row.get('linkedin')
-            )
-            db.add(prospect)
-        
-        db.commit()
-        return {"message": "CSV processed successfully"}
-        
-    except Exception as e:
+        result = await run_in_threadpool(ingest)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ImportBatchError as e:
+        # Batches before the failing one are committed; report what they wrote
+        raise HTTPException(status_code=400, detail={
+            "message": str(e), "first_row": e.first_row, "last_row": e.last_row, **e.result
+        })
+
+    return {"message": "CSV processed successfully", **result}
+
+@router.post("/companies/upload-csv/jobs", response_model=ImportJobStatus, status_code=202)
+async def upload_companies_csv_job(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    update_existing: bool = False
+):
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="File must be a CSV")
+
+    # The upload is closed once the response is sent, so spool it to a file the job owns
+    def spool():
+        with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as f:
+            shutil.copyfileobj(file.file, f, READ_CHUNK_SIZE)
+            return f.name
+
+    path = await run_in_threadpool(spool)
+    job = create_import_job(file.filename)
+    background_tasks.add_task(run_import_job, job, path, SessionLocal, update_existing)
+    return job.to_dict()
+
+@router.get("/companies/upload-csv/jobs/{job_id}", response_model=ImportJobStatus)
+async def get_upload_job(job_id: str):
+    job = get_import_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.to_dict()
 
 # Prospect endpoints
 @router.post("/prospects/", response_model=Prospect)
-def create_prospect(prospect: ProspectCreate, db: Session = Depends(get_db)):
-    db_prospect = Prospect(**prospect.dict())
+async def create_prospect(prospect: ProspectCreate, db: AsyncSession = Depends(get_async_db)):
+    db_prospect = ProspectModel(**prospect.dict())
     db.add(db_prospect)
-    db.commit()
-    db.refresh(db_prospect)
+    await db.commit()
+    await db.refresh(db_prospect)
     return db_prospect
 
 @router.get("/prospects/", response_model=List[Prospect])
-def get_prospects(
+async def get_prospects(
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
     status: Optional[str] = None,
-    db: Session = Depends(get_db)
+    company_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(Prospect)
+    statement = select(*select_columns(ProspectModel, Prospect, fields))
     if status:
-        query = query.filter(Prospect.status == status)
-    prospects = query.offset(skip).limit(limit).all()
-    return prospects
+        statement = statement.where(ProspectModel.status == status)
+    if company_id:
+        statement = statement.where(ProspectModel.company_id == company_id)
+    return rows_response(await paginate_async(db, statement, ProspectModel, response, cursor, limit, skip), response)
+
+@router.get("/prospects/top", response_model=List[RankedProspect])
+async def get_top_prospects(
+    k: int = Query(20, ge=1, le=1000),
+    company_id: Optional[int] = None,
+    status: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Highest-priority prospects from the last scoring run (python -m app.services.scoring)"""
+    return await db.run_sync(top_prospects, k, company_id=company_id, status=status)
 
 @router.get("/prospects/{prospect_id}", response_model=Prospect)
-def get_prospect(prospect_id: int, db: Session = Depends(get_db)):
-    prospect = db.query(Prospect).filter(Prospect.id == prospect_id).first()
+async def get_prospect(prospect_id: int, db: AsyncSession = Depends(get_async_db)):
+    prospect = await db.get(ProspectModel, prospect_id)
     if prospect is None:
         raise HTTPException(status_code=404, detail="Prospect not found")
     return prospect
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@router.get("/prospects/{prospect_id}/generate")
+async def generate_prospect_email(
+    prospect_id: int,
+    template_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    service: EmailPersonalizationService = Depends(get_email_service)
+):
+    """
+    Stream a personalized email over Server-Sent Events: a ``subject`` event,
+    ``body`` events with text deltas as they are generated, then ``done``
+    with the complete email (or ``error``).
+    """
+    prospect = await db.get(ProspectModel, prospect_id, options=[selectinload(ProspectModel.company)])
+    if prospect is None or prospect.company is None:
+        raise HTTPException(status_code=404, detail="Prospect not found")
+    template = await db.get(EmailTemplateModel, template_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+
+    async def events():
+        try:
+            async for event, data in service.stream_personalized_email(prospect, prospect.company, template):
+                yield _sse(event, data if event == "done" else {"text": data})
+        except Exception as e:
+            yield _sse("error", {"detail": f"Failed to generate personalized email: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Email Template endpoints
 @router.post("/templates/", response_model=EmailTemplate)
-def create_template(template: EmailTemplateCreate, db: Session = Depends(get_db)):
-    db_template = EmailTemplate(**template.dict())
+async def create_template(template: EmailTemplateCreate, db: AsyncSession = Depends(get_async_db)):
+    db_template = EmailTemplateModel(**template.dict())
     db.add(db_template)
-    db.commit()
-    db.refresh(db_template)
+    await db.commit()
+    await db.refresh(db_template)
     return db_template
 
 @router.get("/templates/", response_model=List[EmailTemplate])
-def get_templates(
+async def get_templates(
+    request: Request,
+    response: Response,
     company_id: Optional[int] = None,
     is_active: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(EmailTemplate)
-    if company_id:
-        query = query.filter(EmailTemplate.company_id == company_id)
-    if is_active is not None:
-        query = query.filter(EmailTemplate.is_active == is_active)
-    return query.all()
+    async def build():
+        statement = select(*select_columns(EmailTemplateModel, EmailTemplate, fields))
+        if company_id:
+            statement = statement.where(EmailTemplateModel.company_id == company_id)
+        if is_active is not None:
+            statement = statement.where(EmailTemplateModel.is_active == is_active)
+        return rows_response(await paginate_async(db, statement, EmailTemplateModel, response, cursor, limit), response)
+
+    return await cached_json(request, "templates", build)
+
+@router.post("/templates/{template_id}/variants", response_model=TemplateVariants)
+async def create_template_variants(
+    template_id: int,
+    num_variants: int = Query(2, ge=1, le=20),
+    fan_out: int = Query(4, ge=1, le=20),
+    use_n: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    service: EmailPersonalizationService = Depends(get_email_service)
+):
+    template = await db.get(EmailTemplateModel, template_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+
+    result = await service.create_template_variants(template, num_variants=num_variants, fan_out=fan_out, use_n=use_n)
+    return {
+        "variants": await db.run_sync(service.save_template_variants, result["variants"]),
+        "errors": result["errors"]
+    }
 
 # Email Engagement endpoints
 @router.post("/engagements/", response_model=EmailEngagement)
-def create_engagement(engagement: EmailEngagementCreate, db: Session = Depends(get_db)):
-    db_engagement = EmailEngagement(**engagement.dict())
+async def create_engagement(engagement: EmailEngagementCreate, db: AsyncSession = Depends(get_async_db)):
+    sent_at = datetime.utcnow()
+    db_engagement = EmailEngagementModel(**engagement.dict(), sent_at=sent_at)
     db.add(db_engagement)
     
     # Update prospect's last_contacted and engagement_score
-    prospect = db.query(Prospect).filter(Prospect.id == engagement.prospect_id).first()
+    prospect = await db.get(ProspectModel, engagement.prospect_id)
     if prospect:
-        prospect.last_contacted = datetime.utcnow()
+        prospect.last_contacted = sent_at
         prospect.engagement_score += engagement.engagement_score
+
+    # Keep the metrics rollups current
+    deltas = RollupDeltas()
+    deltas.add(
+        sent_at,
+        prospect.company_id if prospect else None,
+        engagement.template_id,
+        sent=1,
+        score_sum=engagement.engagement_score
+    )
+    await db.run_sync(deltas.apply)
     
-    db.commit()
-    db.refresh(db_engagement)
+    await db.commit()
+    await db.refresh(db_engagement)
     return db_engagement
 
 @router.get("/engagements/metrics/", response_model=EngagementMetrics)
-def get_engagement_metrics(
+async def get_engagement_metrics(
     company_id: Optional[int] = None,
     days: int = Query(30, ge=1, le=365),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     start_date = datetime.utcnow() - timedelta(days=days)
-    query = db.query(EmailEngagement).filter(EmailEngagement.sent_at >= start_date)
-    
-    if company_id:
-        query = query.join(Prospect).filter(Prospect.company_id == company_id)
-    
-    engagements = query.all()
-    
-    metrics = {
-        "total_sent": len(engagements),
-        "total_opened": sum(1 for e in engagements if e.opened_at),
-        "total_clicked": sum(1 for e in engagements if e.clicked_at),
-        "total_replied": sum(1 for e in engagements if e.replied_at),
-        "average_engagement_score": sum(e.engagement_score for e in engagements) / len(engagements) if engagements else 0
-    }
-    
-    # Find best performing template
-    template_performance = {}
-    for e in engagements:
-        if e.template_id not in template_performance:
-            template_performance[e.template_id] = {"opens": 0, "clicks": 0, "replies": 0}
-        if e.opened_at:
-            template_performance[e.template_id]["opens"] += 1
-        if e.clicked_at:
-            template_performance[e.template_id]["clicks"] += 1
-        if e.replied_at:
-            template_performance[e.template_id]["replies"] += 1
-    
-    best_template_id = max(
-        template_performance.items(),
-        key=lambda x: x[1]["opens"] + x[1]["clicks"] + x[1]["replies"]
-    )[0] if template_performance else None
-    
-    if best_template_id:
-        best_template = db.query(EmailTemplate).filter(EmailTemplate.id == best_template_id).first()
-        metrics["best_performing_template"] = best_template.name if best_template else None
-    
-    return metrics
+    return await db.run_sync(engagement_metrics, start_date, company_id)
+
+# Prospects per batch engagement request, and trend points per prospect
+MAX_ENGAGEMENT_BATCH = 500
+MAX_TREND_LIMIT = 500
+
+@router.get("/prospects/engagement/", response_model=List[ProspectEngagementSummary])
+async def get_prospects_engagement(
+    ids: List[int] = Query([]),
+    trend_limit: int = Query(10, ge=0, le=MAX_TREND_LIMIT),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Engagement summaries and latest trend points for a page of prospects (``?ids=1&ids=2``)"""
+    if not ids or len(ids) > MAX_ENGAGEMENT_BATCH:
+        raise HTTPException(status_code=400, detail=f"Pass between 1 and {MAX_ENGAGEMENT_BATCH} prospect ids")
+    return await db.run_sync(prospect_engagement_summaries, ids, trend_limit)
 
 @router.get("/prospects/{prospect_id}/engagement/", response_model=ProspectEngagement)
-def get_prospect_engagement(prospect_id: int, db: Session = Depends(get_db)):
-    prospect = db.query(Prospect).filter(Prospect.id == prospect_id).first()
-    if not prospect:
+async def get_prospect_engagement(
+    prospect_id: int,
+    response: Response,
+    trend_limit: int = Query(50, ge=0, le=MAX_TREND_LIMIT),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    offset = decode_offset_cursor(cursor) if cursor else 0
+    summaries = await db.run_sync(prospect_engagement_summaries, [prospect_id], trend_limit, offset)
+    if not summaries:
         raise HTTPException(status_code=404, detail="Prospect not found")
-    
-    engagements = db.query(EmailEngagement).filter(
-        EmailEngagement.prospect_id == prospect_id
-    ).order_by(EmailEngagement.sent_at.desc()).all()
-    
-    engagement_trend = [
-        {
-            "sent": e.sent_at,
-            "opened": e.opened_at,
-            "clicked": e.clicked_at,
-            "replied": e.replied_at
-        }
-        for e in engagements
-    ]
-    
+    summary = summaries[0]
+    if summary.pop("has_more") and trend_limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_offset_cursor(offset + trend_limit)
+    return summary
+
+# LLM cache endpoints
+@router.get("/llm-cache/stats")
+async def get_llm_cache_stats():
+    return llm_cache.stats()
+
+@router.get("/response-cache/stats")
+async def get_response_cache_stats():
+    """Hit rates of the company and template response cache"""
+    return response_cache.stats()
+
+@router.get("/prompts/stats")
+async def get_prompt_stats(service: EmailPersonalizationService = Depends(get_email_service)):
+    stats = service.prompt_stats
+    emails = stats["emails"]
     return {
-        "prospect": prospect,
-        "total_emails": len(engagements),
-        "last_engagement": engagements[0].sent_at if engagements else None,
-        "engagement_trend": engagement_trend
-    } 
\ No newline at end of file
+        **stats,
+        "average_prompt_tokens": stats["prompt_tokens"] / emails if emails else 0,
+        "average_tokens_saved": stats["tokens_saved"] / emails if emails else 0
+    }
+
+# Streaming exports
+EXPORT_FORMATS = {"ndjson": ("application/x-ndjson", ndjson_chunks), "csv": ("text/csv", csv_chunks)}
+# Rows fetched per round trip; on Postgres this runs on a server-side cursor
+EXPORT_BATCH_SIZE = 5000
+
+def _export(model, filters, format: str, filename: str) -> StreamingResponse:
+    media_type, encode = EXPORT_FORMATS[format]
+    columns = list(model.__table__.columns)
+
+    def stream():
+        # Own sync session: Starlette iterates sync generators on a worker thread
+        with SessionLocal() as db:
+            result = db.execute(
+                select(*columns).where(*filters).order_by(model.id)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            yield from encode([column.name for column in columns], result.partitions())
+
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'}
+    )
+
+@router.get("/exports/prospects")
+async def export_prospects(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    status: Optional[str] = None,
+    company_id: Optional[int] = None
+):
+    """Stream every prospect (optionally filtered) as NDJSON or CSV in constant memory"""
+    filters = []
+    if status:
+        filters.append(ProspectModel.status == status)
+    if company_id:
+        filters.append(ProspectModel.company_id == company_id)
+    return _export(ProspectModel, filters, format, "prospects")
+
+@router.get("/exports/engagements")
+async def export_engagements(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since: Optional[datetime] = None,
+    template_id: Optional[int] = None
+):
+    """Stream email engagements (optionally sent on or after ``since``) as NDJSON or CSV"""
+    filters = []
+    if since:
+        filters.append(EmailEngagementModel.sent_at >= since)
+    if template_id:
+        filters.append(EmailEngagementModel.template_id == template_id)
+    return _export(EmailEngagementModel, filters, format, "engagements")
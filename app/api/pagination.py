@@ -0,0 +1,75 @@
+from fastapi import HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import base64
+import json
+
+# Response header carrying the cursor for the next page; list bodies stay plain arrays
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(data["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def encode_offset_cursor(offset: int) -> str:
+    """Cursor for result sets without a stable id order, such as ranked search"""
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_offset_cursor(cursor: str) -> int:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return max(0, int(data["offset"]))
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _seek(query, model, cursor: Optional[str], skip: int):
+    query = query.order_by(model.id)
+    if cursor:
+        return query.filter(model.id > decode_cursor(cursor))
+    if skip:
+        return query.offset(skip)
+    return query
+
+def _trim(rows, response: Response, limit: int):
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].id)
+    return rows
+
+def paginate(query, model, response: Response, cursor: Optional[str], limit: Optional[int], skip: int = 0):
+    """
+    Keyset pagination on ``model.id``: with a cursor, seek past the last id
+    seen instead of OFFSET-scanning, so every page costs the same. Sets the
+    next-page cursor header when more rows exist. ``skip`` is kept for
+    backwards compatibility and ignored once a cursor is given.
+    """
+    query = _seek(query, model, cursor, skip)
+    if limit is None:
+        return query.all()
+    return _trim(query.limit(limit + 1).all(), response, limit)
+
+async def paginate_async(
+    db: AsyncSession,
+    statement,
+    model,
+    response: Response,
+    cursor: Optional[str],
+    limit: Optional[int],
+    skip: int = 0
+):
+    """
+    ``paginate`` for a ``select()`` on an async session. Like ``Query``,
+    returns ORM objects for ``select(model)`` and rows for column selects.
+    """
+    statement = _seek(statement, model, cursor, skip)
+    descriptions = statement.column_descriptions
+    execute = db.scalars if len(descriptions) == 1 and descriptions[0]["expr"] is model else db.execute
+    if limit is None:
+        return (await execute(statement)).all()
+    return _trim((await execute(statement.limit(limit + 1))).all(), response, limit)
@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from app.api.pagination import NEXT_CURSOR_HEADER, decode_offset_cursor, encode_offset_cursor
+from app.database.database import get_async_db
+from app.schemas.schemas import CompanySearchResult, ProspectSearchResult
+from app.services.search import search_companies, search_prospects
+
+router = APIRouter()
+
+# Set when the query matched more rows than are ranked; only the newest ones were considered
+TRUNCATED_HEADER = "X-Search-Truncated"
+
+async def _page(db: AsyncSession, search, response: Response, cursor: Optional[str], limit: int, **kwargs):
+    offset = decode_offset_cursor(cursor) if cursor else 0
+    try:
+        rows, truncated = await db.run_sync(search, limit=limit + 1, offset=offset, **kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if truncated:
+        response.headers[TRUNCATED_HEADER] = "true"
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_offset_cursor(offset + limit)
+    return rows
+
+@router.get("/search/companies", response_model=List[CompanySearchResult])
+async def search_companies_endpoint(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    industry: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ranked full-text search over company names and research; ``column:term`` scopes a term"""
+    return await _page(db, search_companies, response, cursor, limit, q=q, industry=industry)
+
+@router.get("/search/prospects", response_model=List[ProspectSearchResult])
+async def search_prospects_endpoint(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    company_id: Optional[int] = None,
+    status: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ranked full-text search over prospect name, position and notes"""
+    return await _page(db, search_prospects, response, cursor, limit, q=q, company_id=company_id, status=status)
@@ -0,0 +1,82 @@
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, List, Optional
+import csv
+import io
+import json
+
+from fastapi import HTTPException, Response
+
+try:
+    import orjson
+except ImportError:  # optional; fall back to the stdlib encoder
+    orjson = None
+
+# Headers set on the injected Response that must survive returning our own
+FORWARDED_HEADERS = ("x-next-cursor",)
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    """JSON-encode ``value`` with orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def select_columns(model, schema, fields: Optional[str] = None) -> List:
+    """
+    Table columns for the fields of ``schema``, or for the comma-separated
+    subset in ``fields``. ``id`` is always included for keyset pagination.
+    """
+    available = [name for name in schema.model_fields if name in model.__table__.c]
+    if fields:
+        requested = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in requested if name not in available]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown field(s): {', '.join(unknown)}")
+        available = ["id"] + [name for name in requested if name != "id"]
+    return [model.__table__.c[name] for name in available]
+
+
+def rows_response(rows, response: Response) -> FastJSONResponse:
+    """
+    Serialize row tuples straight to JSON, skipping ORM objects and response
+    model validation, keeping pagination headers set on ``response``
+    """
+    headers = {name: value for name, value in response.headers.items() if name in FORWARDED_HEADERS}
+    return FastJSONResponse([row._asdict() for row in rows], headers=headers)
+
+
+def ndjson_chunks(columns: List[str], partitions: Iterable) -> Iterable[bytes]:
+    """One JSON object per line, one chunk per partition of rows"""
+    for rows in partitions:
+        yield b"".join(dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+
+
+def csv_chunks(columns: List[str], partitions: Iterable) -> Iterable[bytes]:
+    """CSV with a header row, one chunk per partition of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in partitions:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
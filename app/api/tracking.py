@@ -0,0 +1,39 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import RedirectResponse, Response
+from pydantic import BaseModel
+from typing import Optional
+
+from app.services.tracking import TRANSPARENT_GIF, engagement_tracker, verify_tracking_token
+
+router = APIRouter()
+
+NO_CACHE_HEADERS = {"Cache-Control": "no-store, no-cache, must-revalidate, max-age=0"}
+
+class ReplyEvent(BaseModel):
+    response_content: Optional[str] = None
+
+@router.get("/t/o/{token}.gif")
+async def track_open(token: str):
+    verified = verify_tracking_token(token)
+    # Always serve the pixel so broken tokens don't show up as broken images
+    if verified is not None:
+        engagement_tracker.track(verified[0], "opened")
+    return Response(content=TRANSPARENT_GIF, media_type="image/gif", headers=NO_CACHE_HEADERS)
+
+@router.get("/t/c/{token}")
+async def track_click(token: str):
+    verified = verify_tracking_token(token)
+    if verified is None or not verified[1]:
+        raise HTTPException(status_code=404, detail="Link not found")
+    engagement_id, url = verified
+    engagement_tracker.track(engagement_id, "clicked")
+    return RedirectResponse(url, status_code=302, headers=NO_CACHE_HEADERS)
+
+@router.post("/engagements/{engagement_id}/reply", status_code=202)
+async def track_reply(engagement_id: int, reply: ReplyEvent):
+    engagement_tracker.track(engagement_id, "replied", response_content=reply.response_content)
+    return {"status": "queued"}
+
+@router.get("/tracking/stats")
+async def get_tracking_stats():
+    return {**engagement_tracker.stats, "pending": engagement_tracker.pending()}
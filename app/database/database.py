@@ -1,20 +1,170 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+from sqlalchemy.dialects import postgresql, sqlite
+from functools import lru_cache
+from typing import Iterator, Sequence
+import logging
 import os
+import time
 from dotenv import load_dotenv
 
+from app.services.metrics import record_query
+
 load_dotenv()
 
 # Use SQLite by default
-SQLALCHEMY_DATABASE_URL = "sqlite:///./app.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+slow_query_logger = logging.getLogger("app.database.slow_queries")
+
+def instrument_engine(engine: Engine, slow_query_ms: int = None) -> Engine:
+    """
+    Time every statement on ``engine`` for the metrics registry. Statements
+    slower than ``slow_query_ms`` (``SLOW_QUERY_MS``; 0 disables) are logged
+    without their parameters.
+    """
+    if slow_query_ms is None:
+        slow_query_ms = _env_int("SLOW_QUERY_MS", 0)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        slow = slow_query_ms > 0 and elapsed * 1000 >= slow_query_ms
+        if slow:
+            slow_query_logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split())[:2000])
+        record_query(elapsed, slow)
+
+    @event.listens_for(engine, "handle_error")
+    def _discard_timer(exception_context):
+        # after_cursor_execute doesn't fire for failed statements
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
+
+    return engine
+
+def build_engine(url: str = SQLALCHEMY_DATABASE_URL, **overrides) -> Engine:
+    """
+    Create an engine for ``url`` with pool settings from the environment.
+
+    SQLite connections run in WAL mode with synchronous=NORMAL, a memory map
+    and a busy timeout so readers don't block on the writer and concurrent
+    writers wait instead of failing with "database is locked".
+    """
+    options = {
+        "pool_size": _env_int("DB_POOL_SIZE", 10),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 20),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    }
+    options.update(overrides)
+
+    database = make_url(url)
+    if database.get_backend_name() != "sqlite":
+        return instrument_engine(create_engine(url, poolclass=QueuePool, **options))
+
+    in_memory = database.database in (None, "", ":memory:")
+    if in_memory:
+        # A single shared connection; pool sizing doesn't apply
+        options = {"poolclass": StaticPool}
+
+    engine = create_engine(
+        url,
+        connect_args={
+            "check_same_thread": False,  # Needed for SQLite
+            "timeout": _env_int("SQLITE_BUSY_TIMEOUT_MS", 30000) / 1000
+        },
+        **options
+    )
+    _configure_sqlite(engine, in_memory)
+    return instrument_engine(engine)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}  # Needed for SQLite
-)
+def _configure_sqlite(engine: Engine, in_memory: bool):
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={_env_int('SQLITE_BUSY_TIMEOUT_MS', 30000)}")
+        cursor.execute(f"PRAGMA mmap_size={_env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}")
+        cursor.close()
+
+# Async drivers for the sync URLs in DATABASE_URL
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+def build_async_engine(url: str = SQLALCHEMY_DATABASE_URL, **overrides) -> AsyncEngine:
+    """
+    Async counterpart of ``build_engine`` for the same database: aiosqlite
+    for SQLite, asyncpg for Postgres, with the same pool settings, pragmas
+    and instrumentation. In-memory SQLite is refused: the async driver would
+    open its own, empty database rather than the one ``build_engine`` migrated.
+    """
+    database = make_url(url)
+    backend = database.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    database = database.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+    options = {
+        "pool_size": _env_int("DB_POOL_SIZE", 10),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 20),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    }
+    options.update(overrides)
+
+    if backend != "sqlite":
+        engine = create_async_engine(database, poolclass=AsyncAdaptedQueuePool, **options)
+        instrument_engine(engine.sync_engine)
+        return engine
+
+    if database.database in (None, "", ":memory:"):
+        raise ValueError("In-memory SQLite can't be shared with the async engine; set DATABASE_URL to a SQLite file")
+    # aiosqlite defaults to no pooling; keep connections (and their pragmas) open
+    engine = create_async_engine(
+        database,
+        connect_args={"timeout": _env_int("SQLITE_BUSY_TIMEOUT_MS", 30000) / 1000},
+        poolclass=AsyncAdaptedQueuePool,
+        **options
+    )
+    _configure_sqlite(engine.sync_engine, False)
+    instrument_engine(engine.sync_engine)
+    return engine
+
+engine = build_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+@lru_cache(maxsize=1)
+def get_async_engine() -> AsyncEngine:
+    """Shared async engine, created on first use so the async driver is only imported when needed"""
+    return build_async_engine()
+
+@lru_cache(maxsize=1)
+def get_async_sessionmaker() -> async_sessionmaker:
+    # Attributes stay loaded after commit: async sessions can't lazy-load on access
+    return async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+
+async def dispose_async_engine():
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+
 Base = declarative_base()
 
 # Dependency
@@ -23,4 +173,22 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+def dialect_insert(db: Session, model):
+    """INSERT construct for the session's dialect, supporting ON CONFLICT clauses"""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+# Keep the number of bound parameters per statement well under SQLite's limit
+IN_CLAUSE_CHUNK = 500
+
+def chunked(items: Sequence, size: int = IN_CLAUSE_CHUNK) -> Iterator[Sequence]:
+    """Consecutive slices of ``items`` at most ``size`` long, e.g. for IN (...) lists"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
@@ -0,0 +1,152 @@
+"""
+Minimal schema migrations.
+
+``run_migrations`` creates any missing tables from the models, then applies
+each registered migration that isn't yet recorded in ``schema_migrations``.
+Migrations must be idempotent: on a fresh database the tables (and their
+declared indexes) already exist by the time they run.
+
+    python -m app.database.migrations
+"""
+from typing import Callable, List, Tuple
+import logging
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.database.database import Base, engine as default_engine
+from app.models import models
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = []
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", String(100), primary_key=True),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def migration(version: str):
+    """Register a migration; versions are applied in registration order"""
+    def register(fn: Callable[[Connection], None]):
+        MIGRATIONS.append((version, fn))
+        return fn
+    return register
+
+
+def _create_indexes(connection: Connection, model):
+    # Indexes on columns a later migration adds are left to that migration
+    existing = {column["name"] for column in inspect(connection).get_columns(model.__tablename__)}
+    for index in model.__table__.indexes:
+        if all(column.name in existing for column in index.columns):
+            index.create(connection, checkfirst=True)
+
+
+@migration("0001_hot_path_indexes")
+def hot_path_indexes(connection: Connection):
+    """Indexes for list filters, keyset pagination and engagement lookups"""
+    for model in (models.Company, models.Prospect, models.EmailTemplate, models.EmailEngagement):
+        _create_indexes(connection, model)
+
+
+# Full-text indexed columns as of 0002, with Postgres rank weights
+FTS_0002 = {
+    "companies": {
+        "name": "A", "industry": "A", "key_insights": "B", "product_info": "B", "market_position": "B",
+        "description": "C", "company_bio": "C", "funding_info": "C",
+    },
+    "prospects": {"name": "A", "position": "A", "notes": "C"},
+}
+
+
+@migration("0002_full_text_search")
+def full_text_search(connection: Connection):
+    """
+    FTS index over company research and prospect name/position/notes:
+    external-content FTS5 tables kept in sync by triggers on SQLite, a
+    generated tsvector column with a GIN index on Postgres
+    """
+    for table, weights in FTS_0002.items():
+        columns = list(weights)
+        if connection.dialect.name == "postgresql":
+            vector = " || ".join(
+                f"setweight(to_tsvector('english', coalesce({column}, '')), '{weight}')"
+                for column, weight in weights.items()
+            )
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS ({vector}) STORED"
+            )
+            connection.exec_driver_sql(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)"
+            )
+            continue
+
+        names = ", ".join(columns)
+        new_values = ", ".join(f"new.{column}" for column in columns)
+        old_values = ", ".join(f"old.{column}" for column in columns)
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5({names}, "
+            f"content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {table}_fts(rowid, {names}) VALUES (new.id, {new_values}); END"
+        )
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {table}_fts({table}_fts, rowid, {names}) VALUES ('delete', old.id, {old_values}); END"
+        )
+        # Only fires for indexed columns, so score and status updates don't reindex
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {names} ON {table} BEGIN "
+            f"INSERT INTO {table}_fts({table}_fts, rowid, {names}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {table}_fts(rowid, {names}) VALUES (new.id, {new_values}); END"
+        )
+        connection.exec_driver_sql(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+
+@migration("0003_prospect_priority_scores")
+def prospect_priority_scores(connection: Connection):
+    """Prospect priority score column and the indexes behind top-K lookups"""
+    columns = {column["name"] for column in inspect(connection).get_columns("prospects")}
+    if "priority_score" not in columns:
+        connection.exec_driver_sql("ALTER TABLE prospects ADD COLUMN priority_score FLOAT")
+    _create_indexes(connection, models.Prospect)
+
+
+@migration("0004_backfill_engagement_rollups")
+def backfill_engagement_rollups(connection: Connection):
+    """Fill the rollup tables metrics are read from with existing engagements"""
+    from app.services.rollups import rebuild_rollups
+
+    # The session's commit releases a savepoint; the migration transaction stays open
+    with Session(bind=connection, join_transaction_mode="create_savepoint") as db:
+        rebuild_rollups(db)
+
+
+def run_migrations(engine: Engine = default_engine) -> List[str]:
+    """Bring the schema up to date, returning the versions applied"""
+    Base.metadata.create_all(bind=engine)
+    applied = []
+    with engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+        done = set(connection.scalars(select(schema_migrations.c.version)))
+        for version, fn in MIGRATIONS:
+            if version in done:
+                continue
+            logger.info("Applying migration %s", version)
+            fn(connection)
+            connection.execute(schema_migrations.insert().values(version=version))
+            applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(run_migrations() or "Schema is up to date")
@@ -1,34 +1,121 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from starlette.routing import Match
+import logging
+import os
+import time
+from app.api.campaigns import router as campaigns_router
 from app.api.endpoints import router as api_router
-from app.database.database import engine
-from app.models.models import Base
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(
-    title="Email Personalization Tool",
-    description="API for managing companies and prospects with research information",
-    version="1.0.0"
-)
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # React frontend
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Include API router
-app.include_router(api_router, prefix="/api")
-
-@app.get("/")
+from app.api.pagination import NEXT_CURSOR_HEADER
+from app.api.search import TRUNCATED_HEADER, router as search_router
+from app.api.tracking import router as tracking_router
+from app.database.database import dispose_async_engine, engine
+from app.database.migrations import run_migrations
+from app.services.metrics import record_request, registry, start_request
+from app.services.tracking import MIN_SECRET_KEY_LENGTH, engagement_tracker, tracking_enabled
+
+logger = logging.getLogger(__name__)
+
+# Adds a Server-Timing header with the db/llm/app breakdown of each response
+DEBUG_TIMING_HEADER = os.getenv("DEBUG_TIMING_HEADER", "false").lower() in ("1", "true", "yes", "on")
+
+# Apply pending migrations when the app starts. Turn off when deploying
+# several workers and run ``python -m app.database.migrations`` once instead.
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "true").lower() in ("1", "true", "yes", "on")
+
+def _route_label(request: Request) -> str:
+    # The path template rather than the raw path keeps label cardinality bounded
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+async def record_request_metrics(request: Request, call_next):
+    timings = start_request()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        # Streaming responses are measured up to the start of the body
+        elapsed = time.perf_counter() - started
+        record_request(request.method, _route_label(request), status, elapsed, timings)
+    if DEBUG_TIMING_HEADER:
+        response.headers["Server-Timing"] = timings.server_timing(elapsed)
+    return response
+
+def migrate():
+    run_migrations(engine)
+
+def start_engagement_tracker():
+    if not tracking_enabled():
+        logger.warning(
+            "SECRET_KEY is unset or shorter than %d characters: tracking tokens can't be signed "
+            "and open/click links are rejected", MIN_SECRET_KEY_LENGTH
+        )
+    engagement_tracker.start()
+
+def stop_engagement_tracker():
+    # Flush buffered open/click/reply events before exiting
+    engagement_tracker.stop()
+
 async def root():
     return {"message": "Welcome to Email Personalization Tool API"}
 
-@app.get("/health")
 async def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    return {"status": "healthy"}
+
+def metrics():
+    """Prometheus text exposition of request, SQL and LLM metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+def create_app(auto_migrate: bool = None) -> FastAPI:
+    """
+    Build the API application. Nothing touches the database until startup,
+    where pending migrations are applied unless ``auto_migrate`` (default
+    ``AUTO_MIGRATE``) is off.
+
+        uvicorn --factory app.main:create_app
+    """
+    if auto_migrate is None:
+        auto_migrate = AUTO_MIGRATE
+
+    app = FastAPI(
+        title="Email Personalization Tool",
+        description="API for managing companies and prospects with research information",
+        version="1.0.0"
+    )
+
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"],  # React frontend
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, TRUNCATED_HEADER, "Server-Timing"],
+    )
+    app.middleware("http")(record_request_metrics)
+
+    # Include API router
+    app.include_router(api_router, prefix="/api")
+    app.include_router(tracking_router, prefix="/api")
+    app.include_router(campaigns_router, prefix="/api")
+    app.include_router(search_router, prefix="/api")
+
+    if auto_migrate:
+        app.add_event_handler("startup", migrate)
+    app.add_event_handler("startup", start_engagement_tracker)
+    app.add_event_handler("shutdown", stop_engagement_tracker)
+    app.add_event_handler("shutdown", dispose_async_engine)
+
+    app.add_api_route("/", root, methods=["GET"])
+    app.add_api_route("/health", health_check, methods=["GET"])
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+    return app
+
+# Module-level instance for ``uvicorn app.main:app``; building it has no side effects
+app = create_app()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Float, ForeignKey, Boolean, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database.database import Base
@@ -7,7 +7,7 @@ class Company(Base):
     __tablename__ = "companies"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), nullable=False)
+    name = Column(String(100), nullable=False, index=True)
     industry = Column(String(100))
     website = Column(String(200))
     description = Column(Text)
@@ -23,6 +23,25 @@ class Company(Base):
     prospects = relationship("Prospect", back_populates="company")
     email_templates = relationship("EmailTemplate", back_populates="company")
 
+# Fetch state of one page of a company's website, for conditional re-fetching
+class CompanyPage(Base):
+    __tablename__ = "company_pages"
+
+    company_id = Column(Integer, ForeignKey("companies.id"), primary_key=True)
+    path = Column(String(100), primary_key=True)  # relative to Company.website, "" for the home page
+    url = Column(String(500))
+    status_code = Column(Integer)
+    etag = Column(String(200))
+    last_modified = Column(String(100))
+    # sha256 of the body, for servers that send no validators
+    content_hash = Column(String(64))
+    # Text extracted from the last successful fetch
+    extracted = Column(JSON)
+    error = Column(Text)
+    # Naive UTC
+    fetched_at = Column(DateTime)
+    changed_at = Column(DateTime)
+
 class Prospect(Base):
     __tablename__ = "prospects"
 
@@ -39,10 +58,21 @@ class Prospect(Base):
     engagement_score = Column(Integer, default=0)
     status = Column(String(50), default="new")  # new, contacted, engaged, qualified, converted
     notes = Column(Text)
+    # Recency-decayed engagement score maintained by app.services.scoring (log2, epoch-anchored)
+    priority_score = Column(Float)
 
     company = relationship("Company", back_populates="prospects")
     email_engagements = relationship("EmailEngagement", back_populates="prospect")
 
+    # Filters used by list endpoints, with id last for keyset pagination
+    __table_args__ = (
+        Index("ix_prospects_status_id", "status", "id"),
+        Index("ix_prospects_company_id_id", "company_id", "id"),
+        # Top-K by priority within a company or status
+        Index("ix_prospects_company_id_priority_score", "company_id", "priority_score"),
+        Index("ix_prospects_status_priority_score", "status", "priority_score"),
+    )
+
 class EmailTemplate(Base):
     __tablename__ = "email_templates"
 
@@ -61,6 +91,10 @@ class EmailTemplate(Base):
     company = relationship("Company", back_populates="email_templates")
     engagements = relationship("EmailEngagement", back_populates="template")
 
+    __table_args__ = (
+        Index("ix_email_templates_company_id_is_active", "company_id", "is_active"),
+    )
+
 class EmailEngagement(Base):
     __tablename__ = "email_engagements"
 
@@ -75,4 +109,125 @@ class EmailEngagement(Base):
     engagement_score = Column(Integer, default=0)
 
     prospect = relationship("Prospect", back_populates="email_engagements")
-    template = relationship("EmailTemplate", back_populates="engagements") 
\ No newline at end of file
+    template = relationship("EmailTemplate", back_populates="engagements") 
+
+    __table_args__ = (
+        Index("ix_email_engagements_sent_at", "sent_at"),
+        Index("ix_email_engagements_prospect_id_sent_at", "prospect_id", "sent_at"),
+        Index("ix_email_engagements_template_id_sent_at", "template_id", "sent_at"),
+    )
+
+# Engagement rollups, keyed by the day the email was sent. company_id and
+# template_id use 0 when unknown so they can be part of the primary key.
+class EngagementDailyRollup(Base):
+    __tablename__ = "engagement_daily_rollups"
+
+    day = Column(Date, primary_key=True)
+    company_id = Column(Integer, primary_key=True)
+    template_id = Column(Integer, primary_key=True)
+    sent = Column(Integer, nullable=False, default=0)
+    opened = Column(Integer, nullable=False, default=0)
+    clicked = Column(Integer, nullable=False, default=0)
+    replied = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Integer, nullable=False, default=0)
+
+class EngagementHourlyRollup(Base):
+    __tablename__ = "engagement_hourly_rollups"
+
+    day = Column(Date, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    company_id = Column(Integer, primary_key=True)
+    sent = Column(Integer, nullable=False, default=0)
+    replied = Column(Integer, nullable=False, default=0)
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache_entries"
+
+    key = Column(String(64), primary_key=True)
+    content = Column(Text, nullable=False)
+    model = Column(String(50))
+    # Entities the prompt was rendered from, used for invalidation
+    company_id = Column(Integer, index=True)
+    template_id = Column(Integer, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Naive UTC, compared against datetime.utcnow()
+    expires_at = Column(DateTime, index=True)
+    last_accessed_at = Column(DateTime, index=True)
+
+class Campaign(Base):
+    __tablename__ = "campaigns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    template_id = Column(Integer, ForeignKey("email_templates.id"), nullable=False)
+    status = Column(String(20), nullable=False, default="running")  # running, paused, completed, cancelled
+    # Upper bound on tasks in flight across all workers
+    max_concurrency = Column(Integer, nullable=False, default=8)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    additional_context = Column(JSON)
+    total_tasks = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True))
+    # Naive UTC; workers claim from the least recently served campaign first
+    last_claimed_at = Column(DateTime)
+
+    template = relationship("EmailTemplate")
+    tasks = relationship("CampaignTask", back_populates="campaign")
+
+class CampaignTask(Base):
+    __tablename__ = "campaign_tasks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=False)
+    prospect_id = Column(Integer, ForeignKey("prospects.id"), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, succeeded, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    # Naive UTC. Lease expiry while running (an expired lease is claimable
+    # again); earliest retry time while pending.
+    lease_owner = Column(String(64))
+    lease_expires_at = Column(DateTime)
+    subject = Column(String(200))
+    body = Column(Text)
+    error = Column(Text)
+    completed_at = Column(DateTime)
+
+    campaign = relationship("Campaign", back_populates="tasks")
+
+    __table_args__ = (
+        UniqueConstraint("campaign_id", "prospect_id", name="uq_campaign_tasks_campaign_id_prospect_id"),
+        Index("ix_campaign_tasks_campaign_id_status_id", "campaign_id", "status", "id"),
+        Index("ix_campaign_tasks_campaign_id_completed_at", "campaign_id", "completed_at"),
+    )
+
+class ScoringRun(Base):
+    __tablename__ = "scoring_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    mode = Column(String(20), nullable=False)  # full, incremental
+    # Naive UTC; an incremental run rescores prospects touched since the last run started
+    started_at = Column(DateTime, nullable=False, index=True)
+    finished_at = Column(DateTime)
+    # Scores from runs with a different half-life aren't comparable, so those force a full run
+    half_life_days = Column(Float, nullable=False)
+    prospects_scored = Column(Integer, nullable=False, default=0)
+    events = Column(Integer, nullable=False, default=0)
+
+# One columnar archive file of engagements moved out of email_engagements,
+# holding rows sent in one calendar month
+class EngagementArchiveFile(Base):
+    __tablename__ = "engagement_archive_files"
+
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(String(7), nullable=False, index=True)  # YYYY-MM
+    path = Column(String(500), nullable=False, unique=True)  # relative to the archive directory
+    format = Column(String(10), nullable=False)  # parquet, npz
+    rows = Column(Integer, nullable=False)
+    min_id = Column(Integer, nullable=False)
+    max_id = Column(Integer, nullable=False)
+    # Naive UTC. Range of sent_at in the file, for pruning reads
+    sent_from = Column(DateTime, nullable=False)
+    sent_to = Column(DateTime, nullable=False)
+    # Everything sent before this had been archived once the file was written
+    archived_before = Column(DateTime, nullable=False, index=True)
+    bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
 from typing import Optional, List, Dict
 
@@ -68,6 +68,10 @@ class EmailTemplate(EmailTemplateBase):
     class Config:
         from_attributes = True
 
+class TemplateVariants(BaseModel):
+    variants: List[EmailTemplate]
+    errors: List[Dict] = []
+
 class EmailEngagementBase(BaseModel):
     prospect_id: int
     template_id: int
@@ -97,8 +101,96 @@ class EngagementMetrics(BaseModel):
     best_performing_template: Optional[str] = None
     best_sending_time: Optional[str] = None
 
+class EngagementTrendPoint(BaseModel):
+    sent: Optional[datetime] = None
+    opened: Optional[datetime] = None
+    clicked: Optional[datetime] = None
+    replied: Optional[datetime] = None
+
 class ProspectEngagement(BaseModel):
     prospect: Prospect
     total_emails: int
+    total_opened: int = 0
+    total_clicked: int = 0
+    total_replied: int = 0
     last_engagement: Optional[datetime] = None
-    engagement_trend: List[Dict[str, datetime]] 
\ No newline at end of file
+    # Most recent first, one page at a time
+    engagement_trend: List[EngagementTrendPoint]
+
+class ProspectWithCompany(Prospect):
+    company: Optional[Company] = None
+
+class ProspectEngagementSummary(ProspectEngagement):
+    prospect: ProspectWithCompany
+
+# CSV import job progress
+class ImportJobStatus(BaseModel):
+    job_id: str
+    filename: str
+    status: str
+    rows_parsed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+    errors: List[Dict] = []
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+# Campaign generation queue
+class CampaignCreate(BaseModel):
+    name: str
+    template_id: int
+    # Either explicit prospects or every prospect matching the filters
+    prospect_ids: Optional[List[int]] = None
+    company_id: Optional[int] = None
+    status: Optional[str] = None
+    max_concurrency: int = Field(8, ge=1, le=1000)
+    max_attempts: int = Field(3, ge=1, le=20)
+    additional_context: Optional[Dict] = None
+
+class CampaignProgress(BaseModel):
+    id: int
+    name: str
+    template_id: int
+    status: str
+    max_concurrency: int
+    max_attempts: int
+    total_tasks: int
+    pending: int
+    running: int
+    succeeded: int
+    failed: int
+    percent_complete: float
+    throughput_per_minute: float
+    eta_seconds: Optional[int] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+class CampaignTask(BaseModel):
+    id: int
+    campaign_id: int
+    prospect_id: int
+    status: str
+    attempts: int
+    subject: Optional[str] = None
+    body: Optional[str] = None
+    error: Optional[str] = None
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Search Schemas
+class CompanySearchResult(Company):
+    score: float
+    snippet: Optional[str] = None
+
+class ProspectSearchResult(Prospect):
+    score: float
+    snippet: Optional[str] = None
+
+class RankedProspect(Prospect):
+    rank: int
+    # Recency-decayed engagement points as of the request
+    priority: float
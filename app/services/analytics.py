@@ -0,0 +1,172 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+from datetime import datetime
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session, joinedload
+
+from app.models.models import EmailEngagement, EmailTemplate, EngagementDailyRollup, EngagementHourlyRollup, Prospect
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Hour/day buckets with fewer sends than this are too noisy to recommend
+MIN_SENDS_FOR_SENDING_TIME = 10
+
+
+def engagement_metrics(db: Session, start_date: datetime, company_id: Optional[int] = None) -> Dict:
+    """
+    Totals, average score and best template for engagements sent on or after
+    the day of ``start_date``, summed from the daily rollups
+    """
+    rollup = EngagementDailyRollup
+    query = select(
+        rollup.template_id,
+        EmailTemplate.name,
+        func.sum(rollup.sent),
+        func.sum(rollup.opened),
+        func.sum(rollup.clicked),
+        func.sum(rollup.replied),
+        func.sum(rollup.score_sum)
+    ).outerjoin(EmailTemplate, EmailTemplate.id == rollup.template_id).where(
+        rollup.day >= start_date.date()
+    ).group_by(rollup.template_id, EmailTemplate.name)
+    if company_id:
+        query = query.where(rollup.company_id == company_id)
+
+    metrics = {
+        "total_sent": 0,
+        "total_opened": 0,
+        "total_clicked": 0,
+        "total_replied": 0,
+        "average_engagement_score": 0,
+        "best_performing_template": None
+    }
+    score_sum = 0
+    best_score = None
+    for template_id, name, sent, opened, clicked, replied, score in db.execute(query):
+        metrics["total_sent"] += sent
+        metrics["total_opened"] += opened
+        metrics["total_clicked"] += clicked
+        metrics["total_replied"] += replied
+        score_sum += score
+        if name is not None and (best_score is None or opened + clicked + replied > best_score):
+            best_score = opened + clicked + replied
+            metrics["best_performing_template"] = name
+
+    if metrics["total_sent"]:
+        metrics["average_engagement_score"] = score_sum / metrics["total_sent"]
+
+    metrics["best_sending_time"] = best_sending_time(db, start_date, company_id)
+    return metrics
+
+
+def best_sending_time(db: Session, start_date: datetime, company_id: Optional[int] = None) -> Optional[str]:
+    """
+    Day-of-week/hour-of-day bucket (UTC) with the highest reply rate, from
+    the hourly rollups
+    """
+    rollup = EngagementHourlyRollup
+    query = select(rollup.day, rollup.hour, func.sum(rollup.sent), func.sum(rollup.replied)).where(
+        rollup.day >= start_date.date()
+    ).group_by(rollup.day, rollup.hour)
+    if company_id:
+        query = query.where(rollup.company_id == company_id)
+
+    histogram = defaultdict(lambda: [0, 0])
+    for day, hour, sent, replied in db.execute(query):
+        bucket = histogram[(day.weekday(), hour)]
+        bucket[0] += sent
+        bucket[1] += replied
+
+    candidates = [
+        (replied / sent, sent, bucket)
+        for bucket, (sent, replied) in histogram.items()
+        if sent >= MIN_SENDS_FOR_SENDING_TIME and replied
+    ]
+    if not candidates:
+        return None
+    _, _, (weekday, hour) = max(candidates)
+    return f"{DAY_NAMES[weekday]} {hour:02d}:00 UTC"
+
+
+def prospect_engagement_summaries(
+    db: Session,
+    prospect_ids: Sequence[int],
+    trend_limit: int = 10,
+    trend_offset: int = 0
+) -> List[Dict]:
+    """
+    Engagement totals and a page of the most recent trend points for each
+    prospect in ``prospect_ids`` (unknown ids are skipped), in request order.
+    Two queries whatever the number of prospects: the prospects with their
+    company, and one windowed query over their engagements. ``has_more``
+    tells whether trend points exist past this page.
+    """
+    prospects = {
+        prospect.id: prospect
+        for prospect in db.scalars(
+            select(Prospect).where(Prospect.id.in_(prospect_ids)).options(joinedload(Prospect.company))
+        )
+    }
+    if not prospects:
+        return []
+
+    e = EmailEngagement
+    partition = {"partition_by": e.prospect_id}
+    windowed = select(
+        e.prospect_id,
+        e.sent_at,
+        e.opened_at,
+        e.clicked_at,
+        e.replied_at,
+        func.row_number().over(order_by=(e.sent_at.desc(), e.id.desc()), **partition).label("position"),
+        func.count().over(**partition).label("total_emails"),
+        func.count(e.opened_at).over(**partition).label("total_opened"),
+        func.count(e.clicked_at).over(**partition).label("total_clicked"),
+        func.count(e.replied_at).over(**partition).label("total_replied"),
+        func.max(e.sent_at).over(**partition).label("last_engagement"),
+    ).where(e.prospect_id.in_(list(prospects))).subquery()
+    # Position 1 always comes back so prospects paged past their last email keep their totals;
+    # one row past the page answers has_more
+    rows = db.execute(
+        select(windowed)
+        .where(or_(
+            windowed.c.position == 1,
+            windowed.c.position.between(trend_offset + 1, trend_offset + trend_limit + 1)
+        ))
+        .order_by(windowed.c.prospect_id, windowed.c.position)
+    )
+
+    summaries = {
+        prospect_id: {
+            "prospect": prospect,
+            "total_emails": 0,
+            "total_opened": 0,
+            "total_clicked": 0,
+            "total_replied": 0,
+            "last_engagement": None,
+            "engagement_trend": [],
+            "has_more": False,
+        }
+        for prospect_id, prospect in prospects.items()
+    }
+    for row in rows:
+        summary = summaries[row.prospect_id]
+        if row.position == 1:
+            summary.update(
+                total_emails=row.total_emails,
+                total_opened=row.total_opened,
+                total_clicked=row.total_clicked,
+                total_replied=row.total_replied,
+                last_engagement=row.last_engagement
+            )
+        if row.position > trend_offset + trend_limit:
+            summary["has_more"] = True
+        elif row.position > trend_offset:
+            summary["engagement_trend"].append({
+                "sent": row.sent_at,
+                "opened": row.opened_at,
+                "clicked": row.clicked_at,
+                "replied": row.replied_at
+            })
+    return [summaries[prospect_id] for prospect_id in dict.fromkeys(prospect_ids) if prospect_id in summaries]
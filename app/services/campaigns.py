@@ -0,0 +1,521 @@
+"""
+Durable campaign generation queue.
+
+A campaign fans out into one ``CampaignTask`` per prospect. Workers claim
+tasks in batches under a time-limited lease, generate emails through
+``EmailPersonalizationService`` and write results back in bulk. Because all
+state lives in the database, a crashed worker only delays its leased tasks
+until the lease expires, and a campaign can be paused and resumed at any
+point.
+
+    python -m app.services.campaigns --processes 4
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from sqlalchemy import bindparam, exists, func, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.database.database import SessionLocal, chunked
+from app.models.models import Campaign, CampaignTask, EmailTemplate, Prospect
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_TASK_STATUSES = ("pending", "running")
+# Failed attempts are retried after RETRY_DELAY * 2 ** (attempt - 1), capped
+RETRY_DELAY = timedelta(seconds=30)
+MAX_RETRY_DELAY = timedelta(minutes=10)
+# Window for the throughput figure in campaign progress
+THROUGHPUT_WINDOW = timedelta(minutes=5)
+
+
+class ClaimedTask(NamedTuple):
+    task_id: int
+    campaign_id: int
+    prospect_id: int
+    attempts: int
+    max_attempts: int
+
+
+def create_campaign(
+    db: Session,
+    name: str,
+    template_id: int,
+    prospect_ids: Optional[Iterable[int]] = None,
+    company_id: Optional[int] = None,
+    status: Optional[str] = None,
+    max_concurrency: int = 8,
+    max_attempts: int = 3,
+    additional_context: Optional[Dict] = None
+) -> Campaign:
+    """
+    Create a campaign with one task per prospect, either for explicit
+    ``prospect_ids`` or for every prospect matching ``company_id``/``status``.
+    Tasks are inserted with INSERT ... SELECT so unknown ids are skipped and
+    large campaigns never round-trip prospect rows through Python.
+    """
+    if db.get(EmailTemplate, template_id) is None:
+        raise ValueError(f"Email template {template_id} not found")
+
+    campaign = Campaign(
+        name=name,
+        template_id=template_id,
+        status="running",
+        max_concurrency=max_concurrency,
+        max_attempts=max_attempts,
+        additional_context=additional_context
+    )
+    db.add(campaign)
+    db.flush()
+
+    def insert_tasks(*criteria):
+        source = select(literal(campaign.id), Prospect.id).where(*criteria).order_by(Prospect.id)
+        db.execute(CampaignTask.__table__.insert().from_select(["campaign_id", "prospect_id"], source))
+
+    filters = []
+    if company_id is not None:
+        filters.append(Prospect.company_id == company_id)
+    if status is not None:
+        filters.append(Prospect.status == status)
+
+    if prospect_ids is None:
+        insert_tasks(*filters)
+    else:
+        unique_ids = list(dict.fromkeys(prospect_ids))
+        for chunk in chunked(unique_ids):
+            insert_tasks(Prospect.id.in_(chunk), *filters)
+
+    campaign.total_tasks = db.scalar(select(func.count()).where(CampaignTask.campaign_id == campaign.id))
+    if campaign.total_tasks == 0:
+        campaign.status = "completed"
+        campaign.completed_at = datetime.utcnow()
+    db.commit()
+    db.refresh(campaign)
+    return campaign
+
+
+def campaign_progress(db: Session, campaigns: List[Campaign]) -> List[Dict]:
+    """Task counts, throughput over the last few minutes and an ETA for each campaign"""
+    ids = [campaign.id for campaign in campaigns]
+    counts = defaultdict(dict)
+    recent = {}
+    if ids:
+        rows = db.execute(
+            select(CampaignTask.campaign_id, CampaignTask.status, func.count())
+            .where(CampaignTask.campaign_id.in_(ids))
+            .group_by(CampaignTask.campaign_id, CampaignTask.status)
+        )
+        for campaign_id, status, count in rows:
+            counts[campaign_id][status] = count
+        since = datetime.utcnow() - THROUGHPUT_WINDOW
+        recent = dict(db.execute(
+            select(CampaignTask.campaign_id, func.count())
+            .where(CampaignTask.campaign_id.in_(ids), CampaignTask.completed_at >= since)
+            .group_by(CampaignTask.campaign_id)
+        ).all())
+
+    progress = []
+    for campaign in campaigns:
+        by_status = counts[campaign.id]
+        done = by_status.get("succeeded", 0) + by_status.get("failed", 0)
+        remaining = by_status.get("pending", 0) + by_status.get("running", 0)
+        per_minute = recent.get(campaign.id, 0) / (THROUGHPUT_WINDOW.total_seconds() / 60)
+        progress.append({
+            "id": campaign.id,
+            "name": campaign.name,
+            "template_id": campaign.template_id,
+            "status": campaign.status,
+            "max_concurrency": campaign.max_concurrency,
+            "max_attempts": campaign.max_attempts,
+            "total_tasks": campaign.total_tasks,
+            "pending": by_status.get("pending", 0),
+            "running": by_status.get("running", 0),
+            "succeeded": by_status.get("succeeded", 0),
+            "failed": by_status.get("failed", 0),
+            "percent_complete": round(100 * done / campaign.total_tasks, 1) if campaign.total_tasks else 100.0,
+            "throughput_per_minute": round(per_minute, 2),
+            "eta_seconds": round(remaining / per_minute * 60) if per_minute and campaign.status == "running" else None,
+            "created_at": campaign.created_at,
+            "completed_at": campaign.completed_at,
+        })
+    return progress
+
+
+def set_campaign_status(db: Session, campaign: Campaign, status: str, retry_failed: bool = False) -> Campaign:
+    """
+    Pause, resume or cancel a campaign. Running tasks finish their current
+    attempt; nothing new is claimed until the campaign is running again.
+    """
+    now = datetime.utcnow()
+    if retry_failed:
+        db.execute(
+            update(CampaignTask)
+            .where(CampaignTask.campaign_id == campaign.id, CampaignTask.status == "failed")
+            .values(status="pending", attempts=0, error=None, completed_at=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+    if status == "running":
+        has_work = db.scalar(select(exists().where(
+            CampaignTask.campaign_id == campaign.id, CampaignTask.status.in_(ACTIVE_TASK_STATUSES)
+        )))
+        campaign.status = "running" if has_work else "completed"
+        campaign.completed_at = None if has_work else (campaign.completed_at or now)
+    else:
+        campaign.status = status
+        if status == "cancelled":
+            campaign.completed_at = now
+    db.commit()
+    db.refresh(campaign)
+    return campaign
+
+
+class CampaignQueue:
+    """
+    Lease-based task queue over ``campaign_tasks``.
+
+    A task is claimable when it is pending, or running with an expired lease
+    (its worker died), and its ``lease_expires_at`` has passed; pending tasks
+    reuse that column as the earliest retry time. An expired task that has
+    used all of its campaign's ``max_attempts`` is failed instead. On Postgres candidates are
+    selected ``FOR UPDATE SKIP LOCKED``; on SQLite the single writer lock
+    makes the claim atomic.
+    """
+
+    def __init__(self, session_factory=SessionLocal, lease_seconds: float = 300.0):
+        self.session_factory = session_factory
+        self.lease = timedelta(seconds=lease_seconds)
+
+    def claim(self, worker_id: str, limit: int) -> List[ClaimedTask]:
+        """Lease up to ``limit`` tasks, spreading them across running campaigns"""
+        claimed = []
+        with self.session_factory() as db:
+            campaign_ids = db.scalars(
+                select(Campaign.id)
+                .where(Campaign.status == "running")
+                .order_by(Campaign.last_claimed_at.asc().nulls_first(), Campaign.id)
+            ).all()
+            for campaign_id in campaign_ids:
+                if len(claimed) >= limit:
+                    break
+                claimed.extend(self._claim_from(db, campaign_id, worker_id, limit - len(claimed)))
+        return claimed
+
+    def _claim_from(self, db: Session, campaign_id: int, worker_id: str, limit: int) -> List[ClaimedTask]:
+        now = datetime.utcnow()
+        # Writing the campaign row first takes its row lock (Postgres) or the
+        # database write lock (SQLite), so concurrent claimers of a campaign
+        # are serialized and the in-flight count below can't go stale.
+        campaign = db.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign_id, Campaign.status == "running")
+            .values(last_claimed_at=now)
+            .returning(Campaign.max_concurrency, Campaign.max_attempts)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if campaign is None:
+            db.rollback()
+            return []
+
+        # complete() enforces max_attempts, but a task whose worker died or
+        # hung never gets there; once its last lease expires it has failed
+        lost = db.execute(
+            update(CampaignTask)
+            .where(
+                CampaignTask.campaign_id == campaign_id,
+                CampaignTask.status == "running",
+                CampaignTask.lease_expires_at <= now,
+                CampaignTask.attempts >= campaign.max_attempts
+            )
+            .values(status="failed", error="lease expired", completed_at=now, lease_owner=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        in_flight = db.scalar(select(func.count()).where(
+            CampaignTask.campaign_id == campaign_id,
+            CampaignTask.status == "running",
+            CampaignTask.lease_expires_at > now
+        ))
+        quota = min(limit, campaign.max_concurrency - in_flight)
+        if quota <= 0:
+            db.commit()
+            return []
+
+        candidates = (
+            select(CampaignTask.id)
+            .where(
+                CampaignTask.campaign_id == campaign_id,
+                CampaignTask.status.in_(ACTIVE_TASK_STATUSES),
+                or_(CampaignTask.lease_expires_at.is_(None), CampaignTask.lease_expires_at <= now)
+            )
+            .order_by(CampaignTask.id)
+            .limit(quota)
+            .with_for_update(skip_locked=True)
+        )
+        rows = db.execute(
+            update(CampaignTask)
+            .where(CampaignTask.id.in_(candidates))
+            .values(
+                status="running",
+                lease_owner=worker_id,
+                lease_expires_at=now + self.lease,
+                attempts=CampaignTask.attempts + 1
+            )
+            .returning(CampaignTask.id, CampaignTask.prospect_id, CampaignTask.attempts)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        if lost and not rows:
+            # That may have been the campaign's last unfinished task
+            self._finish_campaigns([campaign_id])
+        return [
+            ClaimedTask(task_id, campaign_id, prospect_id, attempts, campaign.max_attempts)
+            for task_id, prospect_id, attempts in rows
+        ]
+
+    def renew(self, worker_id: str, task_ids: List[int]):
+        """Extend the lease on tasks this worker still holds"""
+        if not task_ids:
+            return
+        with self.session_factory() as db:
+            for chunk in chunked(task_ids):
+                db.execute(
+                    update(CampaignTask)
+                    .where(
+                        CampaignTask.id.in_(chunk),
+                        CampaignTask.lease_owner == worker_id,
+                        CampaignTask.status == "running"
+                    )
+                    .values(lease_expires_at=datetime.utcnow() + self.lease)
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+
+    def release(self, worker_id: str, tasks: List[ClaimedTask]):
+        """Hand unstarted tasks back to the queue without counting an attempt"""
+        if not tasks:
+            return
+        self._write(worker_id, [
+            {"b_id": task.task_id, "b_status": "pending", "b_attempts": task.attempts - 1,
+             "b_subject": None, "b_body": None, "b_error": None, "b_completed_at": None, "b_not_before": None}
+            for task in tasks
+        ])
+
+    def complete(self, worker_id: str, results: List[tuple]):
+        """
+        Write ``(ClaimedTask, result)`` pairs in one executemany. A result
+        holds ``subject``/``body`` or an ``error``; errors are retried with
+        backoff until the campaign's ``max_attempts`` is reached.
+        """
+        if not results:
+            return
+        now = datetime.utcnow()
+        rows = []
+        for task, result in results:
+            row = {"b_id": task.task_id, "b_attempts": task.attempts, "b_subject": None, "b_body": None,
+                   "b_error": None, "b_completed_at": None, "b_not_before": None}
+            if "error" not in result:
+                row.update(b_status="succeeded", b_subject=(result["subject"] or "")[:200], b_body=result["body"], b_completed_at=now)
+            elif task.attempts >= task.max_attempts:
+                row.update(b_status="failed", b_error=str(result["error"]), b_completed_at=now)
+            else:
+                delay = min(RETRY_DELAY * 2 ** (task.attempts - 1), MAX_RETRY_DELAY)
+                row.update(b_status="pending", b_error=str(result["error"]), b_not_before=now + delay)
+            rows.append(row)
+        self._write(worker_id, rows)
+        self._finish_campaigns({task.campaign_id for task, _ in results})
+
+    def _write(self, worker_id: str, rows: List[Dict]):
+        tasks = CampaignTask.__table__
+        # Only the current lease holder may write; a task reclaimed after its
+        # lease expired belongs to the new worker
+        stmt = (
+            tasks.update()
+            .where(tasks.c.id == bindparam("b_id"), tasks.c.lease_owner == worker_id, tasks.c.status == "running")
+            .values(
+                status=bindparam("b_status"),
+                attempts=bindparam("b_attempts"),
+                subject=bindparam("b_subject"),
+                body=bindparam("b_body"),
+                error=bindparam("b_error"),
+                completed_at=bindparam("b_completed_at"),
+                lease_expires_at=bindparam("b_not_before"),
+                lease_owner=None
+            )
+        )
+        with self.session_factory() as db:
+            db.execute(stmt, rows)
+            db.commit()
+
+    def _finish_campaigns(self, campaign_ids):
+        active = exists().where(
+            CampaignTask.campaign_id == Campaign.id,
+            CampaignTask.status.in_(ACTIVE_TASK_STATUSES)
+        )
+        with self.session_factory() as db:
+            db.execute(
+                update(Campaign)
+                .where(Campaign.id.in_(list(campaign_ids)), Campaign.status == "running", ~active)
+                .values(status="completed", completed_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+
+
+class CampaignWorker:
+    """
+    Claims batches of tasks and generates their emails concurrently,
+    flushing results every ``flush_size`` emails or ``flush_interval``
+    seconds and renewing the lease on the rest of the batch as it goes.
+    """
+
+    def __init__(
+        self,
+        service,
+        queue: Optional[CampaignQueue] = None,
+        session_factory=SessionLocal,
+        worker_id: Optional[str] = None,
+        batch_size: int = 32,
+        flush_size: int = 50,
+        flush_interval: float = 5.0,
+        poll_interval: float = 2.0
+    ):
+        self.service = service
+        self.queue = queue or CampaignQueue(session_factory)
+        self.session_factory = session_factory
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.batch_size = batch_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.stats = {"batches": 0, "succeeded": 0, "errors": 0}
+
+    async def run(self, stop: asyncio.Event):
+        """Process batches until ``stop`` is set, finishing the batch in hand"""
+        while not stop.is_set():
+            if await self.run_once() == 0:
+                try:
+                    await asyncio.wait_for(stop.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run_once(self) -> int:
+        """Claim and process one batch; returns the number of tasks processed"""
+        tasks = await asyncio.to_thread(self.queue.claim, self.worker_id, self.batch_size)
+        if not tasks:
+            return 0
+        self.stats["batches"] += 1
+
+        by_campaign = defaultdict(list)
+        for task in tasks:
+            by_campaign[task.campaign_id].append(task)
+        await asyncio.gather(*(self._process(campaign_id, group) for campaign_id, group in by_campaign.items()))
+        return len(tasks)
+
+    async def _process(self, campaign_id: int, tasks: List[ClaimedTask]):
+        by_prospect = {task.prospect_id: task for task in tasks}
+        buffer = []
+        last_flush = time.monotonic()
+
+        async def flush():
+            nonlocal buffer, last_flush
+            batch, buffer, last_flush = buffer, [], time.monotonic()
+            await asyncio.to_thread(self.queue.complete, self.worker_id, batch)
+            await asyncio.to_thread(self.queue.renew, self.worker_id, [task.task_id for task in by_prospect.values()])
+
+        with self.session_factory() as db:
+            campaign = db.get(Campaign, campaign_id)
+            try:
+                async for result in self.service.generate_batch(
+                    db, list(by_prospect), campaign.template_id, campaign.additional_context
+                ):
+                    task = by_prospect.pop(result["prospect_id"], None)
+                    if task is None:
+                        continue
+                    buffer.append((task, result))
+                    self.stats["errors" if "error" in result else "succeeded"] += 1
+                    if len(buffer) >= self.flush_size or time.monotonic() - last_flush >= self.flush_interval:
+                        await flush()
+            except ValueError as e:
+                # e.g. the template was deleted after the campaign was created
+                buffer.extend((task, {"error": str(e)}) for task in by_prospect.values())
+                by_prospect.clear()
+            except BaseException:
+                # Give unfinished tasks back immediately rather than waiting for the lease
+                await asyncio.to_thread(self.queue.complete, self.worker_id, buffer)
+                await asyncio.to_thread(self.queue.release, self.worker_id, list(by_prospect.values()))
+                raise
+        await asyncio.to_thread(self.queue.complete, self.worker_id, buffer)
+
+
+def _worker_process(index: int, batch_size: int, lease_seconds: float, poll_interval: float):
+    from app.services.email_service import get_email_service
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    worker = CampaignWorker(
+        get_email_service(),
+        queue=CampaignQueue(lease_seconds=lease_seconds),
+        worker_id=f"{socket.gethostname()}:{os.getpid()}:{index}",
+        batch_size=batch_size,
+        poll_interval=poll_interval
+    )
+
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        logger.info("Campaign worker %s started", worker.worker_id)
+        await worker.run(stop)
+        logger.info("Campaign worker %s stopped: %s", worker.worker_id, worker.stats)
+
+    asyncio.run(main())
+
+
+def run_worker_pool(processes: int = 2, batch_size: int = 32, lease_seconds: float = 300.0, poll_interval: float = 2.0):
+    """Run ``processes`` worker processes until interrupted"""
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=_worker_process, args=(i, batch_size, lease_seconds, poll_interval), name=f"campaign-worker-{i}")
+        for i in range(processes)
+    ]
+    for process in workers:
+        process.start()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        # Workers treat SIGTERM as "stop after the current batch"
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        for process in workers:
+            process.join()
+
+
+if __name__ == "__main__":
+    from app.database.migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Run campaign generation workers")
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=32, help="Tasks claimed per worker per batch")
+    parser.add_argument("--lease-seconds", type=float, default=300.0)
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    args = parser.parse_args()
+
+    run_migrations()
+    run_worker_pool(args.processes, args.batch_size, args.lease_seconds, args.poll_interval)
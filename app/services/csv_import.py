@@ -0,0 +1,323 @@
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+from datetime import datetime
+import codecs
+import csv
+import math
+import os
+import threading
+import uuid
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.database.database import chunked, dialect_insert
+from app.models.models import Company, Prospect
+
+# CSV column -> Prospect column
+PROSPECT_COLUMNS = {
+    "name": "name",
+    "email": "email",
+    "title": "position",
+    "linkedin": "linkedin_url",
+}
+
+# CSV column -> Company column
+COMPANY_COLUMNS = {
+    "industry": "industry",
+    "website": "website",
+    "company_description": "description",
+}
+
+REQUIRED_COLUMNS = ("name", "email", "company")
+
+# Only the first N rejected rows are reported back in detail
+MAX_REPORTED_ERRORS = 100
+
+# Bytes read from the upload per chunk
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def _clean(value) -> Optional[str]:
+    """Normalize a raw CSV cell: NaN/empty -> None, everything else -> stripped str"""
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _iter_lines(fileobj: BinaryIO, chunk_size: int) -> Iterator[str]:
+    """Decode a binary file in fixed-size chunks and yield complete text lines"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    while True:
+        chunk = fileobj.read(chunk_size)
+        pending += decoder.decode(chunk, final=not chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+
+class CSVStream:
+    """
+    Incremental CSV reader over a binary file object.
+
+    Only one chunk of raw bytes plus the current record are held in memory;
+    quoted fields spanning several lines are handled by the csv module.
+    """
+
+    def __init__(self, fileobj: BinaryIO, chunk_size: int = READ_CHUNK_SIZE):
+        self.reader = csv.DictReader(_iter_lines(fileobj, chunk_size))
+        self.rows_parsed = 0
+
+    @property
+    def fieldnames(self) -> List[str]:
+        return self.reader.fieldnames or []
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in self.reader:
+            self.rows_parsed += 1
+            yield row
+
+
+class ImportBatchError(Exception):
+    """
+    A batch failed to write (e.g. a constraint or type error from the CSV's
+    contents). The batch was rolled back; earlier batches stay committed and
+    are counted in ``result``.
+    """
+
+    def __init__(self, first_row: int, last_row: int, result: Dict, error: SQLAlchemyError):
+        super().__init__(f"Rows {first_row}-{last_row} could not be imported: {getattr(error, 'orig', None) or error}")
+        self.first_row = first_row
+        self.last_row = last_row
+        self.result = result
+
+
+class ProspectImportService:
+    """
+    Set-based ingestion of prospect rows into the companies/prospects tables.
+
+    Rows are processed in batches: the distinct company names of a batch are
+    resolved with one query, missing companies are created with a single
+    multi-row insert and prospects are written with one batched upsert on the
+    unique ``email`` column. Each batch is committed on its own so the write
+    lock is only held for the duration of one batch.
+    """
+
+    def __init__(self, db: Session, batch_size: int = 5000, update_existing: bool = False):
+        self.db = db
+        self.batch_size = batch_size
+        self.update_existing = update_existing
+        self.stats = {"rows": 0, "inserted": 0, "updated": 0, "rejected": 0}
+        self.errors: List[Dict] = []
+
+    def ingest(self, rows: Iterable[Dict]) -> Dict:
+        """
+        Ingest an iterable of CSV rows (dicts keyed by CSV header).
+        Rejected rows are reported by their 1-based position after the header.
+        A batch the database refuses raises ``ImportBatchError``.
+        """
+        batch = []
+        for row_number, row in enumerate(rows, start=1):
+            batch.append((row_number, row))
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+        return self.result()
+
+    def _write_batch(self, batch: List[tuple]):
+        stats, reported = dict(self.stats), len(self.errors)
+        try:
+            self._ingest_batch(batch)
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            # Nothing from the failed batch was written, so none of it is counted
+            self.stats = stats
+            del self.errors[reported:]
+            raise ImportBatchError(batch[0][0], batch[-1][0], self.result(), e) from e
+
+    def result(self) -> Dict:
+        return {**self.stats, "errors": self.errors}
+
+    def _reject(self, row_number: int, reason: str):
+        self.stats["rejected"] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "reason": reason})
+
+    def _ingest_batch(self, batch: List[tuple]):
+        self.stats["rows"] += len(batch)
+
+        # Validate rows and drop duplicates within the batch
+        valid = {}
+        for row_number, raw in batch:
+            row = {key: _clean(raw.get(key)) for key in (*PROSPECT_COLUMNS, "company", *COMPANY_COLUMNS)}
+            missing = [col for col in REQUIRED_COLUMNS if not row[col]]
+            if missing:
+                self._reject(row_number, f"Missing required column(s): {', '.join(missing)}")
+                continue
+            if "@" not in row["email"]:
+                self._reject(row_number, f"Invalid email: {row['email']}")
+                continue
+            if row["email"] in valid:
+                self._reject(row_number, f"Duplicate email in file: {row['email']}")
+                continue
+            valid[row["email"]] = (row_number, row)
+
+        if not valid:
+            return
+
+        company_ids = self._resolve_companies(row for _, row in valid.values())
+        existing = self._existing_emails(list(valid))
+
+        to_insert, to_update = [], []
+        for email, (row_number, row) in valid.items():
+            values = {column: row[key] for key, column in PROSPECT_COLUMNS.items()}
+            values["company_id"] = company_ids[row["company"]]
+            if email not in existing:
+                to_insert.append(values)
+            elif self.update_existing:
+                to_update.append(values)
+            else:
+                self._reject(row_number, f"Prospect with email already exists: {email}")
+
+        if to_insert:
+            stmt = dialect_insert(self.db, Prospect).on_conflict_do_nothing(index_elements=["email"])
+            inserted = set(self.db.scalars(stmt.returning(Prospect.email), to_insert))
+            self.stats["inserted"] += len(inserted)
+            # Emails a concurrent import inserted after the lookup above
+            for values in to_insert:
+                if values["email"] not in inserted:
+                    self._reject(valid[values["email"]][0], f"Prospect with email already exists: {values['email']}")
+
+        if to_update:
+            self.db.execute(
+                update(Prospect),
+                [{"id": existing[values["email"]], **values} for values in to_update]
+            )
+            self.stats["updated"] += len(to_update)
+
+        self.db.commit()
+
+    def _resolve_companies(self, rows: Iterable[Dict]) -> Dict[str, int]:
+        """Map every company name in ``rows`` to an id, creating missing companies"""
+        new_companies = {}
+        for row in rows:
+            if row["company"] not in new_companies:
+                new_companies[row["company"]] = {
+                    "name": row["company"],
+                    **{column: row[key] for key, column in COMPANY_COLUMNS.items()}
+                }
+
+        names = list(new_companies)
+        company_ids = self._company_ids(names)
+        missing = [new_companies[name] for name in names if name not in company_ids]
+        if missing:
+            self.db.execute(dialect_insert(self.db, Company).values(missing))
+            company_ids.update(self._company_ids([c["name"] for c in missing]))
+        return company_ids
+
+    def _company_ids(self, names: List[str]) -> Dict[str, int]:
+        ids = {}
+        for chunk in chunked(names):
+            # Company.name is not unique; keep the oldest row like the per-row lookup did
+            rows = self.db.execute(
+                select(Company.name, Company.id).where(Company.name.in_(chunk)).order_by(Company.id.desc())
+            )
+            ids.update({name: company_id for name, company_id in rows})
+        return ids
+
+    def _existing_emails(self, emails: List[str]) -> Dict[str, int]:
+        existing = {}
+        for chunk in chunked(emails):
+            rows = self.db.execute(select(Prospect.email, Prospect.id).where(Prospect.email.in_(chunk)))
+            existing.update({email: prospect_id for email, prospect_id in rows})
+        return existing
+
+
+class ImportJob:
+    """Progress of a background CSV import"""
+
+    def __init__(self, filename: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = "pending"  # pending, running, completed, failed
+        self.rows_parsed = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.importer: Optional[ProspectImportService] = None
+        self.stream: Optional[CSVStream] = None
+
+    def to_dict(self) -> Dict:
+        stats = self.importer.result() if self.importer else {}
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "rows_parsed": self.stream.rows_parsed if self.stream else self.rows_parsed,
+            "inserted": stats.get("inserted", 0),
+            "updated": stats.get("updated", 0),
+            "rejected": stats.get("rejected", 0),
+            "errors": stats.get("errors", []),
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+# Finished jobs beyond this number are forgotten, oldest first
+MAX_TRACKED_JOBS = 100
+
+_jobs: Dict[str, ImportJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def create_import_job(filename: str) -> ImportJob:
+    job = ImportJob(filename)
+    with _jobs_lock:
+        finished = [j for j in _jobs.values() if j.finished_at]
+        for old in finished[:max(0, len(_jobs) - MAX_TRACKED_JOBS + 1)]:
+            del _jobs[old.id]
+        _jobs[job.id] = job
+    return job
+
+
+def get_import_job(job_id: str) -> Optional[ImportJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def run_import_job(job: ImportJob, path: str, session_factory, update_existing: bool = False):
+    """
+    Stream the spooled CSV at ``path`` into the database, updating ``job`` as
+    batches are committed. The file is removed once the import finishes.
+    """
+    db = session_factory()
+    job.status = "running"
+    try:
+        with open(path, "rb") as f:
+            job.stream = CSVStream(f)
+            missing = [col for col in REQUIRED_COLUMNS if col not in job.stream.fieldnames]
+            if missing:
+                raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+            job.importer = ProspectImportService(db, update_existing=update_existing)
+            job.importer.ingest(job.stream)
+        job.status = "completed"
+    except Exception as e:
+        db.rollback()
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        job.finished_at = datetime.utcnow()
+        db.close()
+        os.remove(path)
@@ -1,15 +1,152 @@
-from typing import Optional, Dict
-import openai
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional
+import asyncio
+import random
+import time
 from datetime import datetime
-from sqlalchemy.orm import Session
+from functools import lru_cache
+import os
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, joinedload
 
+from app.database.database import chunked
 from app.models.models import Prospect, Company, EmailTemplate
 from app.schemas.schemas import EmailTemplateCreate
+from app.services.llm_cache import LLMCache, cache_key, llm_cache
+from app.services.metrics import llm_retries, record_llm_call
+from app.services.prompt_builder import PromptBuilder, count_tokens
+from app.services.rate_limiter import RateLimiter
+
+if TYPE_CHECKING:
+    import openai
+
+EMAIL_MODEL = "gpt-4"
+EMAIL_SYSTEM_PROMPT = "You are an expert sales email writer who creates highly personalized and effective outreach emails."
+VARIANT_SYSTEM_PROMPT = "You are an expert in email marketing and A/B testing."
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class EmailStreamParser:
+    """
+    Incremental parser for the ``SUBJECT: ... / BODY: ...`` completion format.
+
+    ``feed`` takes text as it arrives and returns events: ``("subject", text)``
+    once the subject line is complete and ``("body", delta)`` for body text,
+    which is passed through as soon as it is received.
+    """
+
+    def __init__(self):
+        self.subject = ""
+        self.body = ""
+        self._buffer = ""
+        self._in_body = False
+
+    def feed(self, text: str) -> List[tuple]:
+        if self._in_body:
+            return self._body_events(text)
+
+        events = []
+        self._buffer += text
+        while "\n" in self._buffer and not self._in_body:
+            line, self._buffer = self._buffer.split("\n", 1)
+            events.extend(self._line_events(line, complete=True))
+        if not self._in_body and self._buffer.lstrip().startswith("BODY:"):
+            line, self._buffer = self._buffer, ""
+            events.extend(self._line_events(line, complete=False))
+        if self._in_body and self._buffer:
+            rest, self._buffer = self._buffer, ""
+            events.extend(self._body_events(rest))
+        return events
+
+    def close(self) -> List[tuple]:
+        """Flush a trailing partial line once the stream has ended"""
+        events = []
+        if self._buffer and not self._in_body:
+            line, self._buffer = self._buffer, ""
+            events.extend(self._line_events(line, complete=True))
+        self.body = self.body.rstrip()
+        return events
+
+    def _line_events(self, line: str, complete: bool) -> List[tuple]:
+        stripped = line.lstrip()
+        if stripped.startswith("SUBJECT:") and complete:
+            self.subject = stripped[len("SUBJECT:"):].strip()
+            return [("subject", self.subject)]
+        if stripped.startswith("BODY:"):
+            self._in_body = True
+            rest = stripped[len("BODY:"):] + ("\n" if complete else "")
+            return self._body_events(rest)
+        return []
+
+    def _body_events(self, text: str) -> List[tuple]:
+        if not self.body:
+            text = text.lstrip()
+        if not text:
+            return []
+        self.body += text
+        return [("body", text)]
+
 
 class EmailPersonalizationService:
-    def __init__(self, openai_api_key: str):
+    def __init__(
+        self,
+        openai_api_key: str,
+        base_url: Optional[str] = None,
+        max_concurrency: int = 8,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 150000,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        cache: Optional[LLMCache] = llm_cache,
+        prompt_token_budget: int = 1500
+    ):
         self.openai_api_key = openai_api_key
-        openai.api_key = openai_api_key
+        self.base_url = base_url
+        # openai is imported on first use: it costs more at startup than the rest of the app
+        import openai
+        # Retries are handled by _create so they show up in the metrics
+        self.client = openai.OpenAI(api_key=openai_api_key, base_url=base_url, max_retries=0)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.cache = cache
+        self.prompt_builder = PromptBuilder(prompt_token_budget, EMAIL_MODEL)
+        self.prompt_stats = {"emails": 0, "prompt_tokens": 0, "tokens_saved": 0}
+        self._async_client = None
+
+    @property
+    def async_client(self) -> "openai.AsyncOpenAI":
+        # Created lazily so it binds to the event loop that actually uses it.
+        # Retries are handled by _complete_async so they share the rate limiter.
+        if self._async_client is None:
+            import openai
+            self._async_client = openai.AsyncOpenAI(
+                api_key=self.openai_api_key,
+                base_url=self.base_url,
+                max_retries=0
+            )
+        return self._async_client
+
+    def _build_email_prompt(
+        self,
+        prospect: Prospect,
+        company: Company,
+        template: EmailTemplate,
+        additional_context: Optional[Dict] = None
+    ) -> tuple[List[Dict], Dict]:
+        """
+        Build the token-budgeted personalization messages for a prospect
+        """
+        messages, report = self.prompt_builder.build_email_prompt(
+            prospect, company, template, EMAIL_SYSTEM_PROMPT, additional_context
+        )
+        self.prompt_stats["emails"] += 1
+        self.prompt_stats["prompt_tokens"] += report["prompt_tokens"]
+        self.prompt_stats["tokens_saved"] += report["tokens_saved"]
+        return messages, report
 
     def generate_personalized_email(
         self,
@@ -21,156 +158,407 @@ class EmailPersonalizationService:
         """
         Generate a personalized email using OpenAI's API
         """
-        # Prepare context for the AI
-        context = {
-            "prospect": {
-                "name": prospect.name,
-                "position": prospect.position,
-                "company": company.name,
-                "industry": company.industry
-            },
-            "company": {
-                "name": company.name,
-                "industry": company.industry,
-                "description": company.description,
-                "key_insights": company.key_insights,
-                "market_position": company.market_position
-            },
-            "template": {
-                "subject": template.subject,
-                "body": template.body
-            }
-        }
-
-        if additional_context:
-            context.update(additional_context)
-
-        # Create the prompt for OpenAI
-        prompt = f"""
-        Generate a personalized email based on the following context:
-        
-        Prospect Information:
-        - Name: {context['prospect']['name']}
-        - Position: {context['prospect']['position']}
-        - Company: {context['prospect']['company']}
-        - Industry: {context['prospect']['industry']}
-        
-        Company Information:
-        - Name: {context['company']['name']}
-        - Industry: {context['company']['industry']}
-        - Description: {context['company']['description']}
-        - Key Insights: {context['company']['key_insights']}
-        - Market Position: {context['company']['market_position']}
-        
-        Base Template:
-        Subject: {context['template']['subject']}
-        Body: {context['template']['body']}
-        
-        Please generate a personalized version of this email that:
-        1. References specific details about the prospect's company and role
-        2. Includes relevant industry insights
-        3. Maintains a professional yet conversational tone
-        4. Focuses on value proposition relevant to their position
-        5. Includes a clear call to action
-        
-        Format the response as:
-        SUBJECT: [personalized subject]
-        BODY: [personalized body]
-        """
+        messages, prompt_report = self._build_email_prompt(prospect, company, template, additional_context)
 
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert sales email writer who creates highly personalized and effective outreach emails."},
-                    {"role": "user", "content": prompt}
-                ],
+            email_content = self._complete(
+                messages=messages,
                 temperature=0.7,
-                max_tokens=1000
+                max_tokens=1000,
+                cache_tags={"company_id": company.id, "template_id": template.id}
             )
 
             # Parse the response
-            email_content = response.choices[0].message.content
             subject, body = self._parse_email_content(email_content)
 
             return {
                 "subject": subject,
                 "body": body,
-                "generated_at": datetime.utcnow()
+                "generated_at": datetime.utcnow(),
+                "prompt_report": prompt_report
             }
 
         except Exception as e:
             raise Exception(f"Failed to generate personalized email: {str(e)}")
 
-    def _parse_email_content(self, content: str) -> tuple[str, str]:
+    async def generate_batch(
+        self,
+        db: Session,
+        prospect_ids: List[int],
+        template_id: int,
+        additional_context: Optional[Dict] = None
+    ) -> AsyncIterator[Dict]:
         """
-        Parse the AI-generated email content into subject and body
+        Generate personalized emails for many prospects concurrently.
+
+        Requests run with at most ``max_concurrency`` in flight and respect the
+        requests/min and tokens/min limits. Results are yielded as they
+        complete, not in input order; a failed prospect yields an ``error``
+        entry instead of aborting the batch.
         """
-        lines = content.split('\n')
-        subject = ""
-        body = []
-        body_started = False
+        def load():
+            template = db.query(EmailTemplate).filter(EmailTemplate.id == template_id).first()
+            prospects = {}
+            for chunk in chunked(list(prospect_ids)):
+                prospects.update(
+                    (p.id, p) for p in db.query(Prospect)
+                    .options(joinedload(Prospect.company))
+                    .filter(Prospect.id.in_(chunk))
+                )
+            return template, prospects
+
+        # Blocking queries; a large batch would otherwise stall the event loop
+        template, prospects = await asyncio.to_thread(load)
+        if template is None:
+            raise ValueError(f"Email template {template_id} not found")
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def generate_one(prospect_id: int) -> Dict:
+            prospect = prospects.get(prospect_id)
+            if prospect is None or prospect.company is None:
+                return {"prospect_id": prospect_id, "error": "Prospect or company not found"}
 
-        for line in lines:
-            if line.startswith("SUBJECT:"):
-                subject = line.replace("SUBJECT:", "").strip()
-            elif line.startswith("BODY:"):
-                body_started = True
-            elif body_started and line.strip():
-                body.append(line)
+            messages, prompt_report = self._build_email_prompt(
+                prospect, prospect.company, template, additional_context
+            )
+            async with semaphore:
+                try:
+                    email_content = await self._complete_async(
+                        messages=messages,
+                        temperature=0.7,
+                        max_tokens=1000,
+                        cache_tags={"company_id": prospect.company_id, "template_id": template.id}
+                    )
+                except Exception as e:
+                    return {"prospect_id": prospect_id, "error": f"Failed to generate personalized email: {str(e)}"}
 
-        return subject, '\n'.join(body)
+            subject, body = self._parse_email_content(email_content)
+            return {
+                "prospect_id": prospect_id,
+                "subject": subject,
+                "body": body,
+                "generated_at": datetime.utcnow(),
+                "prompt_report": prompt_report
+            }
 
-    def create_template_variants(
+        tasks = [asyncio.ensure_future(generate_one(pid)) for pid in prospect_ids]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def stream_personalized_email(
         self,
-        base_template: EmailTemplate,
-        num_variants: int = 2
-    ) -> list[EmailTemplateCreate]:
+        prospect: Prospect,
+        company: Company,
+        template: EmailTemplate,
+        additional_context: Optional[Dict] = None
+    ) -> AsyncIterator[tuple]:
         """
-        Create A/B testing variants of an email template
+        Stream a personalized email as ``(event, data)`` pairs: ``subject``
+        once the subject line is parsed, ``body`` deltas as tokens arrive and a
+        final ``done`` with the complete email. Cached emails are replayed.
         """
-        variants = []
-        for i in range(num_variants):
-            prompt = f"""
+        messages, prompt_report = self._build_email_prompt(prospect, company, template, additional_context)
+        key = cache_key(messages, EMAIL_MODEL, 0.7, 1000)
+        parser = EmailStreamParser()
+
+        cached = await asyncio.to_thread(self.cache.get, key) if self.cache is not None else None
+        if cached is not None:
+            for event in parser.feed(cached) + parser.close():
+                yield event
+        else:
+            stream = await self._create_async(messages, 0.7, 1000, stream=True)
+            content = []
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    content.append(delta)
+                    for event in parser.feed(delta):
+                        yield event
+            for event in parser.close():
+                yield event
+            if self.cache is not None:
+                await asyncio.to_thread(
+                    self.cache.set, key, "".join(content), model=EMAIL_MODEL,
+                    company_id=company.id, template_id=template.id
+                )
+
+        yield ("done", {
+            "subject": parser.subject,
+            "body": parser.body,
+            "generated_at": datetime.utcnow(),
+            "prompt_report": prompt_report
+        })
+
+    def _complete(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        cache_tags: Optional[Dict] = None,
+        **key_extra
+    ) -> str:
+        """
+        Chat completion served from the LLM cache when the same rendered
+        request was answered before. ``key_extra`` distinguishes requests
+        that share a prompt but must not share a result (e.g. A/B variants).
+        """
+        key = cache_key(messages, EMAIL_MODEL, temperature, max_tokens, **key_extra)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        response = self._create(
+            "complete",
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        content = response.choices[0].message.content
+
+        if self.cache is not None:
+            self.cache.set(key, content, model=EMAIL_MODEL, **(cache_tags or {}))
+        return content
+
+    async def _complete_n(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        variants: List[int],
+        cache_tags: Optional[Dict] = None
+    ) -> Dict[int, str]:
+        """
+        Several completions of the same prompt in one request via ``n``.
+        Each choice is cached under its own variant key, so results are
+        interchangeable with those produced by ``_complete(..., variant=i)``.
+        """
+        keys = {i: cache_key(messages, EMAIL_MODEL, temperature, max_tokens, variant=i) for i in variants}
+        results = {}
+        if self.cache is not None:
+            for i, key in keys.items():
+                cached = await asyncio.to_thread(self.cache.get, key)
+                if cached is not None:
+                    results[i] = cached
+
+        missing = [i for i in variants if i not in results]
+        if missing:
+            response = await self._create_async(messages, temperature, max_tokens, n=len(missing))
+            for i, choice in zip(missing, response.choices):
+                results[i] = choice.message.content
+                if self.cache is not None:
+                    await asyncio.to_thread(self.cache.set, keys[i], results[i], model=EMAIL_MODEL, **(cache_tags or {}))
+        return results
+
+    async def _complete_async(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        cache_tags: Optional[Dict] = None,
+        **key_extra
+    ) -> str:
+        """
+        Cached, rate-limited chat completion with jittered exponential backoff
+        on 429s, 5xx responses and connection errors
+        """
+        key = cache_key(messages, EMAIL_MODEL, temperature, max_tokens, **key_extra)
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return cached
+
+        response = await self._create_async(messages, temperature, max_tokens)
+        content = response.choices[0].message.content
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.set, key, content, model=EMAIL_MODEL, **(cache_tags or {}))
+        return content
+
+    async def _create_async(self, messages: List[Dict], temperature: float, max_tokens: int, **kwargs):
+        """
+        Rate-limited ``chat.completions.create`` with jittered exponential
+        backoff. With ``stream=True`` only opening the stream is retried.
+        """
+        import openai
+        # Prompt size plus the completion budget
+        estimated_tokens = sum(count_tokens(m["content"], EMAIL_MODEL) for m in messages) + max_tokens
+
+        operation = "stream" if kwargs.get("stream") else "create_async"
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire(estimated_tokens)
+            started = time.perf_counter()
+            try:
+                response = await self.async_client.chat.completions.create(
+                    model=EMAIL_MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **kwargs
+                )
+            except (openai.APIStatusError, openai.APIConnectionError) as e:
+                status = getattr(e, "status_code", None)
+                record_llm_call(operation, time.perf_counter() - started, outcome=str(status or "connection_error"))
+                retryable = status is None or status in RETRYABLE_STATUS_CODES
+                if not retryable or attempt == self.max_retries:
+                    raise
+                llm_retries.inc(reason=str(status or "connection_error"))
+                await asyncio.sleep(self._backoff_delay(attempt, e))
+            else:
+                # Streams report no usage; their latency is time to open the stream
+                record_llm_call(operation, time.perf_counter() - started, usage=getattr(response, "usage", None))
+                return response
+
+    def _create(self, operation: str, **kwargs):
+        """
+        Blocking ``chat.completions.create`` on the sync client with the same
+        jittered backoff as ``_create_async``, recorded in the metrics
+        registry. Not rate limited: batch work goes through the async path.
+        """
+        import openai
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(model=EMAIL_MODEL, **kwargs)
+            except (openai.APIStatusError, openai.APIConnectionError) as e:
+                status = getattr(e, "status_code", None)
+                record_llm_call(operation, time.perf_counter() - started, outcome=str(status or "connection_error"))
+                retryable = status is None or status in RETRYABLE_STATUS_CODES
+                if not retryable or attempt == self.max_retries:
+                    raise
+                llm_retries.inc(reason=str(status or "connection_error"))
+                time.sleep(self._backoff_delay(attempt, e))
+            except openai.OpenAIError:
+                record_llm_call(operation, time.perf_counter() - started, outcome="error")
+                raise
+            else:
+                record_llm_call(operation, time.perf_counter() - started, usage=response.usage)
+                return response
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """Full-jitter backoff, honouring Retry-After when the server sends it"""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _parse_email_content(self, content: str) -> tuple[str, str]:
+        """
+        Parse the AI-generated email content into subject and body
+        """
+        parser = EmailStreamParser()
+        parser.feed(content)
+        parser.close()
+        return parser.subject, parser.body
+
+    def _build_variant_prompt(self, base_template: EmailTemplate) -> str:
+        return f"""
             Create a variant of this email template for A/B testing:
-            
+
             Original Subject: {base_template.subject}
             Original Body: {base_template.body}
-            
+
             Create a variant that:
             1. Maintains the same core message
             2. Uses different wording and structure
             3. Tests different value propositions
             4. Has a different call to action
-            
+
             Format the response as:
             SUBJECT: [variant subject]
             BODY: [variant body]
             """
 
+    async def create_template_variants(
+        self,
+        base_template: EmailTemplate,
+        num_variants: int = 2,
+        fan_out: int = 4,
+        use_n: bool = False
+    ) -> Dict:
+        """
+        Create A/B testing variants of an email template.
+
+        Variants are requested concurrently, ``fan_out`` at a time, or with a
+        single request using the API's ``n`` parameter when ``use_n`` is set.
+        Both share the rate limiter and backoff of ``_create_async``.
+        A failed variant doesn't discard the others: the result holds the
+        successful ``variants`` plus per-variant ``errors``.
+        """
+        messages = [
+            {"role": "system", "content": VARIANT_SYSTEM_PROMPT},
+            {"role": "user", "content": self._build_variant_prompt(base_template)}
+        ]
+        cache_tags = {"company_id": base_template.company_id, "template_id": base_template.id}
+        contents, errors = {}, []
+
+        if use_n:
             try:
-                response = openai.ChatCompletion.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "You are an expert in email marketing and A/B testing."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.8,
-                    max_tokens=1000
-                )
+                contents = await self._complete_n(messages, 0.8, 1000, list(range(num_variants)), cache_tags)
+            except Exception as e:
+                errors = [
+                    {"variant": i + 1, "error": f"Failed to create template variant: {str(e)}"}
+                    for i in range(num_variants)
+                ]
+        else:
+            semaphore = asyncio.Semaphore(max(1, min(fan_out, num_variants)))
 
-                email_content = response.choices[0].message.content
-                subject, body = self._parse_email_content(email_content)
+            async def complete_one(i: int):
+                async with semaphore:
+                    try:
+                        contents[i] = await self._complete_async(messages, 0.8, 1000, cache_tags, variant=i)
+                    except Exception as e:
+                        errors.append({"variant": i + 1, "error": f"Failed to create template variant: {str(e)}"})
 
-                variants.append(EmailTemplateCreate(
-                    name=f"{base_template.name} - Variant {i+1}",
-                    subject=subject,
-                    body=body,
-                    company_id=base_template.company_id,
-                    variant=f"variant_{i+1}"
-                ))
+            await asyncio.gather(*(complete_one(i) for i in range(num_variants)))
+
+        variants = []
+        for i in range(num_variants):
+            if i not in contents:
+                if not any(error["variant"] == i + 1 for error in errors):
+                    errors.append({"variant": i + 1, "error": "No completion returned for variant"})
+                continue
+            subject, body = self._parse_email_content(contents[i])
+            variants.append(EmailTemplateCreate(
+                name=f"{base_template.name} - Variant {i+1}",
+                subject=subject,
+                body=body,
+                company_id=base_template.company_id,
+                variant=f"variant_{i+1}"
+            ))
+
+        return {"variants": variants, "errors": sorted(errors, key=lambda error: error["variant"])}
+
+    def save_template_variants(self, db: Session, variants: List[EmailTemplateCreate]) -> List[EmailTemplate]:
+        """
+        Persist generated variants with one multi-row insert
+        """
+        if not variants:
+            return []
+        templates = db.scalars(
+            insert(EmailTemplate).returning(EmailTemplate),
+            [variant.dict() for variant in variants]
+        ).all()
+        # RETURNING loaded every column; detached, the commit can't expire them into a SELECT per row
+        for template in templates:
+            db.expunge(template)
+        db.commit()
+        return templates
 
-            except Exception as e:
-                raise Exception(f"Failed to create template variant: {str(e)}")
 
-        return variants 
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_email_service() -> EmailPersonalizationService:
+    """Shared service configured from the environment (FastAPI dependency)"""
+    return EmailPersonalizationService(
+        openai_api_key=os.getenv("OPENAI_API_KEY", ""),
+        base_url=os.getenv("OPENAI_BASE_URL") or None,
+        prompt_token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", 1500))
+    )
@@ -0,0 +1,494 @@
+"""
+Company research enrichment from company websites.
+
+Fetches a few pages of each company's ``website`` concurrently over one
+pooled ``requests`` session and extracts research from them:
+``market_position`` from the home page description, ``company_bio`` from
+the about page (or the home page), ``product_info`` from the products page
+and ``funding_info`` from funding sentences on any of them.
+
+Hosts are treated politely: at most ``max_per_host`` requests in flight
+and one request start per ``min_interval`` seconds per host, and
+robots.txt is honoured. Each page's ETag/Last-Modified is kept in
+``company_pages`` and sent back as a conditional GET, so re-enrichment
+only downloads and re-extracts pages that changed. Research fields are
+written back in batches, and only where they are empty or still hold what
+enrichment wrote last, so hand-written research is never overwritten.
+
+    python -m app.services.enrichment --workers 32
+    python -m app.services.enrichment --company-id 12 --company-id 40
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+from html.parser import HTMLParser
+from itertools import zip_longest
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+import argparse
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from app.database.database import SessionLocal, chunked, dialect_insert
+from app.models.models import Company, CompanyPage
+from app.services.llm_cache import llm_cache
+# Registers the session listeners that retire cached company responses (shared with the API through Redis)
+import app.services.response_cache  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# Pages fetched per company, relative to its website; "" is the home page
+PAGES = ("", "about", "products")
+RESEARCH_FIELDS = ("company_bio", "product_info", "funding_info", "market_position")
+
+USER_AGENT = os.getenv("ENRICHMENT_USER_AGENT", "EmailPersonalizationTool-Enrichment/1.0")
+
+MAX_PAGE_BYTES = 1_000_000
+# Error bodies up to this size are read so the connection can be reused
+MAX_DRAIN_BYTES = 64 * 1024
+MAX_PARAGRAPHS = 40
+MIN_PARAGRAPH_CHARS = 40
+MAX_FIELD_CHARS = 2000
+# Company.market_position is a String(200)
+MARKET_POSITION_CHARS = 200
+
+FUNDING = re.compile(r"\b(raised|funding|series [a-h]|seed round|investors?|backed by|valuation)\b", re.IGNORECASE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class _TextExtractor(HTMLParser):
+    """Title, meta description and visible block text of an HTML page"""
+
+    SKIP = {"script", "style", "noscript", "template", "svg", "nav", "header", "footer", "form"}
+    BLOCKS = {"p", "div", "section", "article", "main", "li", "td", "h1", "h2", "h3", "h4", "blockquote", "br"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.description = None
+        self.paragraphs: List[str] = []
+        self._skipping = 0
+        self._in_title = False
+        self._buffer: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attrs = dict(attrs)
+            name = (attrs.get("name") or attrs.get("property") or "").lower()
+            if name in ("description", "og:description") and attrs.get("content") and not self.description:
+                self.description = " ".join(attrs["content"].split())
+        elif tag in self.BLOCKS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in self.BLOCKS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skipping:
+            self._buffer.append(data)
+
+    def _flush(self):
+        text = " ".join("".join(self._buffer).split())
+        self._buffer = []
+        if len(text) >= MIN_PARAGRAPH_CHARS and len(self.paragraphs) < MAX_PARAGRAPHS:
+            self.paragraphs.append(text)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def extract_page(html: str) -> Dict:
+    """The parts of a page research is built from"""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return {"title": " ".join(parser.title.split()), "description": parser.description, "paragraphs": parser.paragraphs}
+
+
+def _clip(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit - 1].rsplit(" ", 1)[0] + "…"
+
+
+def research_fields(pages: Dict[str, Optional[Dict]]) -> Dict[str, str]:
+    """Research field values derivable from a company's extracted pages, keyed by path"""
+    home, about, products = (pages.get(path) or {} for path in PAGES)
+    fields = {}
+    description = home.get("description") or about.get("description")
+    if description:
+        fields["market_position"] = _clip(description, MARKET_POSITION_CHARS)
+    bio = about.get("paragraphs") or home.get("paragraphs")
+    if bio:
+        fields["company_bio"] = _clip("\n\n".join(bio), MAX_FIELD_CHARS)
+    if products.get("paragraphs"):
+        fields["product_info"] = _clip("\n\n".join(products["paragraphs"]), MAX_FIELD_CHARS)
+    funding = [
+        sentence
+        for page in (home, about, products)
+        for paragraph in page.get("paragraphs", [])
+        for sentence in _SENTENCE_END.split(paragraph)
+        if FUNDING.search(sentence)
+    ]
+    if funding:
+        fields["funding_info"] = _clip(" ".join(dict.fromkeys(funding)), MAX_FIELD_CHARS)
+    return fields
+
+
+def page_url(website: str, path: str) -> str:
+    if "://" not in website:
+        website = f"https://{website}"
+    return urljoin(website.rstrip("/") + "/", path)
+
+
+class HostThrottle:
+    """Caps requests in flight per host and spaces out their start times"""
+
+    def __init__(self, max_per_host: int = 2, min_interval: float = 1.0):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._slots: Dict[str, threading.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @contextmanager
+    def slot(self, host: str):
+        with self._lock:
+            semaphore = self._slots.get(host)
+            if semaphore is None:
+                semaphore = self._slots[host] = threading.Semaphore(self.max_per_host)
+        with semaphore:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start.get(host, 0.0))
+                self._next_start[host] = start + self.min_interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+class PageState(NamedTuple):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: Optional[str]
+
+
+class PageResult(NamedTuple):
+    path: str
+    url: str
+    # changed, unchanged (200 with the same body), not_modified (304), missing (404/410), blocked (robots.txt), error
+    outcome: str
+    status_code: Optional[int] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    extracted: Optional[Dict] = None
+    error: Optional[str] = None
+    downloaded: int = 0
+
+
+class CompanyEnricher:
+    """
+    Fetches company websites on ``workers`` threads sharing one pooled
+    session, and writes the results back every ``batch_size`` companies.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        workers: int = 16,
+        max_per_host: int = 2,
+        min_interval: float = 1.0,
+        timeout: float = 10.0,
+        batch_size: int = 200,
+        respect_robots: bool = True
+    ):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.respect_robots = respect_robots
+        self.throttle = HostThrottle(max_per_host, min_interval)
+        # Keep-alive connections for the hosts workers are currently on, up to max_per_host each
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers * 2, pool_maxsize=max_per_host)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.http.headers["User-Agent"] = USER_AGENT
+        self._robots: Dict[str, Optional[RobotFileParser]] = {}
+        self._robots_lock = threading.Lock()
+
+    def _robots_for(self, origin: str) -> Optional[RobotFileParser]:
+        with self._robots_lock:
+            if origin in self._robots:
+                return self._robots[origin]
+        parser = None
+        try:
+            with self.throttle.slot(urlsplit(origin).netloc.lower()):
+                response = self.http.get(f"{origin}/robots.txt", timeout=self.timeout)
+            if response.status_code == 200:
+                parser = RobotFileParser()
+                parser.parse(response.text.splitlines())
+        except requests.RequestException:
+            # Unreachable robots.txt: the page fetch will surface the real error
+            pass
+        with self._robots_lock:
+            self._robots[origin] = parser
+        return parser
+
+    def _allowed(self, url: str) -> bool:
+        if not self.respect_robots:
+            return True
+        parts = urlsplit(url)
+        parser = self._robots_for(f"{parts.scheme}://{parts.netloc}")
+        return parser is None or parser.can_fetch(USER_AGENT, url)
+
+    def fetch_page(self, website: str, path: str, state: Optional[PageState] = None) -> PageResult:
+        """Conditional GET of one page; never raises for HTTP or network errors"""
+        url = page_url(website, path)
+        if not self._allowed(url):
+            return PageResult(path, url, "blocked", error="Disallowed by robots.txt")
+        headers = {}
+        if state is not None and state.etag:
+            headers["If-None-Match"] = state.etag
+        if state is not None and state.last_modified:
+            headers["If-Modified-Since"] = state.last_modified
+
+        try:
+            with self.throttle.slot(urlsplit(url).netloc.lower()):
+                with self.http.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                    status = response.status_code
+                    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+                    if status == 304:
+                        # Only meaningful as an answer to our validators; some proxies send it regardless
+                        if not headers:
+                            return PageResult(path, url, "error", status, error="Unexpected 304")
+                        return PageResult(path, url, "not_modified", status, state.etag, state.last_modified, state.content_hash)
+                    if status >= 400:
+                        if int(response.headers.get("Content-Length") or MAX_DRAIN_BYTES + 1) <= MAX_DRAIN_BYTES:
+                            response.content
+                        if status in (404, 410):
+                            return PageResult(path, url, "missing", status)
+                        return PageResult(path, url, "error", status, error=f"HTTP {status}")
+                    content_type = response.headers.get("Content-Type", "")
+                    if "html" not in content_type:
+                        return PageResult(path, url, "error", status, error=f"Not HTML: {content_type or 'no content type'}")
+                    body = bytearray()
+                    for chunk in response.iter_content(64 * 1024):
+                        body += chunk
+                        if len(body) >= MAX_PAGE_BYTES:
+                            break
+                    encoding = response.encoding if "charset" in content_type.lower() else "utf-8"
+        except requests.RequestException as e:
+            return PageResult(path, url, "error", error=str(e)[:500])
+
+        content_hash = hashlib.sha256(body).hexdigest()
+        if state is not None and state.content_hash == content_hash:
+            return PageResult(path, url, "unchanged", status, etag, last_modified, content_hash, downloaded=len(body))
+        extracted = extract_page(bytes(body).decode(encoding or "utf-8", "replace"))
+        return PageResult(path, url, "changed", status, etag, last_modified, content_hash, extracted, downloaded=len(body))
+
+    def enrich_company(self, website: str, states: Dict[str, PageState]) -> List[PageResult]:
+        return [self.fetch_page(website, path, states.get(path)) for path in PAGES]
+
+    def _targets(self, company_ids: Optional[Sequence[int]]) -> Tuple[List[Tuple[int, str]], Dict[int, Dict[str, PageState]]]:
+        with self.session_factory() as db:
+            query = select(Company.id, Company.website).where(Company.website.isnot(None), Company.website != "")
+            pages = select(CompanyPage.company_id, CompanyPage.path, CompanyPage.etag, CompanyPage.last_modified, CompanyPage.content_hash)
+            if company_ids is None:
+                targets = db.execute(query.order_by(Company.id)).all()
+                rows = db.execute(pages).all()
+            else:
+                targets, rows = [], []
+                for chunk in chunked(company_ids):
+                    targets.extend(db.execute(query.where(Company.id.in_(chunk))))
+                    rows.extend(db.execute(pages.where(CompanyPage.company_id.in_(chunk))))
+        states: Dict[int, Dict[str, PageState]] = {}
+        for company_id, path, etag, last_modified, content_hash in rows:
+            states.setdefault(company_id, {})[path] = PageState(etag, last_modified, content_hash)
+        return [(company_id, website.strip()) for company_id, website in targets], states
+
+    def run(self, company_ids: Optional[Sequence[int]] = None) -> Dict:
+        """Enrich the given companies (default: every company with a website)"""
+        started = time.perf_counter()
+        targets, states = self._targets(company_ids)
+
+        # Round-robin over hosts so workers don't queue up behind one host's politeness delay
+        by_host: Dict[str, List[Tuple[int, str]]] = {}
+        for company_id, website in targets:
+            by_host.setdefault(urlsplit(page_url(website, "")).netloc.lower(), []).append((company_id, website))
+        ordered = [target for batch in zip_longest(*by_host.values()) for target in batch if target is not None]
+
+        stats = {"companies": len(ordered), "companies_updated": 0, "bytes_downloaded": 0}
+        stats.update(dict.fromkeys(("changed", "unchanged", "not_modified", "missing", "blocked", "error"), 0))
+        pending: List[Tuple[int, List[PageResult]]] = []
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="enrichment") as pool:
+            futures = {
+                pool.submit(self.enrich_company, website, states.get(company_id, {})): company_id
+                for company_id, website in ordered
+            }
+            for future in as_completed(futures):
+                results = future.result()
+                for result in results:
+                    stats[result.outcome] += 1
+                    stats["bytes_downloaded"] += result.downloaded
+                pending.append((futures[future], results))
+                if len(pending) >= self.batch_size:
+                    stats["companies_updated"] += self.write(pending)
+                    pending = []
+        if pending:
+            stats["companies_updated"] += self.write(pending)
+
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        stats["pages_per_sec"] = round(stats["companies"] * len(PAGES) / stats["seconds"], 1) if stats["seconds"] else 0.0
+        return stats
+
+    def write(self, results: List[Tuple[int, List[PageResult]]]) -> int:
+        """Store page states and updated research for a batch of companies; returns companies updated"""
+        now = datetime.utcnow()
+        changed = {
+            company_id: pages for company_id, pages in results
+            if any(page.outcome in ("changed", "missing") for page in pages)
+        }
+        with self.session_factory() as db:
+            previous = _load_extracts(db, list(changed))
+            _upsert_pages(db, results, now)
+            updated = _update_research(db, changed, previous)
+            for company_id in updated:
+                llm_cache.invalidate(db.connection(), company_id=company_id)
+            db.commit()
+        return len(updated)
+
+    def close(self):
+        self.http.close()
+
+
+def _load_extracts(db: Session, company_ids: List[int]) -> Dict[int, Dict[str, Optional[Dict]]]:
+    extracts: Dict[int, Dict[str, Optional[Dict]]] = {}
+    for chunk in chunked(company_ids):
+        rows = db.execute(
+            select(CompanyPage.company_id, CompanyPage.path, CompanyPage.extracted)
+            .where(CompanyPage.company_id.in_(chunk))
+        )
+        for company_id, path, extracted in rows:
+            extracts.setdefault(company_id, {})[path] = extracted
+    return extracts
+
+
+def _upsert_pages(db: Session, results: List[Tuple[int, List[PageResult]]], now: datetime):
+    # Outcomes overwrite different columns; executemany needs uniform rows, so group by column set
+    groups: Dict[Tuple, List[Dict]] = {}
+    for company_id, pages in results:
+        for page in pages:
+            values = {"url": page.url, "fetched_at": now, "status_code": page.status_code, "error": page.error}
+            if page.outcome in ("changed", "unchanged", "not_modified"):
+                values.update(etag=page.etag, last_modified=page.last_modified, content_hash=page.content_hash)
+            if page.outcome == "changed":
+                values.update(extracted=page.extracted, changed_at=now)
+            elif page.outcome == "missing":
+                values.update(etag=None, last_modified=None, content_hash=None, extracted=None, changed_at=now)
+            groups.setdefault(tuple(sorted(values)), []).append({"company_id": company_id, "path": page.path, **values})
+
+    for columns, rows in groups.items():
+        stmt = dialect_insert(db, CompanyPage)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["company_id", "path"],
+            set_={column: getattr(stmt.excluded, column) for column in columns}
+        )
+        db.execute(stmt, rows)
+
+
+def _update_research(db: Session, changed: Dict[int, List[PageResult]], previous: Dict[int, Dict[str, Optional[Dict]]]) -> List[int]:
+    """
+    Write research derived from the new pages into fields that are empty or
+    still hold what the previous pages produced
+    """
+    company_ids = list(changed)
+    current = {}
+    for chunk in chunked(company_ids):
+        rows = db.execute(
+            select(Company.id, *(getattr(Company, field) for field in RESEARCH_FIELDS))
+            .where(Company.id.in_(chunk))
+        )
+        current.update({row[0]: dict(zip(RESEARCH_FIELDS, row[1:])) for row in rows})
+
+    groups: Dict[Tuple, List[Dict]] = {}
+    for company_id, pages in changed.items():
+        if company_id not in current:
+            continue
+        old_pages = previous.get(company_id, {})
+        new_pages = dict(old_pages)
+        for page in pages:
+            if page.outcome == "changed":
+                new_pages[page.path] = page.extracted
+            elif page.outcome == "missing":
+                new_pages[page.path] = None
+        old_fields, new_fields = research_fields(old_pages), research_fields(new_pages)
+        values = {
+            field: value for field, value in new_fields.items()
+            if value != current[company_id][field]
+            and (not current[company_id][field] or current[company_id][field] == old_fields.get(field))
+        }
+        if values:
+            groups.setdefault(tuple(sorted(values)), []).append({"b_id": company_id, **{f"b_{k}": v for k, v in values.items()}})
+
+    table = Company.__table__
+    updated = []
+    for columns, params in groups.items():
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(**{column: bindparam(f"b_{column}") for column in columns}),
+            params
+        )
+        updated.extend(p["b_id"] for p in params)
+    return updated
+
+
+if __name__ == "__main__":
+    from app.database.migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Fill company research fields from company websites")
+    parser.add_argument("--company-id", type=int, action="append", help="Only these companies (repeatable)")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--max-per-host", type=int, default=2, help="Requests in flight per host")
+    parser.add_argument("--min-interval", type=float, default=1.0, help="Seconds between request starts per host")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--ignore-robots", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    run_migrations()
+    enricher = CompanyEnricher(
+        workers=args.workers,
+        max_per_host=args.max_per_host,
+        min_interval=args.min_interval,
+        timeout=args.timeout,
+        respect_robots=not args.ignore_robots
+    )
+    try:
+        print(enricher.run(args.company_id))
+    finally:
+        enricher.close()
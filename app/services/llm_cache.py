@@ -0,0 +1,231 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+import hashlib
+import json
+import threading
+
+from sqlalchemy import delete, event, func, inspect, select
+
+from app.database.database import SessionLocal
+from app.models.models import Company, EmailTemplate, LLMCacheEntry
+
+# Fields that feed into generation prompts; edits to other columns keep the cache
+COMPANY_PROMPT_FIELDS = (
+    "name", "industry", "description", "company_bio", "product_info",
+    "key_insights", "market_position", "funding_info"
+)
+TEMPLATE_PROMPT_FIELDS = ("name", "subject", "body")
+
+
+def cache_key(messages: List[Dict], model: str, temperature: float, max_tokens: int, **extra) -> str:
+    """Stable content hash of a fully rendered completion request"""
+    payload = {
+        "messages": messages,
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        **extra
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier cache for LLM completions.
+
+    Lookups go to an in-process LRU first and fall back to the
+    ``llm_cache_entries`` table. Entries expire after ``ttl`` and the
+    persistent tier is trimmed to ``max_persistent_entries`` by last access.
+    Entries are tagged with the company and template they were rendered from
+    so edits to either can drop them.
+    """
+
+    def __init__(
+        self,
+        max_memory_entries: int = 1024,
+        max_persistent_entries: int = 100000,
+        ttl: timedelta = timedelta(days=7),
+        session_factory=SessionLocal,
+        evict_every: int = 100
+    ):
+        self.max_memory_entries = max_memory_entries
+        self.max_persistent_entries = max_persistent_entries
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self.evict_every = evict_every
+        self._memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+        self.counters = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0
+        }
+
+    def get(self, key: str) -> Optional[str]:
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry["expires_at"] > now:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return entry["content"]
+                del self._memory[key]
+                self.counters["evictions"] += 1
+
+        with self.session_factory() as db:
+            row = db.get(LLMCacheEntry, key)
+            if row is None or row.expires_at <= now:
+                with self._lock:
+                    self.counters["misses"] += 1
+                return None
+            row.last_accessed_at = now
+            db.commit()
+            entry = {
+                "content": row.content,
+                "company_id": row.company_id,
+                "template_id": row.template_id,
+                "expires_at": row.expires_at
+            }
+
+        with self._lock:
+            self.counters["persistent_hits"] += 1
+            self._remember(key, entry)
+        return entry["content"]
+
+    def set(
+        self,
+        key: str,
+        content: str,
+        model: Optional[str] = None,
+        company_id: Optional[int] = None,
+        template_id: Optional[int] = None
+    ):
+        now = datetime.utcnow()
+        entry = {
+            "content": content,
+            "company_id": company_id,
+            "template_id": template_id,
+            "expires_at": now + self.ttl
+        }
+        with self._lock:
+            self._remember(key, entry)
+            self._writes_since_eviction += 1
+            evict = self._writes_since_eviction >= self.evict_every
+            if evict:
+                self._writes_since_eviction = 0
+
+        with self.session_factory() as db:
+            db.merge(LLMCacheEntry(
+                key=key,
+                content=content,
+                model=model,
+                company_id=company_id,
+                template_id=template_id,
+                expires_at=entry["expires_at"],
+                last_accessed_at=now
+            ))
+            db.commit()
+            if evict:
+                self._evict_persistent(db, now)
+
+    def _remember(self, key: str, entry: Dict):
+        """Insert into the LRU tier; caller holds the lock"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _evict_persistent(self, db, now: datetime):
+        """Drop expired rows, then the least recently used beyond the size cap"""
+        evicted = db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.expires_at <= now)).rowcount
+        overflow = db.scalar(select(func.count()).select_from(LLMCacheEntry)) - self.max_persistent_entries
+        if overflow > 0:
+            oldest = select(LLMCacheEntry.key).order_by(LLMCacheEntry.last_accessed_at).limit(overflow)
+            evicted += db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.key.in_(oldest))).rowcount
+        db.commit()
+        with self._lock:
+            self.counters["evictions"] += evicted
+
+    def invalidate(self, connection=None, company_id: Optional[int] = None, template_id: Optional[int] = None):
+        """
+        Drop entries rendered from the given company or template. When called
+        from a flush, pass its ``connection`` so the delete joins that transaction.
+        """
+        with self._lock:
+            stale = [
+                key for key, entry in self._memory.items()
+                if (company_id is not None and entry["company_id"] == company_id)
+                or (template_id is not None and entry["template_id"] == template_id)
+            ]
+            for key in stale:
+                del self._memory[key]
+
+        stmt = delete(LLMCacheEntry)
+        if company_id is not None:
+            stmt = stmt.where(LLMCacheEntry.company_id == company_id)
+        else:
+            stmt = stmt.where(LLMCacheEntry.template_id == template_id)
+
+        if connection is not None:
+            removed = connection.execute(stmt).rowcount
+        else:
+            with self.session_factory() as db:
+                removed = db.execute(stmt).rowcount
+                db.commit()
+
+        with self._lock:
+            self.counters["invalidations"] += len(stale) + removed
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        with self.session_factory() as db:
+            db.execute(delete(LLMCacheEntry))
+            db.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.counters["memory_hits"] + self.counters["persistent_hits"] + self.counters["misses"]
+            hits = lookups - self.counters["misses"]
+            return {
+                **self.counters,
+                "memory_entries": len(self._memory),
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
+
+
+# Shared cache used by EmailPersonalizationService
+llm_cache = LLMCache()
+
+
+def _prompt_fields_changed(target, fields) -> bool:
+    state = inspect(target)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+@event.listens_for(Company, "after_update")
+def _invalidate_company(mapper, connection, target):
+    if _prompt_fields_changed(target, COMPANY_PROMPT_FIELDS):
+        llm_cache.invalidate(connection, company_id=target.id)
+
+
+@event.listens_for(EmailTemplate, "after_update")
+def _invalidate_template(mapper, connection, target):
+    if _prompt_fields_changed(target, TEMPLATE_PROMPT_FIELDS):
+        llm_cache.invalidate(connection, template_id=target.id)
+
+
+@event.listens_for(Company, "after_delete")
+def _invalidate_deleted_company(mapper, connection, target):
+    llm_cache.invalidate(connection, company_id=target.id)
+
+
+@event.listens_for(EmailTemplate, "after_delete")
+def _invalidate_deleted_template(mapper, connection, target):
+    llm_cache.invalidate(connection, template_id=target.id)
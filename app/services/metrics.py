@@ -0,0 +1,178 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters and histograms live in the module-level ``registry`` and are
+rendered by ``GET /metrics``. Per-request SQL and LLM time is accumulated
+on a ``RequestTimings`` held in a context variable, so work done in the
+threadpool on behalf of a request is attributed to it.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+import threading
+
+# Seconds; covers sub-millisecond queries up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _format_labels(self.labelnames, key, 'le="%s"' % le)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_number(series[-1])}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_request_duration = registry.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+http_request_db_queries = registry.counter("http_request_db_queries_total", "SQL statements executed while serving requests", ("method", "route"))
+http_request_db_seconds = registry.counter("http_request_db_seconds_total", "Time spent in SQL while serving requests", ("method", "route"))
+db_queries = registry.counter("db_queries_total", "SQL statements executed, including background work")
+db_query_duration = registry.histogram("db_query_duration_seconds", "SQL statement latency")
+db_slow_queries = registry.counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS")
+llm_request_duration = registry.histogram("llm_request_duration_seconds", "OpenAI request latency per attempt", ("operation", "outcome"))
+llm_tokens = registry.counter("llm_tokens_total", "Tokens reported by the OpenAI API", ("kind",))
+llm_retries = registry.counter("llm_retries_total", "Retried OpenAI requests by cause", ("reason",))
+
+
+class RequestTimings:
+    """SQL and LLM work attributed to the current request"""
+
+    __slots__ = ("sql_count", "sql_seconds", "llm_count", "llm_seconds")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.llm_count = 0
+        self.llm_seconds = 0.0
+
+    def server_timing(self, total_seconds: float) -> str:
+        """Value for a ``Server-Timing`` header, in milliseconds"""
+        other = max(0.0, total_seconds - self.sql_seconds - self.llm_seconds)
+        return ", ".join([
+            f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.sql_count} queries"',
+            f'llm;dur={self.llm_seconds * 1000:.1f};desc="{self.llm_count} calls"',
+            f"app;dur={other * 1000:.1f}",
+            f"total;dur={total_seconds * 1000:.1f}",
+        ])
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def start_request() -> RequestTimings:
+    timings = RequestTimings()
+    _current_timings.set(timings)
+    return timings
+
+
+def record_query(seconds: float, slow: bool = False):
+    db_queries.inc()
+    db_query_duration.observe(seconds)
+    if slow:
+        db_slow_queries.inc()
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.sql_count += 1
+        timings.sql_seconds += seconds
+
+
+def record_llm_call(operation: str, seconds: float, outcome: str = "ok", usage=None):
+    llm_request_duration.observe(seconds, operation=operation, outcome=outcome)
+    if usage is not None:
+        llm_tokens.inc(usage.prompt_tokens or 0, kind="prompt")
+        llm_tokens.inc(usage.completion_tokens or 0, kind="completion")
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.llm_count += 1
+        timings.llm_seconds += seconds
+
+
+def record_request(method: str, route: str, status: int, seconds: float, timings: RequestTimings):
+    http_requests.inc(method=method, route=route, status=status)
+    http_request_duration.observe(seconds, method=method, route=route)
+    http_request_db_queries.inc(timings.sql_count, method=method, route=route)
+    http_request_db_seconds.inc(timings.sql_seconds, method=method, route=route)
@@ -0,0 +1,223 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import math
+import re
+
+# Imported on first count, since loading it is slow; False when not installed
+tiktoken = None
+
+# Company research fields split into snippets and ranked against the prospect
+RESEARCH_FIELDS = {
+    "company_bio": "Company bio",
+    "product_info": "Products",
+    "funding_info": "Funding",
+    "key_insights": "Key insights",
+    "description": "Description",
+    "market_position": "Market position",
+}
+
+# Upper bound on a single snippet; longer paragraphs are split by sentence
+MAX_SNIPPET_TOKENS = 80
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or our that the their this to we were will with
+you your they them i me my us not but if so than then there these those into over about
+""".split())
+
+# Static instructions go first so every request shares the same prompt prefix
+# and the provider's prompt caching can reuse it across prospects.
+EMAIL_INSTRUCTIONS = """Generate a personalized version of the base template email for the prospect described below.
+
+The email should:
+1. Reference specific details about the prospect's company and role
+2. Include relevant industry insights
+3. Maintain a professional yet conversational tone
+4. Focus on the value proposition relevant to their position
+5. Include a clear call to action
+
+Format the response as:
+SUBJECT: [personalized subject]
+BODY: [personalized body]"""
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_TERM_RE = re.compile(r"[a-z0-9]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Offline token count; exact with tiktoken installed, approximate otherwise"""
+    if not text:
+        return 0
+    if _load_tiktoken():
+        return len(_encoding(model).encode(text))
+    # Words and punctuation, with a floor of ~4 characters per token
+    return max(len(_WORD_RE.findall(text)), len(text) // 4)
+
+
+_encodings = {}
+
+
+def _load_tiktoken():
+    global tiktoken
+    if tiktoken is None:
+        try:
+            import tiktoken as module
+        except ImportError:  # optional; fall back to an approximate count
+            module = False
+        tiktoken = module
+    return tiktoken
+
+
+def _encoding(model: str):
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
+
+
+def _terms(text: str) -> List[str]:
+    return [term for term in _TERM_RE.findall(text.lower()) if term not in STOPWORDS and len(term) > 1]
+
+
+def split_snippets(text: str, max_tokens: int = MAX_SNIPPET_TOKENS) -> List[str]:
+    """Split research notes into paragraph-sized snippets of at most ``max_tokens``"""
+    snippets = []
+    for paragraph in re.split(r"\n\s*\n|\n(?=\s*[-*•])", text or ""):
+        paragraph = " ".join(paragraph.split()).lstrip("-*• ")
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            snippets.append(paragraph)
+            continue
+        current = ""
+        for sentence in _SENTENCE_RE.split(paragraph):
+            candidate = f"{current} {sentence}".strip()
+            if current and count_tokens(candidate) > max_tokens:
+                snippets.append(current)
+                current = sentence
+            else:
+                current = candidate
+        if current:
+            snippets.append(current)
+    return snippets
+
+
+def rank_snippets(snippets: List[str], query: str, k1: float = 1.2, b: float = 0.75) -> List[Tuple[float, int]]:
+    """
+    BM25 scores of ``snippets`` against ``query``, best first, as
+    (score, index) pairs. Ties keep the original order.
+    """
+    documents = [_terms(snippet) for snippet in snippets]
+    query_terms = set(_terms(query))
+    if not documents:
+        return []
+
+    average_length = sum(len(doc) for doc in documents) / len(documents) or 1
+    document_frequency = Counter(term for doc in documents for term in set(doc))
+    scores = []
+    for index, doc in enumerate(documents):
+        frequencies = Counter(doc)
+        score = 0.0
+        for term in query_terms:
+            tf = frequencies.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / average_length))
+        scores.append((score, index))
+    return sorted(scores, key=lambda item: (-item[0], item[1]))
+
+
+class PromptBuilder:
+    """
+    Builds personalization prompts within an input token budget.
+
+    The fixed parts (instructions, template, prospect) are always included;
+    company research is split into snippets, ranked by lexical relevance to
+    the prospect's position, industry and the template, and packed best-first
+    into whatever budget remains.
+    """
+
+    def __init__(self, token_budget: int = 1500, model: str = "gpt-4"):
+        self.token_budget = token_budget
+        self.model = model
+
+    def build_email_prompt(self, prospect, company, template, system_prompt: str, additional_context: Optional[Dict] = None) -> Tuple[List[Dict], Dict]:
+        """Return (messages, report) for a prospect/company/template triple"""
+        context = {
+            "prospect": {
+                "name": prospect.name,
+                "position": prospect.position,
+                "company": company.name,
+                "industry": company.industry
+            },
+            "company": {field: getattr(company, field) for field in RESEARCH_FIELDS},
+            "template": {
+                "subject": template.subject,
+                "body": template.body
+            }
+        }
+        context["company"].update({"name": company.name, "industry": company.industry})
+        if additional_context:
+            context.update(additional_context)
+
+        template_part = (
+            "Base Template:\n"
+            f"Subject: {context['template']['subject']}\n"
+            f"Body: {context['template']['body']}"
+        )
+        prospect_part = (
+            "Prospect Information:\n"
+            f"- Name: {context['prospect']['name']}\n"
+            f"- Position: {context['prospect']['position']}\n"
+            f"- Company: {context['prospect']['company']}\n"
+            f"- Industry: {context['prospect']['industry']}"
+        )
+        fixed = f"{EMAIL_INSTRUCTIONS}\n\n{template_part}\n\n{prospect_part}\n\nCompany Research:\n"
+        fixed_tokens = count_tokens(system_prompt, self.model) + count_tokens(fixed, self.model)
+
+        candidates, seen = [], set()
+        for field, label in RESEARCH_FIELDS.items():
+            for snippet in split_snippets(context["company"].get(field) or ""):
+                # Research notes are often pasted more than once
+                if snippet.lower() not in seen:
+                    seen.add(snippet.lower())
+                    candidates.append(f"- {label}: {snippet}")
+
+        query = " ".join(filter(None, [
+            context["prospect"]["position"],
+            context["prospect"]["industry"],
+            context["template"]["subject"],
+            context["template"]["body"],
+        ]))
+        remaining = self.token_budget - fixed_tokens
+        packed = []
+        for _, index in rank_snippets(candidates, query):
+            tokens = count_tokens(candidates[index], self.model) + 1
+            if tokens <= remaining:
+                packed.append(index)
+                remaining -= tokens
+
+        # Keep packed snippets in their source order so the research reads naturally
+        research = "\n".join(candidates[index] for index in sorted(packed)) or "- (none)"
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": fixed + research}
+        ]
+
+        prompt_tokens = sum(count_tokens(m["content"], self.model) for m in messages)
+        # What pasting every research field verbatim would have cost
+        full_tokens = fixed_tokens + sum(
+            count_tokens(context["company"].get(field) or "", self.model) for field in RESEARCH_FIELDS
+        )
+        report = {
+            "prompt_tokens": prompt_tokens,
+            "unbudgeted_prompt_tokens": full_tokens,
+            "tokens_saved": max(0, full_tokens - prompt_tokens),
+            "snippets_total": len(candidates),
+            "snippets_used": len(packed),
+            "token_budget": self.token_budget
+        }
+        return messages, report
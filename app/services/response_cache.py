@@ -0,0 +1,250 @@
+"""
+Read-through cache for company and template API responses.
+
+Responses are kept as serialized JSON bytes, keyed by namespace
+("companies", "templates"), the namespace's version and the request path
+and query. Every committed write to a namespace's table through a
+SQLAlchemy session bumps its version, so older entries are never looked up
+again and age out of the LRU. Entries also expire after ``ttl`` seconds,
+which bounds staleness from writes made outside a session.
+
+Version counters live in a backend. By default that is a process-local
+``MemoryBackend``, which is enough for a single worker. With several
+workers, set ``RESPONSE_CACHE_REDIS_URL`` so they share versions (and
+cached bodies) through Redis. Each cached response carries an ``etag`` (a
+hash of its body), so conditional requests can be answered without a query
+or serialization.
+"""
+from collections import OrderedDict
+from itertools import chain
+from typing import Dict, NamedTuple, Optional, Tuple
+import hashlib
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL")
+
+# Cached tables -> namespace
+NAMESPACES = {"companies": "companies", "email_templates": "templates"}
+
+KEY_PREFIX = "response-cache:"
+
+
+class MemoryBackend:
+    """Process-local backend; also a stand-in for Redis when testing several caches against one store"""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                return None
+            if item[1] is not None and item[1] <= time.monotonic():
+                del self._values[key]
+                return None
+            return item[0]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._values[key] = (value, time.monotonic() + ttl)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._values.get(key, (b"0", None))[0]) + 1
+            self._values[key] = (str(value).encode(), None)
+            return value
+
+
+class RedisBackend:
+    """Shared backend on Redis (requires the ``redis`` package)"""
+
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(key)
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    # Response headers to replay, e.g. X-Next-Cursor
+    headers: Dict[str, str]
+    expires_at: float
+
+
+def _pack(entry: CachedResponse) -> bytes:
+    return json.dumps({"etag": entry.etag, "headers": entry.headers}).encode("utf-8") + b"\n" + entry.body
+
+
+def _unpack(data: bytes, expires_at: float) -> CachedResponse:
+    meta, body = data.split(b"\n", 1)
+    meta = json.loads(meta)
+    return CachedResponse(body, meta["etag"], meta["headers"], expires_at)
+
+
+class ResponseCache:
+    """
+    LRU of serialized responses bounded by ``max_bytes``, in front of an
+    optional shared ``backend``. Without one, versions are process-local
+    and bodies are only held in the LRU.
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, ttl: float = RESPONSE_CACHE_TTL, backend=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared = backend is not None
+        self.backend = backend if backend is not None else MemoryBackend()
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def count(self, namespace: str, counter: str):
+        with self._lock:
+            counters = self.counters.setdefault(
+                namespace, dict.fromkeys(("hits", "shared_hits", "misses", "not_modified", "invalidations"), 0)
+            )
+            counters[counter] += 1
+
+    def version(self, namespace: str) -> int:
+        return int(self.backend.get(f"{KEY_PREFIX}version:{namespace}") or 0)
+
+    def invalidate(self, *namespaces: str):
+        """Bump the versions of ``namespaces``, retiring everything cached for them"""
+        for namespace in namespaces:
+            self.backend.incr(f"{KEY_PREFIX}version:{namespace}")
+            self.count(namespace, "invalidations")
+
+    def lookup(self, namespace: str, key: str) -> Tuple[str, Optional[CachedResponse]]:
+        """
+        The cache key for ``key`` under the namespace's current version, and
+        the cached response if there is one. Pass the key to ``store`` so a
+        response built while a write commits is filed under the old version.
+        """
+        versioned = f"{namespace}:{self.version(namespace)}:{key}"
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(versioned)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(versioned)
+                else:
+                    self._discard(versioned)
+                    entry = None
+        if entry is not None:
+            self.count(namespace, "hits")
+            return versioned, entry
+
+        if self.shared:
+            data = self.backend.get(KEY_PREFIX + hashlib.sha256(versioned.encode("utf-8")).hexdigest())
+            if data is not None:
+                # The shared copy's remaining lifetime isn't known; keep it locally for at most ttl
+                entry = _unpack(data, now + self.ttl)
+                self._remember(versioned, entry)
+                self.count(namespace, "shared_hits")
+                return versioned, entry
+
+        self.count(namespace, "misses")
+        return versioned, None
+
+    def store(self, versioned: str, body: bytes, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        entry = CachedResponse(
+            body,
+            '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+            headers or {},
+            time.monotonic() + self.ttl
+        )
+        # A single response bigger than a quarter of the cache would just churn it
+        if len(body) <= self.max_bytes // 4:
+            self._remember(versioned, entry)
+            if self.shared:
+                self.backend.set(KEY_PREFIX + hashlib.sha256(versioned.encode("utf-8")).hexdigest(), _pack(entry), self.ttl)
+        return entry
+
+    def _remember(self, versioned: str, entry: CachedResponse):
+        with self._lock:
+            if versioned in self._entries:
+                self._discard(versioned)
+            self._entries[versioned] = entry
+            self._bytes += len(entry.body)
+            while self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, versioned: str):
+        """Drop an entry; caller holds the lock"""
+        self._bytes -= len(self._entries.pop(versioned).body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            namespaces = {}
+            for namespace, counters in self.counters.items():
+                lookups = counters["hits"] + counters["shared_hits"] + counters["misses"]
+                namespaces[namespace] = {
+                    **counters,
+                    "hit_rate": (counters["hits"] + counters["shared_hits"]) / lookups if lookups else 0.0
+                }
+            return {
+                "backend": type(self.backend).__name__ if self.shared else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "namespaces": namespaces
+            }
+
+
+# Shared cache behind the company and template read endpoints
+response_cache = ResponseCache(backend=RedisBackend(RESPONSE_CACHE_REDIS_URL) if RESPONSE_CACHE_REDIS_URL else None)
+
+# Namespaces written in a session's open transaction, bumped once it commits
+_PENDING = "response_cache_pending"
+
+
+def _mark(session: Session, table_name: Optional[str]):
+    namespace = NAMESPACES.get(table_name)
+    if namespace is not None:
+        session.info.setdefault(_PENDING, set()).add(namespace)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flushed(session, flush_context):
+    for instance in chain(session.new, session.dirty, session.deleted):
+        _mark(session, getattr(instance, "__tablename__", None))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_executed(orm_execute_state):
+    # Bulk and Core INSERT/UPDATE/DELETE run through Session.execute skip the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        _mark(orm_execute_state.session, getattr(table, "name", None))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    # After the commit, so a concurrent read can't cache pre-commit rows under the new version
+    namespaces = session.info.pop(_PENDING, None)
+    if namespaces:
+        response_cache.invalidate(*sorted(namespaces))
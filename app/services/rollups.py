@@ -0,0 +1,148 @@
+from collections import defaultdict
+from typing import Dict, Optional
+from datetime import date, datetime
+import argparse
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.database.database import dialect_insert
+from app.models.models import EmailEngagement, EngagementDailyRollup, EngagementHourlyRollup, Prospect
+from app.services.archive import archived_before
+
+DAILY_COUNTERS = ("sent", "opened", "clicked", "replied", "score_sum")
+HOURLY_COUNTERS = ("sent", "replied")
+
+# Rows per INSERT when rebuilding
+REBUILD_BATCH_SIZE = 5000
+
+
+class RollupDeltas:
+    """
+    Counter increments to apply to the rollup tables in one round trip.
+
+    Events are bucketed by the day/hour the email was *sent*, so an open
+    recorded today for last week's email lands in last week's row.
+    """
+
+    def __init__(self):
+        self.daily = defaultdict(lambda: dict.fromkeys(DAILY_COUNTERS, 0))
+        self.hourly = defaultdict(lambda: dict.fromkeys(HOURLY_COUNTERS, 0))
+
+    def add(self, sent_at: datetime, company_id: Optional[int], template_id: Optional[int], **counts: int):
+        company_id, template_id = company_id or 0, template_id or 0
+        daily = self.daily[(sent_at.date(), company_id, template_id)]
+        for counter in DAILY_COUNTERS:
+            daily[counter] += counts.get(counter, 0)
+        if counts.get("sent") or counts.get("replied"):
+            hourly = self.hourly[(sent_at.date(), sent_at.hour, company_id)]
+            for counter in HOURLY_COUNTERS:
+                hourly[counter] += counts.get(counter, 0)
+
+    def apply(self, db: Session):
+        """Upsert the accumulated increments; the caller commits"""
+        if self.daily:
+            _upsert_increments(db, EngagementDailyRollup, ("day", "company_id", "template_id"), DAILY_COUNTERS, self.daily)
+        if self.hourly:
+            _upsert_increments(db, EngagementHourlyRollup, ("day", "hour", "company_id"), HOURLY_COUNTERS, self.hourly)
+        self.daily.clear()
+        self.hourly.clear()
+
+
+def _upsert_increments(db: Session, model, keys, counters, deltas: Dict):
+    stmt = dialect_insert(db, model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={counter: getattr(model, counter) + getattr(stmt.excluded, counter) for counter in counters}
+    )
+    db.execute(stmt, [{**dict(zip(keys, key)), **values} for key, values in deltas.items()])
+
+
+def _sent_day_and_hour(db: Session):
+    """Dialect-specific (day, hour) expressions for EmailEngagement.sent_at"""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date(EmailEngagement.sent_at), func.extract("hour", EmailEngagement.sent_at)
+    return func.date(EmailEngagement.sent_at), func.strftime("%H", EmailEngagement.sent_at)
+
+
+def _as_date(value) -> date:
+    # SQLite returns date() results as ISO strings
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def rebuild_rollups(db: Session, since: Optional[date] = None) -> Dict:
+    """
+    Regenerate the rollup tables from raw email_engagements, either fully or
+    for days on or after ``since``. Days moved to the engagement archive
+    are never rebuilt: their raw rows are no longer in the table.
+    """
+    archived = archived_before(db)
+    if archived is not None and (since is None or since < archived.date()):
+        since = archived.date()
+
+    day, hour = _sent_day_and_hour(db)
+    company_id = func.coalesce(Prospect.company_id, 0)
+    template_id = func.coalesce(EmailEngagement.template_id, 0)
+
+    def raw(query):
+        query = query.select_from(EmailEngagement).outerjoin(Prospect, Prospect.id == EmailEngagement.prospect_id)
+        if since is not None:
+            query = query.where(EmailEngagement.sent_at >= datetime.combine(since, datetime.min.time()))
+        return query
+
+    for model in (EngagementDailyRollup, EngagementHourlyRollup):
+        stmt = delete(model)
+        if since is not None:
+            stmt = stmt.where(model.day >= since)
+        db.execute(stmt)
+
+    daily = raw(select(
+        day, company_id, template_id,
+        func.count(EmailEngagement.id),
+        func.count(EmailEngagement.opened_at),
+        func.count(EmailEngagement.clicked_at),
+        func.count(EmailEngagement.replied_at),
+        func.coalesce(func.sum(EmailEngagement.engagement_score), 0)
+    )).group_by(day, company_id, template_id)
+    daily_rows = _insert_rows(db, EngagementDailyRollup, ("day", "company_id", "template_id", *DAILY_COUNTERS), db.execute(daily))
+
+    hourly = raw(select(
+        day, hour, company_id,
+        func.count(EmailEngagement.id),
+        func.count(EmailEngagement.replied_at)
+    )).group_by(day, hour, company_id)
+    hourly_rows = _insert_rows(db, EngagementHourlyRollup, ("day", "hour", "company_id", *HOURLY_COUNTERS), db.execute(hourly))
+
+    db.commit()
+    return {"daily_rows": daily_rows, "hourly_rows": hourly_rows}
+
+
+def _insert_rows(db: Session, model, columns, rows) -> int:
+    batch, total = [], 0
+    for row in rows:
+        values = dict(zip(columns, row))
+        values["day"] = _as_date(values["day"])
+        if "hour" in values:
+            values["hour"] = int(values["hour"])
+        batch.append(values)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            db.execute(model.__table__.insert(), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        db.execute(model.__table__.insert(), batch)
+        total += len(batch)
+    return total
+
+
+if __name__ == "__main__":
+    from app.database.database import SessionLocal
+    from app.database.migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Rebuild engagement rollup tables from raw engagements")
+    parser.add_argument("--since", type=date.fromisoformat, help="Only rebuild days on or after this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    run_migrations()
+    with SessionLocal() as db:
+        print(rebuild_rollups(db, args.since))
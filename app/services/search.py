@@ -0,0 +1,208 @@
+"""
+Ranked full-text search over companies and prospects.
+
+Backed by the FTS index from migration ``0002_full_text_search``: FTS5 on
+SQLite, a GIN-indexed ``search_vector`` on Postgres. Queries are reduced
+to word terms, each matched as a prefix and ANDed together; ``column:term``
+restricts a term to one field.
+
+Ranking is bounded: only the newest ``MAX_RANKED_MATCHES`` matches are
+scored, so a term present in most rows costs the same as a selective one.
+Older matches are left out of the results, and ``search`` reports when
+that happened so callers can ask for a narrower query.
+Snippets are built in Python for the returned page only, since FTS5's
+``snippet()`` re-reads the whole match set on every call.
+"""
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import html
+import re
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models.models import Company, Prospect
+
+# Indexed columns per table in index order, with their rank weight class
+SEARCH_COLUMNS = {
+    "companies": {
+        "name": "A", "industry": "A", "key_insights": "B", "product_info": "B", "market_position": "B",
+        "description": "C", "company_bio": "C", "funding_info": "C",
+    },
+    "prospects": {"name": "A", "position": "A", "notes": "C"},
+}
+BM25_WEIGHTS = {"A": 10.0, "B": 4.0, "C": 1.0}
+
+MAX_RANKED_MATCHES = 20000
+MAX_TERMS = 16
+SNIPPET_WORDS = 16
+
+_TOKEN = re.compile(r"(?:(\w+):)?(\S+)")
+_WORD = re.compile(r"\w+")
+
+
+class SearchTerm(NamedTuple):
+    word: str
+    column: Optional[str] = None
+
+
+class SearchPage(NamedTuple):
+    results: List[Dict]
+    truncated: bool
+
+
+def parse_query(q: str, table: str) -> List[SearchTerm]:
+    """
+    Split ``q`` into prefix terms, dropping punctuation and operators so user
+    input can never produce an FTS syntax error. Unknown ``column:``
+    prefixes are searched as ordinary words.
+    """
+    columns = SEARCH_COLUMNS[table]
+    terms = []
+    for column, rest in _TOKEN.findall(q):
+        if column and column.lower() not in columns:
+            terms.extend(SearchTerm(word.lower()) for word in _WORD.findall(column))
+            column = ""
+        terms.extend(SearchTerm(word.lower(), column.lower() or None) for word in _WORD.findall(rest))
+    if not terms:
+        raise ValueError("Search query has no searchable terms")
+    return terms[:MAX_TERMS]
+
+
+def _filter_sql(filters: Dict, alias: str) -> Tuple[str, Dict]:
+    active = {column: value for column, value in filters.items() if value is not None}
+    where = "".join(f" AND {alias}.{column} = :f_{column}" for column in active)
+    return where, {f"f_{column}": value for column, value in active.items()}
+
+
+def _ranked_ids_sqlite(db: Session, table: str, terms, filters: Dict, limit: int, offset: int) -> List[Tuple[int, float, int]]:
+    match = " AND ".join(
+        f'{term.column} : "{term.word}"*' if term.column else f'"{term.word}"*'
+        for term in terms
+    )
+    weights = ", ".join(str(BM25_WEIGHTS[weight]) for weight in SEARCH_COLUMNS[table].values())
+    where, params = _filter_sql(filters, "t")
+    join = f" JOIN {table} t ON t.id = {table}_fts.rowid" if where else ""
+    # bm25() is lower-is-better; negate so scores sort the same way on both backends.
+    # One match past the bound is fetched, only to be counted, so truncation shows up in ``matched``
+    rows = db.execute(
+        text(
+            f"SELECT id, score, matched FROM ("
+            f"SELECT id, score, count(*) OVER () AS matched, row_number() OVER (ORDER BY id DESC) AS recency FROM ("
+            f"SELECT {table}_fts.rowid AS id, -bm25({table}_fts, {weights}) AS score FROM {table}_fts{join} "
+            f"WHERE {table}_fts MATCH :match{where} ORDER BY {table}_fts.rowid DESC LIMIT :candidates + 1"
+            f")) WHERE recency <= :candidates ORDER BY score DESC, id DESC LIMIT :limit OFFSET :offset"
+        ),
+        {"match": match, "candidates": MAX_RANKED_MATCHES, "limit": limit, "offset": offset, **params},
+    )
+    return [tuple(row) for row in rows]
+
+
+def _ranked_ids_postgres(db: Session, table: str, terms, filters: Dict, limit: int, offset: int) -> List[Tuple[int, float, int]]:
+    where, params = _filter_sql(filters, "t")
+    # The GIN index answers the full query; column-scoped terms are rechecked on the matches
+    for i, term in enumerate(terms):
+        if term.column:
+            where += f" AND to_tsvector('english', coalesce(t.{term.column}, '')) @@ to_tsquery('english', :scoped_{i})"
+            params[f"scoped_{i}"] = f"{term.word}:*"
+    # Rank outside the candidate subquery so ts_rank_cd only runs on the candidates;
+    # one match past the bound is fetched, only to be counted, as on SQLite
+    rows = db.execute(
+        text(
+            f"SELECT m.id, ts_rank_cd(m.search_vector, to_tsquery('english', :query)) AS score, candidates.matched FROM ("
+            f"SELECT id, count(*) OVER () AS matched, row_number() OVER (ORDER BY id DESC) AS recency FROM ("
+            f"SELECT t.id FROM {table} t WHERE t.search_vector @@ to_tsquery('english', :query){where} "
+            f"ORDER BY t.id DESC LIMIT :candidates + 1"
+            f") matches) candidates JOIN {table} m ON m.id = candidates.id "
+            f"WHERE candidates.recency <= :candidates "
+            f"ORDER BY score DESC, m.id DESC LIMIT :limit OFFSET :offset"
+        ),
+        {
+            "query": " & ".join(f"{term.word}:*" for term in terms),
+            "candidates": MAX_RANKED_MATCHES,
+            "limit": limit,
+            "offset": offset,
+            **params,
+        },
+    )
+    return [tuple(row) for row in rows]
+
+
+def _highlight(word: str, pattern) -> str:
+    """``word`` HTML-escaped, with the parts matching ``pattern`` wrapped in <b>"""
+    parts, end = [], 0
+    for match in pattern.finditer(word):
+        parts.append(html.escape(word[end:match.start()]))
+        parts.append(f"<b>{html.escape(match.group(0))}</b>")
+        end = match.end()
+    parts.append(html.escape(word[end:]))
+    return "".join(parts)
+
+
+def snippet(row: Dict, table: str, terms: List[SearchTerm]) -> Optional[str]:
+    """
+    A short window of the best-weighted matching field as HTML: stored text
+    is escaped and matched words are wrapped in <b>.
+    """
+    pattern = re.compile(r"\b(?:%s)\w*" % "|".join(re.escape(term.word) for term in terms), re.IGNORECASE)
+    fallback = None
+    for column in sorted(SEARCH_COLUMNS[table], key=lambda column: SEARCH_COLUMNS[table][column]):
+        value = row.get(column)
+        if not value:
+            continue
+        words = str(value).split()
+        hits = [i for i, word in enumerate(words) if pattern.search(word)]
+        if not hits:
+            fallback = fallback or words
+            continue
+        start = max(0, hits[0] - SNIPPET_WORDS // 4)
+        window = words[start:start + SNIPPET_WORDS]
+        highlighted = " ".join(_highlight(word, pattern) for word in window)
+        return ("…" if start else "") + highlighted + ("…" if start + SNIPPET_WORDS < len(words) else "")
+    # Stemmed matches on Postgres may not share a literal prefix with the query
+    if fallback:
+        return html.escape(" ".join(fallback[:SNIPPET_WORDS])) + ("…" if len(fallback) > SNIPPET_WORDS else "")
+    return None
+
+
+def search(db: Session, model, q: str, limit: int = 20, offset: int = 0, **filters) -> SearchPage:
+    """
+    Rows of ``model`` matching ``q``, best first, as dicts of the model's
+    columns plus ``score`` (higher is better) and a highlighted ``snippet``.
+    ``filters`` are equality conditions on the model's columns. ``truncated``
+    is set when more than ``MAX_RANKED_MATCHES`` rows match, so older
+    matches went unranked; it is only known on a non-empty page.
+    """
+    table = model.__tablename__
+    terms = parse_query(q, table)
+    if db.get_bind().dialect.name == "postgresql":
+        ranked = _ranked_ids_postgres(db, table, terms, filters, limit, offset)
+    else:
+        ranked = _ranked_ids_sqlite(db, table, terms, filters, limit, offset)
+    if not ranked:
+        return SearchPage([], False)
+
+    objects = {obj.id: obj for obj in db.query(model).filter(model.id.in_([row_id for row_id, _, _ in ranked]))}
+    results = []
+    for row_id, score, _ in ranked:
+        obj = objects.get(row_id)
+        if obj is None:
+            continue
+        row = {column.key: getattr(obj, column.key) for column in model.__mapper__.column_attrs}
+        row.update(score=round(float(score), 6), snippet=snippet(row, table, terms))
+        results.append(row)
+    return SearchPage(results, ranked[0][2] > MAX_RANKED_MATCHES)
+
+
+def search_companies(db: Session, q: str, limit: int = 20, offset: int = 0, industry: Optional[str] = None) -> SearchPage:
+    return search(db, Company, q, limit, offset, industry=industry)
+
+
+def search_prospects(
+    db: Session,
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    company_id: Optional[int] = None,
+    status: Optional[str] = None
+) -> SearchPage:
+    return search(db, Prospect, q, limit, offset, company_id=company_id, status=status)
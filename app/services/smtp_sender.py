@@ -0,0 +1,356 @@
+"""
+Pooled SMTP sender.
+
+Each account keeps a small pool of authenticated connections that are
+reused across messages, so the TCP/TLS/AUTH handshake is paid once per
+connection rather than once per email. Sends run concurrently up to the
+pool size, throttled per account and per recipient domain. Transient 4xx
+replies and dropped connections are retried with backoff; 5xx replies fail
+the message. Every accepted message is recorded as an ``EmailEngagement``,
+written in batches together with the rollup counters.
+
+Engagement rows are only written after the send, so messages sent here
+can't yet carry tracking pixels or tracked links, which need the
+engagement id.
+"""
+from datetime import datetime
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Iterable, List, NamedTuple, Optional
+import asyncio
+import itertools
+import logging
+import os
+import random
+import smtplib
+import ssl
+
+from sqlalchemy import bindparam, insert, select, update
+
+from app.database.database import SessionLocal, chunked
+from app.models.models import EmailEngagement, Prospect
+from app.services.rate_limiter import TokenBucket
+from app.services.rollups import RollupDeltas
+
+logger = logging.getLogger(__name__)
+
+class SMTPAccount(NamedTuple):
+    host: str
+    port: int = 587
+    username: Optional[str] = None
+    password: Optional[str] = None
+    from_address: Optional[str] = None
+    starttls: bool = True
+    use_ssl: bool = False
+    max_connections: int = 4
+    messages_per_minute: float = 600
+
+
+class OutgoingEmail(NamedTuple):
+    to: str
+    subject: str
+    body: str
+    prospect_id: Optional[int] = None
+    template_id: Optional[int] = None
+
+
+class SendResult(NamedTuple):
+    email: OutgoingEmail
+    status: str  # sent, failed
+    attempts: int
+    code: Optional[int] = None
+    error: Optional[str] = None
+
+
+class TransientSendError(Exception):
+    def __init__(self, code: Optional[int], message: str, reconnect: bool = False):
+        super().__init__(message)
+        self.code = code
+        self.reconnect = reconnect
+
+
+class PermanentSendError(Exception):
+    def __init__(self, code: Optional[int], message: str, reconnect: bool = False):
+        super().__init__(message)
+        self.code = code
+        self.reconnect = reconnect
+
+
+class SMTPConnectionPool:
+    """
+    Up to ``account.max_connections`` reusable connections. Connections are
+    opened lazily and recycled after ``max_messages_per_connection`` sends,
+    since many servers cap messages per session.
+    """
+
+    def __init__(self, account: SMTPAccount, timeout: float = 30.0, max_messages_per_connection: int = 100):
+        self.account = account
+        self.timeout = timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        self.bucket = TokenBucket(account.messages_per_minute, capacity=max(1.0, account.messages_per_minute / 60))
+        self._slots: Optional[asyncio.Queue] = None
+        self.stats = {"connections_opened": 0, "messages": 0}
+
+    @property
+    def slots(self) -> asyncio.Queue:
+        # Created lazily so it binds to the event loop that actually uses it
+        if self._slots is None:
+            self._slots = asyncio.Queue()
+            for _ in range(self.account.max_connections):
+                self._slots.put_nowait(None)
+        return self._slots
+
+    def connect(self) -> smtplib.SMTP:
+        account = self.account
+        if account.use_ssl:
+            connection = smtplib.SMTP_SSL(account.host, account.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            connection = smtplib.SMTP(account.host, account.port, timeout=self.timeout)
+            connection.ehlo()
+            if account.starttls and connection.has_extn("starttls"):
+                connection.starttls(context=ssl.create_default_context())
+                connection.ehlo()
+        if account.username:
+            connection.login(account.username, account.password or "")
+        connection.sent_count = 0
+        self.stats["connections_opened"] += 1
+        return connection
+
+    @staticmethod
+    def discard(connection: Optional[smtplib.SMTP]):
+        if connection is None:
+            return
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    def deliver(self, connection: Optional[smtplib.SMTP], message: EmailMessage) -> smtplib.SMTP:
+        """
+        Blocking send on ``connection`` (opened if None). Returns the
+        connection to reuse; send errors carry it as ``error.connection``.
+        """
+        try:
+            if connection is None or connection.sent_count >= self.max_messages_per_connection:
+                self.discard(connection)
+                connection = None
+                connection = self.connect()
+            connection.send_message(message)
+            connection.sent_count += 1
+            self.stats["messages"] += 1
+            return connection
+        except smtplib.SMTPRecipientsRefused as e:
+            code, reply = next(iter(e.recipients.values()))
+            error = _classify(code, reply)
+        except smtplib.SMTPResponseException as e:
+            error = _classify(e.smtp_code, e.smtp_error)
+        except smtplib.SMTPServerDisconnected as e:
+            error = TransientSendError(None, str(e) or e.__class__.__name__, reconnect=True)
+        except smtplib.SMTPException as e:
+            # Before OSError, its base class. E.g. SMTPNotSupportedError for a
+            # non-ASCII address; the session state is unknown
+            error = PermanentSendError(None, str(e) or e.__class__.__name__, reconnect=True)
+        except OSError as e:
+            error = TransientSendError(None, str(e) or e.__class__.__name__, reconnect=True)
+        except Exception:
+            self.discard(connection)
+            raise
+
+        if error.reconnect:
+            self.discard(connection)
+            connection = None
+        error.connection = connection
+        raise error
+
+    def close(self):
+        if self._slots is None:
+            return
+        while not self._slots.empty():
+            self.discard(self._slots.get_nowait())
+        self._slots = None
+
+
+def _classify(code: int, reply) -> Exception:
+    message = reply.decode("utf-8", "replace") if isinstance(reply, bytes) else str(reply)
+    if 400 <= code < 500:
+        # 421 means the server is closing the session
+        return TransientSendError(code, message, reconnect=code == 421)
+    return PermanentSendError(code, message)
+
+
+class SMTPSender:
+    """
+    Concurrent sender over one or more SMTP accounts.
+
+    ``domain_rate_per_minute`` caps sends to any single recipient domain
+    (``domain_rates`` overrides it per domain) so large providers don't
+    start deferring us. Async methods must be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        accounts: List[SMTPAccount],
+        domain_rate_per_minute: float = 120,
+        domain_rates: Optional[Dict[str, float]] = None,
+        max_retries: int = 3,
+        backoff_base: float = 2.0,
+        backoff_max: float = 120.0,
+        session_factory=SessionLocal,
+        batch_size: int = 500,
+        max_messages_per_connection: int = 100
+    ):
+        if not accounts:
+            raise ValueError("At least one SMTP account is required")
+        self.pools = [SMTPConnectionPool(account, max_messages_per_connection=max_messages_per_connection) for account in accounts]
+        self._next_pool = itertools.cycle(self.pools)
+        self.domain_rate_per_minute = domain_rate_per_minute
+        self.domain_rates = {domain.lower(): rate for domain, rate in (domain_rates or {}).items()}
+        self._domain_buckets: Dict[str, TokenBucket] = {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self._pending: List[Dict] = []
+        self.stats = {"sent": 0, "failed": 0, "retries": 0, "engagements_written": 0}
+
+    def _domain_bucket(self, domain: str) -> TokenBucket:
+        bucket = self._domain_buckets.get(domain)
+        if bucket is None:
+            rate = self.domain_rates.get(domain, self.domain_rate_per_minute)
+            bucket = self._domain_buckets[domain] = TokenBucket(rate, capacity=max(1.0, rate / 60))
+        return bucket
+
+    def _build_message(self, email: OutgoingEmail, account: SMTPAccount) -> EmailMessage:
+        sender = account.from_address or account.username or f"noreply@{account.host}"
+        message = EmailMessage()
+        message["From"] = sender
+        message["To"] = email.to
+        message["Subject"] = email.subject
+        message["Date"] = formatdate(localtime=False, usegmt=True)
+        message["Message-ID"] = make_msgid(domain=sender.rsplit("@", 1)[-1])
+        message.set_content(email.body)
+        return message
+
+    async def send(self, email: OutgoingEmail) -> SendResult:
+        """Send one email, retrying transient failures on the next account in rotation"""
+        domain = email.to.rsplit("@", 1)[-1].lower()
+        error = None
+        for attempt in range(1, self.max_retries + 2):
+            pool = next(self._next_pool)
+            try:
+                message = self._build_message(email, pool.account)
+            except ValueError as e:
+                # Header values with line breaks and the like
+                self.stats["failed"] += 1
+                return SendResult(email, "failed", attempt, None, str(e))
+            await self._domain_bucket(domain).acquire()
+            await pool.bucket.acquire()
+            connection = await pool.slots.get()
+            try:
+                connection = await asyncio.to_thread(pool.deliver, connection, message)
+            except TransientSendError as e:
+                connection = e.connection
+                error = e
+            except PermanentSendError as e:
+                connection = e.connection
+                self.stats["failed"] += 1
+                return SendResult(email, "failed", attempt, e.code, str(e))
+            except BaseException:
+                # deliver already closed the connection; free the slot
+                connection = None
+                raise
+            else:
+                await self._record_sent(email)
+                return SendResult(email, "sent", attempt)
+            finally:
+                pool.slots.put_nowait(connection)
+
+            if attempt <= self.max_retries:
+                self.stats["retries"] += 1
+                await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))))
+
+        self.stats["failed"] += 1
+        logger.warning("Giving up on %s after %d attempts: %s", email.to, self.max_retries + 1, error)
+        return SendResult(email, "failed", self.max_retries + 1, error.code, str(error))
+
+    async def send_many(self, emails: Iterable[OutgoingEmail]) -> AsyncIterator[SendResult]:
+        """Send concurrently, yielding results as they complete; engagements are flushed at the end"""
+        tasks = [asyncio.ensure_future(self.send(email)) for email in emails]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.flush()
+
+    async def _record_sent(self, email: OutgoingEmail):
+        self.stats["sent"] += 1
+        if email.prospect_id is None:
+            return
+        self._pending.append({
+            "prospect_id": email.prospect_id,
+            "template_id": email.template_id,
+            "sent_at": datetime.utcnow(),
+            "engagement_score": 0
+        })
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """Write buffered engagements"""
+        batch, self._pending = self._pending, []
+        if batch:
+            await asyncio.to_thread(self.write_engagements, batch)
+
+    def write_engagements(self, rows: List[Dict]):
+        """Insert engagement rows, bump the rollups and prospects' last_contacted in one transaction"""
+        # Each prospect's own latest send in the batch
+        last_sent = {}
+        for row in rows:
+            last_sent[row["prospect_id"]] = max(row["sent_at"], last_sent.get(row["prospect_id"], row["sent_at"]))
+        with self.session_factory() as db:
+            company_ids = {}
+            for chunk in chunked(list(last_sent)):
+                company_ids.update({
+                    prospect_id: company_id
+                    for prospect_id, company_id in db.execute(
+                        select(Prospect.id, Prospect.company_id).where(Prospect.id.in_(chunk))
+                    )
+                })
+            table = Prospect.__table__
+            db.execute(
+                update(table).where(table.c.id == bindparam("b_id")).values(last_contacted=bindparam("b_sent_at")),
+                [{"b_id": prospect_id, "b_sent_at": sent_at} for prospect_id, sent_at in last_sent.items()]
+            )
+
+            db.execute(insert(EmailEngagement), rows)
+            deltas = RollupDeltas()
+            for row in rows:
+                deltas.add(row["sent_at"], company_ids.get(row["prospect_id"]), row["template_id"], sent=1)
+            deltas.apply(db)
+            db.commit()
+        self.stats["engagements_written"] += len(rows)
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
+
+
+@lru_cache()
+def get_smtp_sender() -> SMTPSender:
+    """Sender for the account configured by the SMTP_* environment variables"""
+    port = int(os.getenv("SMTP_PORT", "587"))
+    account = SMTPAccount(
+        host=os.getenv("SMTP_SERVER", "localhost"),
+        port=port,
+        username=os.getenv("SMTP_USERNAME") or None,
+        password=os.getenv("SMTP_PASSWORD") or None,
+        from_address=os.getenv("SMTP_FROM") or None,
+        use_ssl=port == 465,
+        max_connections=int(os.getenv("SMTP_MAX_CONNECTIONS", "4")),
+        messages_per_minute=float(os.getenv("SMTP_MESSAGES_PER_MINUTE", "600"))
+    )
+    return SMTPSender([account], domain_rate_per_minute=float(os.getenv("SMTP_DOMAIN_RATE_PER_MINUTE", "120")))
@@ -0,0 +1,249 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import bindparam, case, func, select, update
+from sqlalchemy.orm import Session
+
+from app.database.database import SessionLocal, chunked
+from app.models.models import EmailEngagement, Prospect
+from app.services.rollups import RollupDeltas
+
+logger = logging.getLogger(__name__)
+
+# Points added to the engagement (and prospect) score the first time each event happens
+EVENT_POINTS = {"opened": 1, "clicked": 3, "replied": 5}
+
+TRANSPARENT_GIF = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+
+# Shorter keys (and the .env.example placeholder) are refused, so tokens can't be forged
+MIN_SECRET_KEY_LENGTH = 32
+PLACEHOLDER_SECRET_KEY = "your-32-character-secret-key-here"
+
+
+def tracking_enabled() -> bool:
+    """Whether a usable ``SECRET_KEY`` is configured for signing tracking tokens"""
+    key = os.getenv("SECRET_KEY", "")
+    return len(key) >= MIN_SECRET_KEY_LENGTH and key != PLACEHOLDER_SECRET_KEY
+
+
+def _secret() -> bytes:
+    if not tracking_enabled():
+        raise RuntimeError(
+            f"SECRET_KEY must be set to a random value of at least {MIN_SECRET_KEY_LENGTH} characters to sign tracking tokens"
+        )
+    return os.environ["SECRET_KEY"].encode("utf-8")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def sign_tracking_token(engagement_id: int, url: Optional[str] = None) -> str:
+    """Token for tracking pixels (no url) and click redirects (with url)"""
+    payload = _b64encode(json.dumps({"e": engagement_id, "u": url}, separators=(",", ":")).encode("utf-8"))
+    signature = _b64encode(hmac.new(_secret(), payload.encode("ascii"), hashlib.sha256).digest()[:16])
+    return f"{payload}.{signature}"
+
+
+def verify_tracking_token(token: str) -> Optional[Tuple[int, Optional[str]]]:
+    """Return (engagement_id, url) for a valid token, None otherwise (always None without a key)"""
+    if not tracking_enabled():
+        return None
+    try:
+        payload, signature = token.split(".", 1)
+        expected = _b64encode(hmac.new(_secret(), payload.encode("ascii"), hashlib.sha256).digest()[:16])
+        if not hmac.compare_digest(signature, expected):
+            return None
+        data = json.loads(_b64decode(payload))
+        return int(data["e"]), data.get("u")
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def tracking_pixel_url(base_url: str, engagement_id: int) -> str:
+    return f"{base_url.rstrip('/')}/api/t/o/{sign_tracking_token(engagement_id)}.gif"
+
+
+def tracked_link(base_url: str, engagement_id: int, url: str) -> str:
+    return f"{base_url.rstrip('/')}/api/t/c/{sign_tracking_token(engagement_id, url)}"
+
+
+class EngagementTracker:
+    """
+    Buffers open/click/reply events and writes them in batches.
+
+    ``track`` only enqueues, so tracking endpoints return immediately. A
+    single writer thread drains the queue every ``flush_interval`` seconds
+    or ``batch_size`` events, coalesces events per engagement (keeping the
+    first timestamp of each kind) and applies the engagement, prospect score
+    and rollup updates in one transaction. Each event is only recorded if the
+    engagement doesn't have it yet, checked in the UPDATE itself, so repeat
+    opens and trackers in other worker processes can't count it twice.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        batch_size: int = 1000,
+        flush_interval: float = 0.2,
+        max_queue_size: int = 100000
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.stats = {"received": 0, "dropped": 0, "applied": 0, "duplicates": 0, "unknown": 0, "batches": 0}
+
+    def track(self, engagement_id: int, event: str, at: Optional[datetime] = None, response_content: Optional[str] = None):
+        if event not in EVENT_POINTS:
+            raise ValueError(f"Unknown engagement event: {event}")
+        try:
+            self._queue.put_nowait((engagement_id, event, at or datetime.utcnow(), response_content))
+            self.stats["received"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="engagement-tracker", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the writer after flushing everything already queued"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                self.flush(batch)
+            except Exception:
+                logger.exception("Failed to write %d tracking events", len(batch))
+
+    def _collect(self) -> List[Tuple]:
+        """Block for up to ``flush_interval`` collecting at most ``batch_size`` events"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self, events: List[Tuple]):
+        """Coalesce ``events`` and apply them in a single transaction"""
+        coalesced: Dict[int, Dict] = {}
+        for engagement_id, event, at, response_content in events:
+            entry = coalesced.setdefault(engagement_id, {})
+            if event not in entry or at < entry[event]:
+                entry[event] = at
+            # A click means the email was opened, even if the pixel was blocked
+            if event == "clicked" and ("opened" not in entry or at < entry["opened"]):
+                entry["opened"] = at
+            if response_content:
+                entry["response_content"] = response_content
+
+        table = EmailEngagement.__table__
+        with self.session_factory() as db:
+            # engagement id -> (prospect_id, template_id, sent_at, events recorded now)
+            recorded: Dict[int, Tuple] = {}
+            # (event, engagement id) pairs the guarded updates left alone
+            skipped: List[Tuple[str, int]] = []
+            for event, points in EVENT_POINTS.items():
+                first_at = {eid: entry[event] for eid, entry in coalesced.items() if event in entry}
+                column = table.c[f"{event}_at"]
+                for chunk in chunked(list(first_at)):
+                    # The IS NULL guard makes the first writer win when several
+                    # workers flush the same engagement; RETURNING says which rows it was
+                    rows = db.execute(
+                        update(table)
+                        .where(table.c.id.in_(chunk), column.is_(None))
+                        .values({
+                            column: case({eid: first_at[eid] for eid in chunk}, value=table.c.id),
+                            table.c.engagement_score: func.coalesce(table.c.engagement_score, 0) + points,
+                        })
+                        .returning(table.c.id, table.c.prospect_id, table.c.template_id, table.c.sent_at)
+                    ).all()
+                    for engagement_id, prospect_id, template_id, sent_at in rows:
+                        recorded.setdefault(engagement_id, (prospect_id, template_id, sent_at, []))[3].append(event)
+                    updated = {row[0] for row in rows}
+                    skipped.extend((event, eid) for eid in chunk if eid not in updated)
+
+            # Skipped because the event was already recorded, or the engagement doesn't exist
+            known = set()
+            for chunk in chunked(list({eid for _, eid in skipped})):
+                known.update(db.scalars(select(table.c.id).where(table.c.id.in_(chunk))))
+
+            replies = [
+                {"b_id": eid, "b_response_content": entry["response_content"]}
+                for eid, entry in coalesced.items() if "response_content" in entry
+            ]
+            if replies:
+                db.execute(
+                    update(table).where(table.c.id == bindparam("b_id")).values(response_content=bindparam("b_response_content")),
+                    replies
+                )
+
+            prospect_points = {}
+            for prospect_id, _, _, events_now in recorded.values():
+                if prospect_id is not None:
+                    points = sum(EVENT_POINTS[event] for event in events_now)
+                    prospect_points[prospect_id] = prospect_points.get(prospect_id, 0) + points
+            company_ids = {}
+            for chunk in chunked(list(prospect_points)):
+                company_ids.update(db.execute(select(Prospect.id, Prospect.company_id).where(Prospect.id.in_(chunk))).all())
+            if prospect_points:
+                prospects = Prospect.__table__
+                db.execute(
+                    update(prospects)
+                    .where(prospects.c.id == bindparam("b_id"))
+                    .values(engagement_score=func.coalesce(prospects.c.engagement_score, 0) + bindparam("b_points")),
+                    [{"b_id": pid, "b_points": points} for pid, points in prospect_points.items()]
+                )
+
+            deltas = RollupDeltas()
+            for prospect_id, template_id, sent_at, events_now in recorded.values():
+                if sent_at is not None:
+                    deltas.add(
+                        sent_at, company_ids.get(prospect_id), template_id,
+                        score_sum=sum(EVENT_POINTS[event] for event in events_now), **dict.fromkeys(events_now, 1)
+                    )
+            deltas.apply(db)
+            db.commit()
+
+        self.stats["batches"] += 1
+        self.stats["applied"] += sum(len(events_now) for *_, events_now in recorded.values())
+        self.stats["duplicates"] += sum(1 for _, eid in skipped if eid in known)
+        self.stats["unknown"] += len({eid for _, eid in skipped} - known)
+
+
+# Shared tracker started with the application
+engagement_tracker = EngagementTracker()
@@ -0,0 +1,87 @@
+"""
+Engagement archiving benchmark.
+
+Fills a throwaway SQLite database with ``--engagements`` spread over
+``--days`` days, then archives everything older than the retention window
+and reports archive throughput, database size before and after (vacuumed),
+the size of the archive, and archive read time with all columns, with two
+columns and with two columns over one quarter. Prints JSON.
+
+    python -m benchmarks.archive --engagements 2000000 --days 730
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database.database import build_engine
+from app.database.migrations import run_migrations
+from app.models.models import EmailEngagement
+from app.services.archive import archive_engagements, default_cutoff, read_archived_engagements, vacuum
+from benchmarks.datagen import generate
+
+
+def _live_size(session_factory):
+    """Live engagement rows and database file size after a VACUUM"""
+    with session_factory() as db:
+        vacuum(db)
+        return db.execute(select(func.count()).select_from(EmailEngagement)).scalar(), os.path.getsize(db.get_bind().url.database)
+
+
+def _timed_read(session_factory, archive_dir: str, **kwargs) -> dict:
+    with session_factory() as db:
+        started = time.perf_counter()
+        frame = read_archived_engagements(db, archive_dir=archive_dir, **kwargs)
+        return {"rows": len(frame), "seconds": round(time.perf_counter() - started, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive throughput, space saved and archive read latency")
+    parser.add_argument("--engagements", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=730, help="Spread engagements over this many past days")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--format", choices=("parquet", "npz"))
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        run_migrations(engine)
+        generate(engine, companies=1000, prospects=50000, templates=20, engagements=args.engagements, days=args.days, seed=args.seed)
+        session_factory = sessionmaker(bind=engine)
+        archive_dir = os.path.join(tmp, "archive")
+
+        live_rows_before, bytes_before = _live_size(session_factory)
+        with session_factory() as db:
+            archived = archive_engagements(db, archive_dir=archive_dir, batch_size=args.batch_size, format=args.format)
+        live_rows_after, bytes_after = _live_size(session_factory)
+
+        quarter_start = default_cutoff() - timedelta(days=180)
+        reads = {
+            "all_columns": _timed_read(session_factory, archive_dir),
+            "two_columns": _timed_read(session_factory, archive_dir, columns=["sent_at", "replied_at"]),
+            "two_columns_one_quarter": _timed_read(
+                session_factory, archive_dir, columns=["sent_at", "replied_at"],
+                since=quarter_start, until=quarter_start + timedelta(days=91)
+            ),
+        }
+        engine.dispose()
+
+    print(json.dumps({
+        "benchmark": "archive",
+        "engagements": args.engagements,
+        "days": args.days,
+        "archive": archived,
+        "live_rows": {"before": live_rows_before, "after": live_rows_after},
+        "database_bytes": {"before": bytes_before, "after": bytes_after},
+        "reads": reads,
+    }, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+HTTP load test: the async API against a sync baseline revision.
+
+Fills a scratch SQLite database once, then for each implementation starts
+a single uvicorn worker on it and drives a mix of read requests from
+``--concurrency`` concurrent clients for ``--duration`` seconds. Reports
+requests/sec and latency percentiles per implementation and concurrency
+level. ``--baseline`` names a revision from before the async routes.
+
+    python -m benchmarks.async_load --baseline <sync revision> --concurrency 50,500,2000 --duration 15
+    python -m benchmarks.async_load --baseline HEAD~1 --database-url postgresql://...
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.startup import _export_revision
+
+# Weighted request mix: (weight, path factory)
+REQUEST_MIX = (
+    (4, lambda rng, scale: f"/api/prospects/{rng.randint(1, scale['prospects'])}"),
+    (3, lambda rng, scale: f"/api/companies/{rng.randint(1, scale['companies'])}"),
+    (2, lambda rng, scale: f"/api/prospects/?limit=50&status={rng.choice(['new', 'contacted', 'engaged'])}"),
+    (1, lambda rng, scale: f"/api/engagements/metrics/?days={rng.choice([7, 30, 90])}"),
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(source_dir: str, database_url: str, port: int) -> subprocess.Popen:
+    env = {**os.environ, "DATABASE_URL": database_url, "PYTHONPATH": source_dir, "AUTO_MIGRATE": "false"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning",
+         "--backlog", "4096", "--no-access-log"],
+        cwd=source_dir, env=env
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Server did not start")
+
+
+async def _drive(base_url: str, concurrency: int, duration: float, scale: dict, seed: int) -> dict:
+    weights = [weight for weight, _ in REQUEST_MIX]
+    paths = [path for _, path in REQUEST_MIX]
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+
+        async def user(i):
+            nonlocal errors
+            rng = random.Random(seed + i)
+            while time.perf_counter() < deadline:
+                path = rng.choices(paths, weights)[0](rng, scale)
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 1)
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def run(source_dir: str, database_url: str, levels, duration: float, scale: dict, seed: int) -> dict:
+    port = _free_port()
+    server = _start_server(source_dir, database_url, port)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        asyncio.run(_drive(base_url, min(levels), 2, scale, seed))  # warm-up
+        results = {}
+        for concurrency in levels:
+            results[str(concurrency)] = asyncio.run(_drive(base_url, concurrency, duration, scale, seed))
+            print(f"{source_dir} @ {concurrency}: {results[str(concurrency)]}", file=sys.stderr)
+        return results
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the async API with a sync baseline under concurrent load")
+    parser.add_argument("--baseline", required=True, help="Git revision with the sync implementation")
+    parser.add_argument("--concurrency", default="50,500,2000", help="Comma-separated concurrent client counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--database-url", help="Use an existing, migrated and filled database instead of a scratch SQLite one")
+    parser.add_argument("--companies", type=int, default=1000)
+    parser.add_argument("--prospects", type=int, default=50000)
+    parser.add_argument("--engagements", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    scale = {"companies": args.companies, "prospects": args.prospects}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url
+        if database_url is None:
+            from app.database.database import build_engine
+            from app.database.migrations import run_migrations
+            from benchmarks.datagen import generate
+
+            database_url = f"sqlite:///{os.path.join(tmp, 'load.db')}"
+            engine = build_engine(database_url)
+            run_migrations(engine)
+            generate(engine, companies=args.companies, prospects=args.prospects, templates=20,
+                     engagements=args.engagements, seed=args.seed)
+            engine.dispose()
+
+        baseline_dir = os.path.join(tmp, "baseline")
+        os.makedirs(baseline_dir)
+        _export_revision(root, args.baseline, baseline_dir)
+
+        results = {
+            "benchmark": "async_load",
+            "duration_seconds": args.duration,
+            "sync": {"revision": args.baseline, **run(baseline_dir, database_url, levels, args.duration, scale, args.seed)},
+            "async": run(root, database_url, levels, args.duration, scale, args.seed),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
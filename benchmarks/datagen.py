@@ -0,0 +1,179 @@
+"""
+Synthetic data generator for benchmarks.
+
+Fills companies, prospects, email templates and email engagements at a
+configurable scale using batched Core inserts, then rebuilds the
+engagement rollups. Output is deterministic for a given seed.
+
+    python -m benchmarks.datagen --database-url sqlite:///./bench.db --engagements 1000000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.models import Company, EmailEngagement, EmailTemplate, Prospect
+from app.services.rollups import rebuild_rollups
+
+INDUSTRIES = ["Technology", "Finance", "Healthcare", "Retail", "Manufacturing", "Logistics", "Education", "Energy"]
+POSITIONS = ["CTO", "CFO", "VP Engineering", "Head of Sales", "Director of Operations", "CEO", "Product Manager"]
+STATUSES = ["new", "contacted", "engaged", "qualified", "converted"]
+RESEARCH_SENTENCES = [
+    "The company recently expanded into European markets.",
+    "Their platform is SOC2 Type II certified and targets regulated industries.",
+    "Leadership is focused on reducing operational costs this fiscal year.",
+    "They raised a Series B round led by a top-tier venture firm.",
+    "The engineering team migrated to a cloud-native architecture last year.",
+    "Customer retention is a stated priority in recent earnings calls.",
+    "They are hiring aggressively for sales and customer success roles.",
+    "A new self-serve product tier launched last quarter.",
+]
+
+BATCH_SIZE = 10000
+
+
+def _batched_insert(session, model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        session.execute(insert(model), batch)
+
+
+def _research(rng: random.Random, sentences: int) -> str:
+    return " ".join(rng.choice(RESEARCH_SENTENCES) for _ in range(sentences))
+
+
+def generate(
+    engine: Engine,
+    companies: int = 1000,
+    prospects: int = 20000,
+    templates: int = 50,
+    engagements: int = 100000,
+    days: int = 365,
+    seed: int = 42
+) -> dict:
+    """Insert synthetic rows into an empty schema and return timings"""
+    rng = random.Random(seed)
+    Session = sessionmaker(bind=engine)
+    now = datetime.utcnow()
+    timings = {}
+
+    with Session() as session:
+        started = time.perf_counter()
+        _batched_insert(session, Company, (
+            {
+                "id": i,
+                "name": f"Company {i}",
+                "industry": rng.choice(INDUSTRIES),
+                "website": f"https://company{i}.example.com",
+                "description": _research(rng, 2),
+                "company_bio": _research(rng, 6),
+                "product_info": _research(rng, 3),
+                "key_insights": _research(rng, 4),
+                "market_position": rng.choice(["Leader", "Challenger", "Niche player"]),
+                "funding_info": _research(rng, 1),
+            }
+            for i in range(1, companies + 1)
+        ))
+        _batched_insert(session, EmailTemplate, (
+            {
+                "id": i,
+                "name": f"Template {i}",
+                "subject": f"Idea #{i} for your team",
+                "body": "Hi {name},\n\n" + _research(rng, 3) + "\n\nWorth a quick chat?",
+                "company_id": rng.randint(1, companies),
+                "is_active": rng.random() < 0.8,
+            }
+            for i in range(1, templates + 1)
+        ))
+        _batched_insert(session, Prospect, (
+            {
+                "id": i,
+                "name": f"Prospect {i}",
+                "email": f"prospect{i}@company{(i % companies) + 1}.example.com",
+                "position": rng.choice(POSITIONS),
+                "company_id": (i % companies) + 1,
+                "status": rng.choice(STATUSES),
+                "notes": _research(rng, 1) if rng.random() < 0.5 else None,
+                "engagement_score": 0,
+            }
+            for i in range(1, prospects + 1)
+        ))
+        session.commit()
+        timings["entities_seconds"] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+
+        def engagement_rows():
+            for i in range(1, engagements + 1):
+                sent_at = now - timedelta(seconds=rng.randint(0, days * 86400))
+                opened = rng.random() < 0.45
+                clicked = opened and rng.random() < 0.3
+                replied = opened and rng.random() < 0.08
+                yield {
+                    "id": i,
+                    "prospect_id": rng.randint(1, prospects),
+                    "template_id": rng.randint(1, templates),
+                    "sent_at": sent_at,
+                    "opened_at": sent_at + timedelta(hours=rng.randint(1, 48)) if opened else None,
+                    "clicked_at": sent_at + timedelta(hours=rng.randint(1, 72)) if clicked else None,
+                    "replied_at": sent_at + timedelta(hours=rng.randint(2, 96)) if replied else None,
+                    "engagement_score": opened * 1 + clicked * 3 + replied * 5,
+                }
+
+        _batched_insert(session, EmailEngagement, engagement_rows())
+        session.commit()
+        timings["engagements_seconds"] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        rollups = rebuild_rollups(session)
+        timings["rollups_seconds"] = round(time.perf_counter() - started, 3)
+
+    return {
+        "companies": companies,
+        "prospects": prospects,
+        "templates": templates,
+        "engagements": engagements,
+        **rollups,
+        **timings,
+    }
+
+
+def main():
+    from app.database.database import build_engine
+    from app.database.migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Fill a database with synthetic benchmark data")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--companies", type=int, default=1000)
+    parser.add_argument("--prospects", type=int, default=20000)
+    parser.add_argument("--templates", type=int, default=50)
+    parser.add_argument("--engagements", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = build_engine(args.database_url)
+    run_migrations(engine)
+    print(json.dumps(generate(
+        engine,
+        companies=args.companies,
+        prospects=args.prospects,
+        templates=args.templates,
+        engagements=args.engagements,
+        days=args.days,
+        seed=args.seed
+    ), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Company enrichment benchmark against local fake websites.
+
+Starts ``benchmarks.fake_web`` on ``--hosts`` loopback hosts, fills a
+throwaway SQLite database with companies spread over them and runs the
+enricher three times: cold (every page downloaded), again with nothing
+changed (conditional requests answered 304, or bodies matched by hash) and
+after ``--change-rate`` of the companies changed. A sequential run (one
+worker) over ``--sequential-companies`` companies is the baseline. Also
+reports the most concurrent requests any host saw. Prints JSON.
+
+    python -m benchmarks.enrichment --companies 2000 --hosts 16 --workers 32 --latency 0.05
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database.database import build_engine
+from app.database.migrations import run_migrations
+from app.models.models import Company
+from app.services.enrichment import PAGES, CompanyEnricher
+from benchmarks.fake_web import FakeWebConfig, host_address, serve_in_thread
+
+
+def seed(session_factory, companies: int, hosts: int, port: int):
+    with session_factory() as db:
+        db.execute(insert(Company), [
+            {"id": i, "name": f"Company {i}", "website": f"http://{host_address(i % hosts)}:{port}/c/{i}/"}
+            for i in range(1, companies + 1)
+        ])
+        db.commit()
+
+
+def run(session_factory, args, company_ids=None, workers=None) -> dict:
+    enricher = CompanyEnricher(
+        session_factory,
+        workers=workers or args.workers,
+        max_per_host=args.max_per_host,
+        min_interval=args.min_interval,
+        batch_size=200
+    )
+    try:
+        return enricher.run(company_ids)
+    finally:
+        enricher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent, conditional company enrichment throughput")
+    parser.add_argument("--companies", type=int, default=2000)
+    parser.add_argument("--hosts", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--max-per-host", type=int, default=2)
+    parser.add_argument("--min-interval", type=float, default=0.0, help="Seconds between request starts per host")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake server seconds per request")
+    parser.add_argument("--change-rate", type=float, default=0.1)
+    parser.add_argument("--sequential-companies", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    config = FakeWebConfig(args.latency)
+    servers = serve_in_thread(config, args.port, args.hosts)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        run_migrations(engine)
+        session_factory = sessionmaker(bind=engine)
+        seed(session_factory, args.companies, args.hosts, args.port)
+
+        sequential = run(session_factory, args, list(range(1, args.sequential_companies + 1)), workers=1)
+        with engine.begin() as connection:
+            connection.exec_driver_sql("DELETE FROM company_pages")
+
+        cold = run(session_factory, args)
+        unchanged = run(session_factory, args)
+        config.change(range(1, args.companies + 1, max(1, round(1 / args.change_rate))))
+        changed = run(session_factory, args)
+        with session_factory() as db:
+            sample = db.execute(
+                select(Company.company_bio, Company.product_info, Company.funding_info, Company.market_position).limit(1)
+            ).one()
+        engine.dispose()
+
+    for server in servers:
+        server.shutdown()
+    print(json.dumps({
+        "benchmark": "enrichment",
+        "companies": args.companies,
+        "pages_per_company": len(PAGES),
+        "hosts": args.hosts,
+        "workers": args.workers,
+        "latency": args.latency,
+        "sequential": sequential,
+        "cold": cold,
+        "unchanged": unchanged,
+        "changed": changed,
+        "speedup": round(cold["pages_per_sec"] / sequential["pages_per_sec"], 2),
+        "max_in_flight_per_host": max(config.max_in_flight.values(), default=0),
+        "server": config.stats,
+        "sample": dict(sample._mapping),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
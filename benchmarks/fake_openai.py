@@ -0,0 +1,156 @@
+"""
+Local fake of the OpenAI chat completions API for benchmarks and manual testing.
+
+Latency, server error rate and 429 rate are configurable. Streaming
+(``stream=true``) and ``n`` are supported. Completions use the
+SUBJECT:/BODY: format the email service expects.
+
+    python -m benchmarks.fake_openai --port 8765 --latency 0.8 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SAMPLE_COMPLETION = (
+    "SUBJECT: Quick idea for your team\n"
+    "BODY: Hi there,\n\n"
+    "I noticed your team has been investing in growth this year and thought a short note might be useful. "
+    "We help teams like yours cut manual work and ship faster without adding headcount.\n\n"
+    "Would you be open to a 15 minute call next week?\n\n"
+    "Best,\nAlex"
+)
+
+
+class FakeOpenAIConfig:
+    def __init__(
+        self,
+        latency: float = 0.5,
+        jitter: float = 0.2,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        tokens_per_second: float = 200.0,
+        seed: int = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.tokens_per_second = tokens_per_second
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "completions": 0, "errors": 0, "rate_limited": 0}
+
+
+def create_app(config: FakeOpenAIConfig) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        config.stats["requests"] += 1
+
+        roll = config.random.random()
+        if roll < config.rate_limit_rate:
+            config.stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after": str(config.retry_after)}
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            config.stats["errors"] += 1
+            return JSONResponse({"error": {"message": "The server had an error", "type": "server_error"}}, status_code=500)
+
+        await asyncio.sleep(max(0.0, config.latency + config.random.uniform(-config.jitter, config.jitter)))
+        prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+        content = SAMPLE_COMPLETION
+        created = int(time.time())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        config.stats["completions"] += 1
+
+        if body.get("stream"):
+            async def chunks():
+                words = content.split(" ")
+                for i, word in enumerate(words):
+                    delta = word if i == 0 else " " + word
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": body.get("model"),
+                        "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(1 / config.tokens_per_second)
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+
+        n = int(body.get("n") or 1)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": body.get("model"),
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                for i in range(n)
+            ],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4 * n,
+                "total_tokens": len(prompt) // 4 + len(content) // 4 * n
+            }
+        }
+
+    @app.get("/stats")
+    def stats():
+        return config.stats
+
+    return app
+
+
+def serve_in_thread(config: FakeOpenAIConfig, port: int = 8765) -> uvicorn.Server:
+    """Start the fake server on a daemon thread and wait until it accepts requests"""
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completions server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean seconds before responding")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Streaming speed")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        tokens_per_second=args.tokens_per_second,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(config), host="127.0.0.1", port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
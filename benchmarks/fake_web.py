@@ -0,0 +1,188 @@
+"""
+Local stand-in for company websites, for benchmarks and manual testing.
+
+Serves ``/c/{company_id}/`` (home), ``/c/{company_id}/about`` and
+``/c/{company_id}/products`` on ``hosts`` loopback addresses (127.0.0.1,
+127.0.0.2, ...) so a crawler sees that many distinct hosts. Pages carry
+ETag and Last-Modified and answer conditional requests with 304, except
+for every ``no_validators_every``-th company, which always sends the full
+body. Every ``missing_products_every``-th company has no products page.
+``change(ids)`` rewrites those companies' pages. Per-request latency is
+configurable, and the highest number of concurrent requests seen per host
+is recorded.
+
+    python -m benchmarks.fake_web --port 8080 --hosts 8 --latency 0.05
+"""
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List
+import argparse
+import re
+import threading
+import time
+
+PAGE = re.compile(r"^/c/(\d+)/(about|products)?$")
+
+PARAGRAPH = (
+    "Company {id} builds workflow software for mid-market finance teams, "
+    "with {n} customers across North America and Europe (revision {version})."
+)
+
+
+class FakeWebConfig:
+    def __init__(
+        self,
+        latency: float = 0.02,
+        no_validators_every: int = 5,
+        missing_products_every: int = 7,
+        disallow: str = "/private"
+    ):
+        self.latency = latency
+        self.no_validators_every = no_validators_every
+        self.missing_products_every = missing_products_every
+        self.disallow = disallow
+        self.versions: Dict[int, int] = {}
+        self.lock = threading.Lock()
+        self.in_flight: Dict[str, int] = {}
+        self.max_in_flight: Dict[str, int] = {}
+        self.stats = {"requests": 0, "ok": 0, "not_modified": 0, "not_found": 0, "robots": 0, "bytes": 0}
+
+    def change(self, company_ids: Iterable[int]):
+        with self.lock:
+            for company_id in company_ids:
+                self.versions[company_id] = self.versions.get(company_id, 0) + 1
+
+    def count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+
+def render(company_id: int, page: str, version: int) -> str:
+    text = PARAGRAPH.format(id=company_id, n=100 + company_id % 900, version=version)
+    if page == "about":
+        body = (
+            f"<p>{text}</p><p>Founded in {2000 + company_id % 20}, the team of {20 + company_id % 400} "
+            f"works from three offices.</p><p>In {2015 + company_id % 8} the company raised a "
+            f"${5 + company_id % 60}M Series {'ABC'[company_id % 3]} led by Example Ventures.</p>"
+        )
+    elif page == "products":
+        body = (
+            f"<ul><li>Ledger {version}: automated reconciliation for multi-entity accounting.</li>"
+            f"<li>Close Assist: month-end close checklists with audit trails and approvals.</li></ul>"
+        )
+    else:
+        body = f"<section><h1>Company {company_id}</h1><p>{text}</p></section>"
+    return (
+        "<!doctype html><html><head>"
+        f"<title>Company {company_id}</title>"
+        f'<meta name="description" content="Leading provider of finance automation, v{version}">'
+        "<style>body { font-family: sans-serif; }</style><script>window.analytics = {};</script>"
+        "</head><body><nav><a href='/'>Home</a> <a href='about'>About</a></nav>"
+        f"<main>{body}</main><footer>&copy; Company {company_id}</footer></body></html>"
+    )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    config: FakeWebConfig
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b"", headers: Dict[str, str] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+        self.config.count("bytes", len(body))
+
+    def do_GET(self):
+        config = self.config
+        host = self.server.server_address[0]
+        with config.lock:
+            config.stats["requests"] += 1
+            config.in_flight[host] = config.in_flight.get(host, 0) + 1
+            config.max_in_flight[host] = max(config.max_in_flight.get(host, 0), config.in_flight[host])
+        try:
+            time.sleep(config.latency)
+        finally:
+            # Counted until the response is ready: a client may start its next request
+            # as soon as it has read this one, before this thread returns
+            with config.lock:
+                config.in_flight[host] -= 1
+        self._handle()
+
+    def _handle(self):
+        config = self.config
+        if self.path == "/robots.txt":
+            config.count("robots")
+            return self._send(200, f"User-agent: *\nDisallow: {config.disallow}\n".encode(), {"Content-Type": "text/plain"})
+
+        match = PAGE.match(self.path)
+        company_id = int(match.group(1)) if match else 0
+        page = (match.group(2) or "") if match else None
+        if page is None or (page == "products" and company_id % config.missing_products_every == 0):
+            config.count("not_found")
+            return self._send(404, b"Not found", {"Content-Type": "text/plain"})
+
+        version = config.versions.get(company_id, 0)
+        headers = {"Content-Type": "text/html; charset=utf-8"}
+        if company_id % config.no_validators_every != 0:
+            etag = f'"{company_id}-{page or "home"}-{version}"'
+            headers["ETag"] = etag
+            headers["Last-Modified"] = formatdate(1_600_000_000 + version * 86400, usegmt=True)
+            if self.headers.get("If-None-Match") == etag:
+                config.count("not_modified")
+                return self._send(304, headers={"ETag": etag})
+        config.count("ok")
+        self._send(200, render(company_id, page, version).encode("utf-8"), headers)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections are expected
+        pass
+
+
+def host_address(index: int) -> str:
+    """Loopback address of the ``index``-th host"""
+    return f"127.0.0.{index + 1}"
+
+
+def serve_in_thread(config: FakeWebConfig, port: int = 8080, hosts: int = 1) -> List[ThreadingHTTPServer]:
+    """Start one server per host on daemon threads; stop them with ``server.shutdown()``"""
+    handler = type("Handler", (_Handler,), {"config": config})
+    servers = []
+    for index in range(hosts):
+        server = _Server((host_address(index), port), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake company websites")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--hosts", type=int, default=4, help="Serve on 127.0.0.1 .. 127.0.0.N")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per request")
+    args = parser.parse_args()
+
+    config = FakeWebConfig(args.latency)
+    serve_in_thread(config, args.port, args.hosts)
+    print(f"Fake websites on {host_address(0)}..{host_address(args.hosts - 1)}:{args.port}, e.g. http://{host_address(0)}:{args.port}/c/1/")
+    try:
+        while True:
+            time.sleep(10)
+            print(config.stats, "max in flight per host:", max(config.max_in_flight.values(), default=0))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
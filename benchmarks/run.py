@@ -0,0 +1,290 @@
+"""
+Reproducible end-to-end benchmark suite.
+
+Builds a throwaway SQLite database filled by ``benchmarks.datagen``, starts
+``benchmarks.fake_openai`` locally and runs each scenario against the real
+FastAPI app in-process. Results are printed and written as JSON so runs can
+be diffed before and after a change.
+
+    python -m benchmarks.run --scale small
+    python -m benchmarks.run --scale large --scenarios metrics,pagination --output results.json
+
+Scenarios:
+    csv_upload   rows/sec through POST /api/companies/upload-csv
+    metrics      GET /api/engagements/metrics/ latency per days window
+    pagination   GET /api/prospects/ latency by page depth, offset vs cursor
+    search       GET /api/search/* latency for selective, broad and filtered queries
+    scoring      prospect priority recompute (full, unchanged and incremental) and GET /api/prospects/top latency
+    response_cache  company/template read latency uncached, cached and revalidated (304), and hit rates
+    generation   EmailPersonalizationService.generate_batch emails/sec against the fake LLM
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+SCALES = {
+    "small": {"companies": 200, "prospects": 10000, "templates": 20, "engagements": 10000},
+    "medium": {"companies": 2000, "prospects": 100000, "templates": 100, "engagements": 1000000},
+    "large": {"companies": 20000, "prospects": 1000000, "templates": 500, "engagements": 10000000},
+}
+SCENARIOS = ("csv_upload", "metrics", "pagination", "search", "scoring", "response_cache", "generation")
+METRIC_WINDOWS = (1, 7, 30, 90, 365)
+PAGE_SIZE = 100
+# (label, path, params): a rare term, a term in a large share of rows, scoped and filtered
+SEARCH_QUERIES = (
+    ("prospect_selective", "/api/search/prospects", {"q": "prospect 4242"}),
+    ("prospect_broad", "/api/search/prospects", {"q": "cto"}),
+    ("prospect_filtered", "/api/search/prospects", {"q": "series", "status": "new"}),
+    ("company_selective", "/api/search/companies", {"q": "company 123"}),
+    ("company_scoped", "/api/search/companies", {"q": "key_insights:soc2 europe", "industry": "Finance"}),
+)
+
+
+def _latency(samples):
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[max(0, int(len(ordered) * 0.95) - 1)] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def _timed(fn, repeat: int, status: Optional[int] = None):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = fn()
+        samples.append(time.perf_counter() - started)
+        if status is None:
+            response.raise_for_status()
+        elif response.status_code != status:
+            raise RuntimeError(f"Expected {status}, got {response.status_code} for {response.url}")
+    return _latency(samples)
+
+
+def bench_csv_upload(client, rows: int) -> dict:
+    buffer = io.StringIO()
+    buffer.write("name,email,title,company,industry,website,linkedin,company_description\n")
+    for i in range(rows):
+        buffer.write(
+            f"Upload Prospect {i},upload{i}@bench{i % 500}.example.com,CTO,Upload Co {i % 500},Technology,"
+            f"https://bench{i % 500}.example.com,,Benchmark company\n"
+        )
+    payload = buffer.getvalue().encode()
+
+    started = time.perf_counter()
+    response = client.post("/api/companies/upload-csv", files={"file": ("bench.csv", payload, "text/csv")})
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    return {"rows": rows, "seconds": round(elapsed, 3), "rows_per_sec": round(rows / elapsed), **response.json()}
+
+
+def bench_metrics(client, repeat: int) -> dict:
+    return {
+        f"days_{days}": _timed(lambda: client.get("/api/engagements/metrics/", params={"days": days}), repeat)
+        for days in METRIC_WINDOWS
+    }
+
+
+def bench_pagination(client, prospects: int, repeat: int) -> dict:
+    depths = [d for d in (0, 10, 100, 1000, 10000) if d * PAGE_SIZE < prospects]
+    results = {}
+    for depth in depths:
+        skip = depth * PAGE_SIZE
+        offset = _timed(lambda: client.get("/api/prospects/", params={"skip": skip, "limit": PAGE_SIZE}), repeat)
+        # The cursor for a page is the last id of the previous page
+        previous = client.get("/api/prospects/", params={"skip": max(0, skip - PAGE_SIZE), "limit": PAGE_SIZE})
+        cursor = previous.headers.get("X-Next-Cursor") if skip else None
+        params = {"limit": PAGE_SIZE, **({"cursor": cursor} if cursor else {})}
+        keyset = _timed(lambda: client.get("/api/prospects/", params=params), repeat)
+        results[f"page_{depth}"] = {"offset": offset, "cursor": keyset}
+    return results
+
+
+def bench_search(client, repeat: int) -> dict:
+    return {
+        label: _timed(lambda: client.get(path, params={**params, "limit": 20}), repeat)
+        for label, path, params in SEARCH_QUERIES
+    }
+
+
+def bench_scoring(client, session_factory, prospects: int, repeat: int) -> dict:
+    from app.services.scoring import score_prospects
+
+    with session_factory() as db:
+        results = {"full": score_prospects(db), "full_unchanged": score_prospects(db)}
+    # Record engagements for a few prospects so the incremental run has work
+    for prospect_id in range(1, min(prospects, 100) + 1):
+        client.post("/api/engagements/", json={"prospect_id": prospect_id, "template_id": 1}).raise_for_status()
+    with session_factory() as db:
+        results["incremental"] = score_prospects(db, incremental=True)
+    results["top"] = {
+        "global": _timed(lambda: client.get("/api/prospects/top", params={"k": 50}), repeat),
+        "company": _timed(lambda: client.get("/api/prospects/top", params={"k": 50, "company_id": 1}), repeat),
+        "status": _timed(lambda: client.get("/api/prospects/top", params={"k": 50, "status": "new"}), repeat),
+    }
+    return results
+
+
+def bench_response_cache(client, repeat: int) -> dict:
+    from app.services.response_cache import response_cache
+
+    def uncached(path, params):
+        response_cache.clear()
+        return client.get(path, params=params)
+
+    results = {}
+    for label, path, params in (
+        ("companies_1000", "/api/companies/", {"limit": 1000}),
+        ("company", "/api/companies/1", {}),
+        ("templates", "/api/templates/", {}),
+    ):
+        etag = client.get(path, params=params).headers["ETag"]
+        results[label] = {
+            "uncached": _timed(lambda: uncached(path, params), repeat),
+            "cached": _timed(lambda: client.get(path, params=params), repeat),
+            "not_modified": _timed(lambda: client.get(path, params=params, headers={"If-None-Match": etag}), repeat, 304),
+        }
+    results["stats"] = response_cache.stats()
+    return results
+
+
+def bench_generation(session_factory, base_url: str, emails: int, concurrency: int) -> dict:
+    from app.services.email_service import EmailPersonalizationService
+
+    service = EmailPersonalizationService(
+        "sk-bench",
+        base_url=base_url,
+        max_concurrency=concurrency,
+        requests_per_minute=100000,
+        tokens_per_minute=100000000,
+        backoff_base=0.05,
+        backoff_max=1.0,
+        cache=None
+    )
+
+    async def run():
+        results = []
+        with session_factory() as db:
+            async for result in service.generate_batch(db, list(range(1, emails + 1)), 1):
+                results.append(result)
+        return results
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    errors = sum(1 for result in results if "error" in result)
+    return {
+        "emails": emails,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "emails_per_sec": round(len(results) / elapsed, 2),
+        "errors": errors,
+        **service.prompt_stats
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the end-to-end benchmark suite")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=20, help="Requests per latency measurement")
+    parser.add_argument("--csv-rows", type=int, default=20000)
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-error-rate", type=float, default=0.02)
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.05)
+    parser.add_argument("--llm-port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    scale = SCALES[args.scale]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app binds its engine at import time, so point it at the scratch database first
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from fastapi.testclient import TestClient
+
+        from app.database.database import SessionLocal, engine
+        from app.database.migrations import run_migrations
+        from app.main import app
+        from benchmarks.datagen import generate
+        from benchmarks.fake_openai import FakeOpenAIConfig, serve_in_thread
+
+        run_migrations(engine)
+        results = {
+            "benchmark": "suite",
+            "scale": args.scale,
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "started_at": datetime.utcnow().isoformat(),
+            "dataset": generate(engine, seed=args.seed, **scale),
+        }
+
+        with TestClient(app) as client:
+            if "csv_upload" in scenarios:
+                results["csv_upload"] = bench_csv_upload(client, args.csv_rows)
+            if "metrics" in scenarios:
+                results["metrics"] = bench_metrics(client, args.repeat)
+            if "pagination" in scenarios:
+                results["pagination"] = bench_pagination(client, scale["prospects"], args.repeat)
+            if "search" in scenarios:
+                results["search"] = bench_search(client, args.repeat)
+            if "scoring" in scenarios:
+                results["scoring"] = bench_scoring(client, SessionLocal, scale["prospects"], args.repeat)
+            if "response_cache" in scenarios:
+                results["response_cache"] = bench_response_cache(client, args.repeat)
+
+        if "generation" in scenarios:
+            config = FakeOpenAIConfig(
+                latency=args.llm_latency,
+                jitter=args.llm_latency / 2,
+                error_rate=args.llm_error_rate,
+                rate_limit_rate=args.llm_rate_limit_rate,
+                retry_after=0.1,
+                seed=args.seed
+            )
+            server = serve_in_thread(config, args.llm_port)
+            try:
+                results["generation"] = {
+                    **bench_generation(SessionLocal, f"http://127.0.0.1:{args.llm_port}/v1", args.emails, args.concurrency),
+                    "llm": dict(config.stats),
+                }
+            finally:
+                server.should_exit = True
+
+        engine.dispose()
+
+    output = json.dumps(results, indent=2, default=str)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
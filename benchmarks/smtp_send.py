@@ -0,0 +1,119 @@
+"""
+Throughput benchmark for the pooled SMTP sender.
+
+Sends to the local SMTP sink (``benchmarks.smtp_sink``) twice: once with
+pooled, reused connections and once opening a new connection per message,
+which is what a naive sender does. Engagement rows are written to a
+throwaway SQLite database. Prints both rates as JSON.
+
+    python -m benchmarks.smtp_send --messages 2000 --connections 8 --handshake-latency 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database.database import Base, build_engine
+from app.models.models import Company, EmailEngagement, EmailTemplate, Prospect
+from app.services.smtp_sender import OutgoingEmail, SMTPAccount, SMTPSender
+from benchmarks.smtp_sink import SMTPSinkConfig, serve_in_thread
+
+DOMAINS = ("gmail.com", "outlook.com", "yahoo.com", "example.com", "company.test")
+
+
+def seed(session_factory, prospects: int):
+    with session_factory() as db:
+        db.execute(insert(Company), [{"id": 1, "name": "Bench Co"}])
+        db.execute(insert(EmailTemplate), [{"id": 1, "name": "Bench", "subject": "s", "body": "b", "company_id": 1}])
+        db.execute(insert(Prospect), [
+            {"id": i, "name": f"P{i}", "email": f"p{i}@{DOMAINS[i % len(DOMAINS)]}", "company_id": 1, "engagement_score": 0}
+            for i in range(1, prospects + 1)
+        ])
+        db.commit()
+
+
+def run(session_factory, port: int, messages: int, connections: int, max_messages_per_connection: int) -> dict:
+    account = SMTPAccount(
+        host="127.0.0.1",
+        port=port,
+        username="bench",
+        password="bench",
+        from_address="sender@bench.test",
+        starttls=False,
+        max_connections=connections,
+        messages_per_minute=10 ** 9
+    )
+    sender = SMTPSender(
+        [account],
+        domain_rate_per_minute=10 ** 9,
+        backoff_base=0.01,
+        session_factory=session_factory,
+        max_messages_per_connection=max_messages_per_connection
+    )
+    emails = [
+        OutgoingEmail(f"p{i}@{DOMAINS[i % len(DOMAINS)]}", "Quick idea", "Hi there,\n\nWorth a chat?", prospect_id=i, template_id=1)
+        for i in range(1, messages + 1)
+    ]
+
+    async def send_all():
+        return [result async for result in sender.send_many(emails)]
+
+    started = time.perf_counter()
+    results = asyncio.run(send_all())
+    elapsed = time.perf_counter() - started
+    sender.close()
+    return {
+        "messages": messages,
+        "seconds": round(elapsed, 3),
+        "messages_per_sec": round(messages / elapsed, 1),
+        "failed": sum(1 for result in results if result.status != "sent"),
+        **sender.stats,
+        "connections_opened": sender.pools[0].stats["connections_opened"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pooled vs per-message SMTP sending throughput")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--handshake-latency", type=float, default=0.05, help="Simulated connect + TLS + AUTH seconds")
+    parser.add_argument("--command-latency", type=float, default=0.001)
+    parser.add_argument("--defer-rate", type=float, default=0.01, help="Share of recipients deferred with 451")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    config = SMTPSinkConfig(args.handshake_latency, args.command_latency, args.defer_rate, seed=1)
+    sink = serve_in_thread(config, args.port)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        seed(session_factory, args.messages)
+
+        pooled = run(session_factory, args.port, args.messages, args.connections, max_messages_per_connection=100)
+        per_message = run(session_factory, args.port, args.messages, args.connections, max_messages_per_connection=1)
+        with session_factory() as db:
+            engagements = db.scalar(select(func.count()).select_from(EmailEngagement))
+        engine.dispose()
+
+    sink.call_soon_threadsafe(sink.stop)
+    print(json.dumps({
+        "benchmark": "smtp_send",
+        "connections": args.connections,
+        "handshake_latency": args.handshake_latency,
+        "pooled": pooled,
+        "connection_per_message": per_message,
+        "speedup": round(pooled["messages_per_sec"] / per_message["messages_per_sec"], 2),
+        "engagements_written": engagements,
+        "sink": config.stats,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
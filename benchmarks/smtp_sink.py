@@ -0,0 +1,123 @@
+"""
+Local SMTP stand-in for benchmarks and manual testing.
+
+Accepts any AUTH and any message and discards it. Per-session handshake
+latency (standing in for TCP + TLS + AUTH to a real provider), per-command
+latency and a share of 451 deferrals are configurable.
+
+    python -m benchmarks.smtp_sink --port 8025 --handshake-latency 0.1 --defer-rate 0.02
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=8025 ...
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+
+class SMTPSinkConfig:
+    def __init__(
+        self,
+        handshake_latency: float = 0.05,
+        command_latency: float = 0.001,
+        defer_rate: float = 0.0,
+        seed: int = None
+    ):
+        self.handshake_latency = handshake_latency
+        self.command_latency = command_latency
+        self.defer_rate = defer_rate
+        self.random = random.Random(seed)
+        self.stats = {"sessions": 0, "messages": 0, "deferred": 0}
+
+
+async def _session(config: SMTPSinkConfig, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    config.stats["sessions"] += 1
+
+    async def reply(line: str):
+        await asyncio.sleep(config.command_latency)
+        writer.write(line.encode("ascii") + b"\r\n")
+        await writer.drain()
+
+    await asyncio.sleep(config.handshake_latency)
+    await reply("220 sink.local ESMTP ready")
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                await reply("250-sink.local\r\n250-AUTH PLAIN LOGIN\r\n250-PIPELINING\r\n250 8BITMIME")
+            elif verb == "AUTH":
+                if command.upper() == "AUTH LOGIN":
+                    await reply("334 VXNlcm5hbWU6")
+                    await reader.readline()
+                    await reply("334 UGFzc3dvcmQ6")
+                    await reader.readline()
+                await reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                await reply("250 2.1.0 OK")
+            elif verb == "RCPT":
+                if config.random.random() < config.defer_rate:
+                    config.stats["deferred"] += 1
+                    await reply("451 4.7.1 Try again later")
+                else:
+                    await reply("250 2.1.5 OK")
+            elif verb == "DATA":
+                await reply("354 End data with <CR><LF>.<CR><LF>")
+                while (await reader.readline()) not in (b".\r\n", b".\n", b""):
+                    pass
+                config.stats["messages"] += 1
+                await reply("250 2.0.0 Queued")
+            elif verb in ("RSET", "NOOP"):
+                await reply("250 2.0.0 OK")
+            elif verb == "QUIT":
+                await reply("221 2.0.0 Bye")
+                break
+            else:
+                await reply("502 5.5.2 Command not recognized")
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def serve_in_thread(config: SMTPSinkConfig, port: int = 8025) -> asyncio.AbstractEventLoop:
+    """Start the sink on a daemon thread; stop it with ``loop.call_soon_threadsafe(loop.stop)``"""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(asyncio.start_server(lambda r, w: _session(config, r, w), "127.0.0.1", port))
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    return loop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--handshake-latency", type=float, default=0.05, help="Seconds before the greeting")
+    parser.add_argument("--command-latency", type=float, default=0.001)
+    parser.add_argument("--defer-rate", type=float, default=0.0, help="Share of recipients answered with 451")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = SMTPSinkConfig(args.handshake_latency, args.command_latency, args.defer_rate, args.seed)
+    serve_in_thread(config, args.port)
+    print(f"SMTP sink listening on 127.0.0.1:{args.port}")
+    try:
+        while True:
+            time.sleep(10)
+            print(config.stats)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
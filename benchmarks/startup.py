@@ -0,0 +1,104 @@
+"""
+Cold-start benchmark for API workers.
+
+Each sample is a fresh interpreter that imports ``app.main``, runs the
+startup handlers and serves one request in-process, against a scratch
+SQLite database that is already migrated (as in a deployment). Reports
+median timings and which heavy modules the import itself pulled in.
+``--baseline`` runs the same probe against another git revision so the
+before/after numbers come from the same machine.
+
+    python -m benchmarks.startup --samples 10
+    python -m benchmarks.startup --baseline HEAD~1
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+HEAVY_MODULES = ("openai", "httpx", "pandas", "numpy", "tiktoken", "pyarrow")
+
+PROBE = """
+import json, os, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+heavy_modules = [name for name in %r if name in sys.modules]
+from fastapi.testclient import TestClient
+client = TestClient(app.main.app)
+before_startup = time.perf_counter()
+client.__enter__()
+ready = time.perf_counter()
+status = client.get("/api/companies/", params={"limit": 10}).status_code
+served = time.perf_counter()
+client.__exit__(None, None, None)
+print(json.dumps({
+    "import_seconds": imported - started,
+    "startup_seconds": ready - before_startup,
+    "first_request_seconds": served - ready,
+    "status": status,
+    "heavy_modules": heavy_modules,
+}))
+""" % (HEAVY_MODULES,)
+
+
+def _probe(source_dir: str, database_url: str) -> dict:
+    env = {**os.environ, "DATABASE_URL": database_url, "PYTHONPATH": source_dir}
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=source_dir, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(source_dir: str, samples: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+        # Untimed warm-up: migrates the scratch database and compiles bytecode
+        _probe(source_dir, database_url)
+        runs = [_probe(source_dir, database_url) for _ in range(samples)]
+
+    def median_ms(key):
+        return round(statistics.median(run[key] for run in runs) * 1000, 1)
+
+    return {
+        "import_ms": median_ms("import_seconds"),
+        "startup_ms": median_ms("startup_seconds"),
+        "first_request_ms": median_ms("first_request_seconds"),
+        "total_ms": round(statistics.median(
+            run["import_seconds"] + run["startup_seconds"] + run["first_request_seconds"] for run in runs
+        ) * 1000, 1),
+        "heavy_modules": runs[-1]["heavy_modules"],
+        "status": runs[-1]["status"],
+    }
+
+
+def _export_revision(root: str, revision: str, target: str):
+    archive = subprocess.run(["git", "archive", revision, "app"], cwd=root, capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API worker import, startup and first-request latency")
+    parser.add_argument("--samples", type=int, default=10, help="Fresh interpreters per measurement")
+    parser.add_argument("--baseline", help="Git revision to measure as well, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = {"benchmark": "startup", "samples": args.samples, "current": measure(root, args.samples)}
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            _export_revision(root, args.baseline, tmp)
+            results["baseline"] = {"revision": args.baseline, **measure(tmp, args.samples)}
+        results["import_speedup"] = round(results["baseline"]["import_ms"] / results["current"]["import_ms"], 2)
+        results["total_speedup"] = round(results["baseline"]["total_ms"] / results["current"]["total_ms"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Load benchmark for the open/click/reply tracking pipeline.
+
+Producer threads push tracking events at the EngagementTracker as fast as
+they can (with a realistic share of repeat opens) while its writer thread
+batches them into SQLite. Prints sustained enqueue and write rates as JSON.
+
+    python -m benchmarks.tracking_load --engagements 50000 --events 200000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from app.database.database import Base, build_engine
+from app.models.models import Company, EmailEngagement, EmailTemplate, Prospect
+from app.services.tracking import EngagementTracker
+
+
+def seed(session_factory, engagements: int):
+    with session_factory() as db:
+        db.execute(insert(Company), [{"id": 1, "name": "Bench Co"}])
+        db.execute(insert(EmailTemplate), [{"id": 1, "name": "Bench", "subject": "s", "body": "b", "company_id": 1}])
+        db.execute(insert(Prospect), [
+            {"id": i, "name": f"P{i}", "email": f"p{i}@bench.test", "company_id": 1, "engagement_score": 0}
+            for i in range(1, engagements // 4 + 2)
+        ])
+        sent_at = datetime.utcnow() - timedelta(days=1)
+        db.execute(insert(EmailEngagement), [
+            {"id": i, "prospect_id": i // 4 + 1, "template_id": 1, "sent_at": sent_at, "engagement_score": 0}
+            for i in range(1, engagements + 1)
+        ])
+        db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--engagements", type=int, default=50000)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--flush-interval", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        seed(session_factory, args.engagements)
+
+        tracker = EngagementTracker(
+            session_factory=session_factory,
+            batch_size=args.batch_size,
+            flush_interval=args.flush_interval,
+            max_queue_size=args.events
+        )
+        tracker.start()
+
+        per_producer = args.events // args.producers
+
+        def produce(seed_value: int):
+            rng = random.Random(seed_value)
+            for _ in range(per_producer):
+                event = rng.choices(("opened", "clicked", "replied"), weights=(80, 15, 5))[0]
+                tracker.track(rng.randint(1, args.engagements), event)
+
+        started = time.perf_counter()
+        producers = [threading.Thread(target=produce, args=(i,)) for i in range(args.producers)]
+        for thread in producers:
+            thread.start()
+        for thread in producers:
+            thread.join()
+        enqueued = time.perf_counter() - started
+
+        tracker.stop(timeout=600)
+        drained = time.perf_counter() - started
+        engine.dispose()
+
+    events = per_producer * args.producers
+    print(json.dumps({
+        "benchmark": "tracking_load",
+        "engagements": args.engagements,
+        "events": events,
+        "enqueue_events_per_sec": round(events / enqueued),
+        "sustained_events_per_sec": round(events / drained),
+        "seconds": round(drained, 3),
+        **tracker.stats
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -63,7 +63,11 @@ export const endpoints = {
 
     // Email Engagement
     getEngagementMetrics: (days: number) => api.get(`/engagements/metrics/?days=${days}`),
-    getProspectEngagement: (id: number) => api.get(`/prospects/${id}/engagement/`),
+    getProspectEngagement: (id: number, cursor?: string) =>
+        api.get(`/prospects/${id}/engagement/`, { params: cursor ? { cursor } : undefined }),
+    // One request for a whole table page instead of one per row
+    getProspectsEngagement: (ids: number[], trendLimit = 10) =>
+        api.get(`/prospects/engagement/?${ids.map((id) => `ids=${id}`).join('&')}&trend_limit=${trendLimit}`),
     createEngagement: (data: any) => api.post('/engagements/', data),
     updateEngagement: (id: number, data: any) => api.put(`/engagements/${id}`, data),
 };
@@ -0,0 +1,79 @@
+import asyncio
+import multiprocessing
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from app.database.database import build_engine
+from app.database.migrations import run_migrations
+from app.models.models import Campaign, CampaignTask, Company, EmailTemplate, Prospect
+from app.services.campaigns import CampaignQueue, CampaignWorker, create_campaign
+
+LEASE_SECONDS = 0.5
+
+
+class HangingService:
+    """Stands in for the email service; never finishes a batch"""
+
+    async def generate_batch(self, db, prospect_ids, template_id, additional_context=None):
+        await asyncio.Event().wait()
+        yield
+
+
+def _run_hanging_worker(url: str, worker_id: str):
+    session_factory = sessionmaker(bind=build_engine(url))
+    worker = CampaignWorker(
+        HangingService(),
+        queue=CampaignQueue(session_factory, lease_seconds=LEASE_SECONDS),
+        session_factory=session_factory,
+        worker_id=worker_id,
+        poll_interval=0.05
+    )
+    asyncio.run(worker.run(asyncio.Event()))
+
+
+def _wait_for(condition, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_task_fails_after_its_workers_die_max_attempts_times(tmp_path):
+    url = f"sqlite:///{tmp_path / 'campaigns.db'}"
+    engine = build_engine(url)
+    run_migrations(engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as db:
+        company = Company(name="Acme")
+        db.add(company)
+        db.flush()
+        prospect = Prospect(name="Ada", email="ada@acme.example", company_id=company.id)
+        template = EmailTemplate(name="Intro", subject="Hi", body="Hello", company_id=company.id)
+        db.add_all([prospect, template])
+        db.commit()
+        campaign_id = create_campaign(db, "Launch", template.id, [prospect.id], max_attempts=2).id
+
+    def task():
+        with session_factory() as db:
+            return db.query(CampaignTask).filter(CampaignTask.campaign_id == campaign_id).one()
+
+    context = multiprocessing.get_context("spawn")
+    for attempt in (1, 2):
+        worker_id = f"doomed-{attempt}"
+        process = context.Process(target=_run_hanging_worker, args=(url, worker_id))
+        process.start()
+        try:
+            _wait_for(lambda: task().lease_owner == worker_id)
+        finally:
+            process.kill()
+            process.join()
+        assert task().attempts == attempt
+        time.sleep(LEASE_SECONDS)
+
+    queue = CampaignQueue(session_factory, lease_seconds=LEASE_SECONDS)
+    assert queue.claim("survivor", 10) == []
+    failed = task()
+    assert (failed.status, failed.error, failed.attempts) == ("failed", "lease expired", 2)
+    with session_factory() as db:
+        assert db.get(Campaign, campaign_id).status == "completed"
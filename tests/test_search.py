@@ -0,0 +1,47 @@
+from sqlalchemy.orm import sessionmaker
+
+from app.database.database import build_engine
+from app.database.migrations import run_migrations
+from app.models.models import Company, Prospect
+from app.services import search as search_module
+from app.services.search import SearchTerm, search_prospects, snippet
+
+
+def test_snippet_escapes_stored_html():
+    row = {"name": "Acme", "key_insights": "<img src=x onerror=alert(1)> acme rocket"}
+    result = snippet(row, "companies", [SearchTerm("rocket")])
+    assert result == "&lt;img src=x onerror=alert(1)&gt; acme <b>rocket</b>"
+
+
+def test_snippet_escapes_inside_highlighted_words():
+    row = {"notes": "ships <script>rocket</script> parts"}
+    result = snippet(row, "prospects", [SearchTerm("rocket")])
+    assert "<script>" not in result
+    assert result == "ships &lt;script&gt;<b>rocket</b>&lt;/script&gt; parts"
+
+
+def test_snippet_escapes_fallback_text():
+    row = {"notes": "<b onclick=x>launch</b>"}
+    assert snippet(row, "prospects", [SearchTerm("rocket")]) == "&lt;b onclick=x&gt;launch&lt;/b&gt;"
+
+
+def test_search_reports_matches_beyond_the_ranked_bound(tmp_path, monkeypatch):
+    engine = build_engine(f"sqlite:///{tmp_path / 'search.db'}")
+    run_migrations(engine)
+    with sessionmaker(bind=engine)() as db:
+        company = Company(name="Acme")
+        db.add(company)
+        db.flush()
+        db.add_all([
+            Prospect(name=f"Rocket {i}", email=f"{i}@acme.example", company_id=company.id)
+            for i in range(5)
+        ])
+        db.commit()
+
+        monkeypatch.setattr(search_module, "MAX_RANKED_MATCHES", 5)
+        assert search_prospects(db, "rocket").truncated is False
+
+        monkeypatch.setattr(search_module, "MAX_RANKED_MATCHES", 3)
+        results, truncated = search_prospects(db, "rocket")
+        assert truncated is True
+        assert sorted(row["name"] for row in results) == ["Rocket 2", "Rocket 3", "Rocket 4"]